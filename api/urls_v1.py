@@ -11,7 +11,7 @@ from patient.views import PatientViewSet, PhoneViewSet, PersonalDataViewSet, Nex
     PatientIdentifierViewSet
 
 from patient_tracker.views import AdmissionViewSet, HealthSnapshotViewSet,  \
-    DischargeViewSet, DeceasedViewSet, \
+    DischargeViewSet, DeceasedViewSet, ExportView, \
     OverallWellbeingViewSet, CommonSymptomsViewSet, GradedSymptomsViewSet, RelatedConditionsViewSet
 
 from workflow.views import WorkflowViewSet
@@ -64,6 +64,7 @@ urlpatterns = router.urls + [
     re_path(r'token/refresh/$', TokenRefreshView.as_view(), name='token_refresh'),
 
     re_path(r'dashboard/$', DashboardView.as_view(), name='dashboard'),
+    re_path(r'export/(?P<name>[a-z-]+)/$', ExportView.as_view(), name='export'),
 
     # Swagger related urls
     re_path(r'swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -0,0 +1,116 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """Pages of records walked from the most recent one, keyed on `(created, id)`.
+
+    The `cursor` query parameter selects this mode, empty for the first page. Each page is read
+    from the `(created, id)` index right after the last record of the previous page, so that any
+    page costs the same as the first one, and no count is made. The response carries the link to
+    the `next` page, null on the last one, and the `results`.
+
+    Without a cursor, the `limit` and `offset` query parameters page as `LimitOffsetPagination`
+    does, or the whole list is returned. Viewsets listing large tables use
+    `KeysetByDefaultPagination` instead, where keyset pages are the default.
+    """
+    cursor_query_param = 'cursor'
+    keyset_by_default = False
+    keyset_page_size = 100
+    max_keyset_page_size = 1000
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def use_keyset(self, request):
+        params = request.query_params
+        if self.cursor_query_param in params:
+            return True
+        return self.keyset_by_default and self.offset_query_param not in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_keyset_page_size(request)
+
+        queryset = queryset.order_by('-created', '-id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            created, pk = position
+            # The redundant bound on `created` alone is what the index scan starts from: the OR
+            # condition is only checked on the rows it reads
+            queryset = queryset.filter(Q(created__lt=created) | Q(created=created, id__lt=pk), created__lte=created)
+
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_keyset_page_size(self, request):
+        try:
+            size = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.keyset_page_size
+        return min(max(size, 1), self.max_keyset_page_size)
+
+    def encode_cursor(self, instance):
+        position = f'{instance.created.isoformat()}|{instance.pk}'
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            created, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created = parse_datetime(created)
+            pk = uuid.UUID(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created, pk
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class KeysetByDefaultPagination(KeysetPagination):
+    """Keyset pages unless `offset` is given"""
+    keyset_by_default = True
@@ -0,0 +1,35 @@
+"""Parsing of the query parameters of API requests, raising a 400 response on invalid values"""
+import uuid
+
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+
+def parse_param(request, name, parse, message):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise serializers.ValidationError({name: message})
+    return parsed
+
+
+def get_date_param(request, name):
+    return parse_param(request, name, parse_date, 'Expected a date formatted as YYYY-MM-DD')
+
+
+def get_datetime_param(request, name):
+    return parse_param(request, name, parse_datetime, 'Expected a date and time formatted as ISO 8601')
+
+
+def get_uuid_param(request, name):
+    return parse_param(request, name, uuid.UUID, 'Expected an id')
+
+
+def get_choice_param(request, name, choices):
+    """Value of `name` among the values of a `TextChoices` class"""
+    return parse_param(request, name, choices, f'Expected one of {", ".join(choices.values)}')
@@ -1,2 +1,9 @@
 from django.apps import AppConfig
 
+
+class DashboardConfig(AppConfig):
+    name = 'dashboard'
+
+    def ready(self):
+        from dashboard.signals import connect_signals
+        connect_signals()
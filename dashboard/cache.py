@@ -0,0 +1,75 @@
+"""Dashboard response cache, invalidated by a global hospital state version.
+
+Every write that changes what the dashboard shows (bed types, beds, assignments, admissions,
+snapshots, discharges, deceased records) bumps the version, see `dashboard.signals`. Cached
+dashboards are keyed by the version, so a bump makes all of them stale at once without having
+to know which keys exist.
+
+The cache backend is the `default` Django cache: local memory for tests and development,
+a shared backend (`CACHE_URL`) when several processes must agree on the version. With local
+memory, a write made by another process does not bump the version seen here, so the
+dashboards are only cached for `DASHBOARD_CACHE_TIMEOUT`, a few seconds by default.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'dashboard:state-version'
+
+
+def get_state_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # The version may have been evicted: restart from the clock so that it never
+        # goes back to a value some cached dashboard was computed for.
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_state_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Missing key, start a new version sequence
+        get_state_version()
+        return cache.incr(VERSION_KEY)
+
+
+def get_or_compute(name, compute):
+    """Return the cached value of `name` for the current state version, computing it at most once.
+
+    Concurrent misses are single-flighted: the caller that wins the lock computes the value,
+    the others serve the value of the previous version if there is one, or wait for the winner.
+    """
+    version = get_state_version()
+    key = f'dashboard:{version}:{name}'
+    latest_key = f'dashboard:latest:{name}'
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, settings.DASHBOARD_CACHE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set_many({key: value, latest_key: value}, settings.DASHBOARD_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    previous = cache.get(latest_key)
+    if previous is not None:
+        return previous
+
+    deadline = time.monotonic() + settings.DASHBOARD_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    # The winner took too long or died, do not keep the request waiting any longer
+    return compute()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.cache import bump_state_version
+from dashboard.models import ActivityRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly and daily admission / discharge rollups from history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report the daily admission counts that drifted, exit with an error if any did')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = ActivityRollup.objects.verify()
+            for day, severity, stored, expected in mismatches:
+                self.stdout.write(f'{day} {severity}: {stored} admissions rolled up, records say {expected}')
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} daily admission count(s) out of sync')
+            self.stdout.write(self.style.SUCCESS('Rollups are in sync'))
+            return
+
+        nb_rows = ActivityRollup.objects.rebuild()
+        bump_state_version()
+        self.stdout.write(self.style.SUCCESS(f'{nb_rows} rollup rows rebuilt'))
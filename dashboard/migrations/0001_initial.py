@@ -0,0 +1,104 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:22
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone as tz
+
+GRANULARITIES = ['hour', 'day']
+
+
+def period_start(at, granularity):
+    at = tz.localtime(at)
+    if granularity == 'day':
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def populate_rollups(apps, schema_editor):
+    """Same rows as `ActivityRollup.objects.rebuild` (`backfill_rollups`) computes"""
+    Admission = apps.get_model('patient_tracker', 'Admission')
+    BedAssignment = apps.get_model('patient_tracker', 'BedAssignment')
+    Discharge = apps.get_model('patient_tracker', 'Discharge')
+    HealthSnapshot = apps.get_model('patient_tracker', 'HealthSnapshot')
+    ActivityRollup = apps.get_model('dashboard', 'ActivityRollup')
+
+    rows = {}
+
+    def add(at, severity, bed_type_id, admissions=0, discharges=0, stay=None):
+        for granularity in GRANULARITIES:
+            key = (granularity, period_start(at, granularity), severity or '', bed_type_id)
+            row = rows.setdefault(key, [0, 0, 0, datetime.timedelta(0)])
+            row[0] += admissions
+            row[1] += discharges
+            if stay is not None:
+                row[2] += 1
+                row[3] += stay
+
+    snapshots = HealthSnapshot.objects.filter(is_removed=False)
+    first_severity = snapshots.filter(admission=OuterRef('pk')).order_by('created').values('severity')[:1]
+    admissions = Admission.objects.filter(admitted_at__isnull=False).annotate(severity=Subquery(first_severity)) \
+        .filter(severity__isnull=False).values_list('admitted_at', 'severity')
+    for admitted_at, severity in admissions.iterator():
+        add(admitted_at, severity, None, admissions=1)
+
+    severity_at_discharge = snapshots \
+        .filter(admission=OuterRef('admission'), created__lte=OuterRef('discharged_at')) \
+        .order_by('-created').values('severity')[:1]
+    bed_type_at_discharge = BedAssignment.objects \
+        .filter(admission=OuterRef('admission'), assigned_at__lte=OuterRef('discharged_at')) \
+        .order_by('-assigned_at').values('bed__bed_type')[:1]
+    discharges = Discharge.objects.filter(is_removed=False).annotate(
+        severity=Subquery(severity_at_discharge),
+        bed_type_id=Subquery(bed_type_at_discharge),
+    ).values_list('discharged_at', 'severity', 'bed_type_id', 'admission__admitted_at')
+    for discharged_at, severity, bed_type_id, admitted_at in discharges.iterator():
+        stay = discharged_at - admitted_at if admitted_at and discharged_at else None
+        add(discharged_at, severity, bed_type_id, discharges=1, stay=stay)
+
+    ActivityRollup.objects.bulk_create([
+        ActivityRollup(granularity=granularity, period=period, severity=severity, bed_type_id=bed_type_id,
+                       admissions=admissions, discharges=discharges, stays=stays, stay_total=stay_total)
+        for (granularity, period, severity, bed_type_id), (admissions, discharges, stays, stay_total)
+        in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('equipment', '0003_bedoccupancy'),
+        ('patient_tracker', '0002_admission_snapshot_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period', models.DateTimeField()),
+                ('severity', models.CharField(blank=True, default='', max_length=6)),
+                ('admissions', models.PositiveIntegerField(default=0)),
+                ('discharges', models.PositiveIntegerField(default=0)),
+                ('stays', models.PositiveIntegerField(default=0)),
+                ('stay_total', models.DurationField(default=datetime.timedelta(0))),
+                ('bed_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='equipment.bedtype')),
+            ],
+            options={
+                'ordering': ['granularity', 'period'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activityrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('bed_type__isnull', False)), fields=('granularity', 'period', 'severity', 'bed_type'), name='unique_rollup_with_bed_type'),
+        ),
+        migrations.AddConstraint(
+            model_name='activityrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('bed_type__isnull', True)), fields=('granularity', 'period', 'severity'), name='unique_rollup_without_bed_type'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
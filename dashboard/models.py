@@ -1,4 +1,177 @@
-from django.db import models
+from datetime import timedelta
 
-# Create your models here.
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone as tz
 
+from equipment.models import BedType
+
+
+class ActivityRollup(models.Model):
+    """Admissions, discharges and length of stay aggregated per hour and per day.
+
+    There is one row per period, severity and bed type. Admissions are counted in the period of
+    `admitted_at` with the severity of their first health snapshot (no bed type). Discharges are
+    counted in the period of `discharged_at` with the latest severity and the bed type that was
+    released. `stay_total` sums the length of stay of the `stays` discharges where it is known.
+
+    The rows are maintained incrementally by `dashboard.signals` and can be rebuilt from history
+    with the `backfill_rollups` command. Only these write paths update them:
+
+      `Admission.save` -- a change of `admitted_at` (`post_save`)
+      `HealthSnapshot.save` -- the first snapshot of an admission (`post_save`)
+      `HealthSnapshot.objects.bulk_record` -- the `health_snapshots_created` signal
+      `Discharge.save` -- a new discharge (`post_save`)
+
+    Any other write of these records (queryset `update()`, `bulk_create`, raw SQL) must send
+    one of these signals or be followed by `backfill_rollups`, or the rollups drift.
+    """
+
+    class GranularityChoices(models.TextChoices):
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+
+    class ActivityRollupManager(models.Manager):
+
+        def add(self, at, severity=None, bed_type_id=None, admissions=0, discharges=0, stay=None):
+            """Add the given amounts to the hourly and daily rows `at` falls in"""
+            for granularity in ActivityRollup.GranularityChoices.values:
+                lookup = {
+                    'granularity': granularity,
+                    'period': period_start(at, granularity),
+                    'severity': severity or '',
+                    'bed_type_id': bed_type_id,
+                }
+                changes = {
+                    'admissions': F('admissions') + admissions,
+                    'discharges': F('discharges') + discharges,
+                    'stays': F('stays') + (1 if stay is not None else 0),
+                    'stay_total': F('stay_total') + (stay or timedelta(0)),
+                }
+                if not self.filter(**lookup).update(**changes):
+                    self.bulk_create([ActivityRollup(**lookup)], ignore_conflicts=True)
+                    self.filter(**lookup).update(**changes)
+
+        def between(self, granularity, start=None, end=None):
+            """Rows of a granularity whose period starts in [start, end)"""
+            qs = self.filter(granularity=granularity)
+            if start:
+                qs = qs.filter(period__gte=start)
+            if end:
+                qs = qs.filter(period__lt=end)
+            return qs
+
+        def totals(self, start=None, end=None):
+            return self.between(ActivityRollup.GranularityChoices.DAY, start, end).aggregate(
+                admissions=Sum('admissions'),
+                discharges=Sum('discharges'),
+                stays=Sum('stays'),
+                stay_total=Sum('stay_total'),
+            )
+
+        def verify(self):
+            """Return the daily admission counts that differ from the admissions, as (day, severity, stored,
+            expected). Checked against `Admission.objects.admissions_per_day`, which reads the raw records.
+            """
+            from patient_tracker.models import Admission
+
+            expected = {
+                (per_day['date'], count['label']): count['value']
+                for per_day in Admission.objects.admissions_per_day() for count in per_day['count']
+            }
+            stored = {}
+            rows = self.between(ActivityRollup.GranularityChoices.DAY).exclude(severity='') \
+                .values_list('period', 'severity', 'admissions')
+            for period, severity, admissions in rows:
+                key = (tz.localtime(period).date(), severity)
+                stored[key] = stored.get(key, 0) + admissions
+            return sorted(
+                (day, severity, stored.get((day, severity), 0), expected.get((day, severity), 0))
+                for day, severity in set(expected) | set(stored)
+                if stored.get((day, severity), 0) != expected.get((day, severity), 0)
+            )
+
+        @transaction.atomic
+        def rebuild(self):
+            """Recompute every row from the admissions and discharges"""
+            from patient_tracker.models import Admission, BedAssignment, Discharge, HealthSnapshot
+
+            rows = {}
+
+            def add(at, severity, bed_type_id, admissions=0, discharges=0, stay=None):
+                for granularity in ActivityRollup.GranularityChoices.values:
+                    key = (granularity, period_start(at, granularity), severity or '', bed_type_id)
+                    row = rows.setdefault(key, [0, 0, 0, timedelta(0)])
+                    row[0] += admissions
+                    row[1] += discharges
+                    if stay is not None:
+                        row[2] += 1
+                        row[3] += stay
+
+            first_severity = HealthSnapshot.objects.filter(admission=OuterRef('pk')) \
+                .order_by('created').values('severity')[:1]
+            admissions = Admission.objects.accepted().annotate(severity=Subquery(first_severity)) \
+                .filter(severity__isnull=False).values_list('admitted_at', 'severity')
+            for admitted_at, severity in admissions.iterator():
+                add(admitted_at, severity, None, admissions=1)
+
+            severity_at_discharge = HealthSnapshot.objects \
+                .filter(admission=OuterRef('admission'), created__lte=OuterRef('discharged_at')) \
+                .order_by('-created').values('severity')[:1]
+            bed_type_at_discharge = BedAssignment.objects \
+                .filter(admission=OuterRef('admission'), assigned_at__lte=OuterRef('discharged_at')) \
+                .order_by('-assigned_at').values('bed__bed_type')[:1]
+            discharges = Discharge.objects.annotate(
+                severity=Subquery(severity_at_discharge),
+                bed_type_id=Subquery(bed_type_at_discharge),
+            ).values_list('discharged_at', 'severity', 'bed_type_id', 'admission__admitted_at')
+            for discharged_at, severity, bed_type_id, admitted_at in discharges.iterator():
+                add(discharged_at, severity, bed_type_id, discharges=1,
+                    stay=length_of_stay(admitted_at, discharged_at))
+
+            self.all().delete()
+            self.bulk_create([
+                ActivityRollup(granularity=granularity, period=period, severity=severity, bed_type_id=bed_type_id,
+                               admissions=admissions, discharges=discharges, stays=stays, stay_total=stay_total)
+                for (granularity, period, severity, bed_type_id), (admissions, discharges, stays, stay_total)
+                in rows.items()
+            ], batch_size=1000)
+            return len(rows)
+
+    objects = ActivityRollupManager()
+
+    granularity = models.CharField(max_length=4, choices=GranularityChoices.choices)
+    period = models.DateTimeField()
+    severity = models.CharField(max_length=6, blank=True, default='')
+    bed_type = models.ForeignKey(BedType, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    admissions = models.PositiveIntegerField(default=0)
+    discharges = models.PositiveIntegerField(default=0)
+    stays = models.PositiveIntegerField(default=0)
+    stay_total = models.DurationField(default=timedelta(0))
+
+    class Meta:
+        ordering = ['granularity', 'period']
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'period', 'severity', 'bed_type'],
+                                    condition=Q(bed_type__isnull=False), name='unique_rollup_with_bed_type'),
+            models.UniqueConstraint(fields=['granularity', 'period', 'severity'],
+                                    condition=Q(bed_type__isnull=True), name='unique_rollup_without_bed_type'),
+        ]
+
+    def __str__(self):
+        return f'{self.granularity} {self.period} {self.severity} {self.bed_type_id}'
+
+
+def period_start(at, granularity):
+    """Start of the hour or day `at` falls in, in the current timezone"""
+    at = tz.localtime(at)
+    if granularity == ActivityRollup.GranularityChoices.DAY:
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def length_of_stay(admitted_at, left_at):
+    if not admitted_at or not left_at:
+        return None
+    return left_at - admitted_at
@@ -12,6 +12,14 @@ class AdmissionCountSerializer(serializers.Serializer):
     count = LabelledValueSerializer(many=True)
 
 
+class ActivitySerializer(serializers.Serializer):
+
+    period = serializers.DateTimeField()
+    admissions = LabelledValueSerializer(many=True)
+    discharges = LabelledValueSerializer(many=True)
+    average_duration = serializers.DurationField(allow_null=True)
+
+
 class DashboardSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         pass
@@ -25,6 +33,7 @@ class DashboardSerializer(serializers.Serializer):
     total_discharges = serializers.IntegerField(required=False)
     average_duration = serializers.DurationField(required=False, allow_null=True)
     admissions_per_day = AdmissionCountSerializer(many=True, required=False)
+    activity = ActivitySerializer(many=True, required=False)
 
     class Meta:
         fields = [
@@ -32,6 +41,8 @@ class DashboardSerializer(serializers.Serializer):
             'global_availability',
             'total_discharges',
             'assignments',
-            'average_duration'
+            'average_duration',
+            'admissions_per_day',
+            'activity'
         ]
 
@@ -0,0 +1,112 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_init, post_save, post_delete
+
+from dashboard.cache import bump_state_version
+from dashboard.models import ActivityRollup, length_of_stay
+from equipment.models import Bed, BedType
+from equipment.signals import beds_provisioned
+from patient_tracker.models import Admission, BedAssignment, Deceased, Discharge, HealthSnapshot
+from patient_tracker.signals import health_snapshots_created
+
+DASHBOARD_MODELS = [BedType, Bed, BedAssignment, Admission, HealthSnapshot, Discharge, Deceased]
+
+
+def hospital_state_changed(sender, **kwargs):
+    """Invalidate the cached dashboards.
+
+    The version is bumped right away, so that reads within the same transaction see the change,
+    and again on commit, so that a dashboard recomputed by another worker before the commit
+    (from the old data) is not served afterwards.
+    """
+    bump_state_version()
+    transaction.on_commit(bump_state_version)
+
+
+def first_severity(admission):
+    snapshot = admission.health_snapshots.order_by('created').first()
+    return snapshot.severity if snapshot else None
+
+
+def admission_loaded(sender, instance, **kwargs):
+    # Remember the admission day the rollups count this admission in
+    instance._rolled_up_admitted_at = instance.__dict__.get('admitted_at')
+
+
+def admission_saved(sender, instance, created, **kwargs):
+    previous, current = instance._rolled_up_admitted_at, instance.admitted_at
+    instance._rolled_up_admitted_at = current
+    if created or previous == current:
+        return
+
+    # Admissions are only counted once their first snapshot gives them a severity
+    severity = first_severity(instance)
+    if not severity:
+        return
+    with transaction.atomic():
+        if previous:
+            ActivityRollup.objects.add(previous, severity=severity, admissions=-1)
+        if current:
+            ActivityRollup.objects.add(current, severity=severity, admissions=1)
+
+
+def snapshot_saved(sender, instance, created, **kwargs):
+    admission = instance.admission
+    if not created or not admission.admitted_at:
+        return
+    if admission.health_snapshots.exclude(pk=instance.pk).exists():
+        return
+    with transaction.atomic():
+        ActivityRollup.objects.add(admission.admitted_at, severity=instance.severity, admissions=1)
+
+
+def snapshots_created(sender, snapshots, **kwargs):
+    hospital_state_changed(sender)
+
+    # Admissions whose first snapshots are all in the batch are counted with the first one
+    in_batch = Counter(snapshot.admission_id for snapshot in snapshots)
+    totals = HealthSnapshot.objects.filter(admission_id__in=in_batch).values('admission_id') \
+        .annotate(total=Count('pk')).values_list('admission_id', 'total')
+    first_ids = [admission_id for admission_id, total in totals if total == in_batch[admission_id]]
+    if not first_ids:
+        return
+
+    first_snapshots = {}
+    for snapshot in snapshots:
+        first_snapshots.setdefault(snapshot.admission_id, snapshot)
+    admissions = Admission.objects.filter(pk__in=first_ids, admitted_at__isnull=False) \
+        .values_list('pk', 'admitted_at')
+    with transaction.atomic():
+        for admission_id, admitted_at in admissions:
+            ActivityRollup.objects.add(admitted_at, severity=first_snapshots[admission_id].severity, admissions=1)
+
+
+def discharge_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+    # Sent before Discharge.save releases the bed, so the current bed is the one being left
+    admission = instance.admission
+    bed = admission.current_bed
+    with transaction.atomic():
+        ActivityRollup.objects.add(
+            instance.discharged_at,
+            severity=admission.current_severity,
+            bed_type_id=bed.bed_type_id if bed else None,
+            discharges=1,
+            stay=length_of_stay(admission.admitted_at, instance.discharged_at),
+        )
+
+
+def connect_signals():
+    post_init.connect(admission_loaded, sender=Admission, dispatch_uid='rollup_admission_init')
+    post_save.connect(admission_saved, sender=Admission, dispatch_uid='rollup_admission_save')
+    post_save.connect(snapshot_saved, sender=HealthSnapshot, dispatch_uid='rollup_snapshot_save')
+    post_save.connect(discharge_saved, sender=Discharge, dispatch_uid='rollup_discharge_save')
+    health_snapshots_created.connect(snapshots_created, sender=HealthSnapshot, dispatch_uid='rollup_snapshots_bulk')
+    beds_provisioned.connect(hospital_state_changed, sender=BedType, dispatch_uid='dashboard_beds_provisioned')
+
+    for model in DASHBOARD_MODELS:
+        post_save.connect(hospital_state_changed, sender=model, dispatch_uid=f'dashboard_save_{model.__name__}')
+        post_delete.connect(hospital_state_changed, sender=model, dispatch_uid=f'dashboard_delete_{model.__name__}')
@@ -1,9 +1,216 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
 from django.test import TestCase
+from django.utils import timezone as tz
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from common.base_tests import TestUser
+from dashboard.cache import get_or_compute, get_state_version
+from dashboard.models import ActivityRollup
+from equipment.models import BedType
+from patient.models import Patient
+from patient_tracker.models import Admission, HealthSnapshot
 
 
 class DashboardTest(TestCase):
 
     def test_data_migration_added_a_dashboard_model(self):
         self.assertTrue(True)
+
+
+class DashboardApiTest(APITestCase, TestUser):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.test_user)
+
+    def admit(self, severity=None, admitted_at=None):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        if admitted_at:
+            admission.admitted_at = admitted_at
+            admission.save()
+        if severity:
+            HealthSnapshot.objects.create(admission=admission, severity=severity, current_user=self.test_user)
+        return admission
+
+    def test_bed_availability_from_occupancy_counters(self):
+        icu = BedType.objects.create(name='Intensive Care Unit', severity_match='RED', total=2,
+                                     current_user=self.test_user)
+        BedType.objects.create(name='Intermediate Care', severity_match='YELLOW', total=2,
+                               current_user=self.test_user)
+        self.admit().assign_bed(icu)
+
+        data = self.client.get(reverse('v1:dashboard')).json()
+
+        self.assertEqual(data['bed_availability'], [
+            {'label': 'Intensive Care Unit', 'value': 0.5},
+            {'label': 'Intermediate Care', 'value': 1.0},
+        ])
+        self.assertEqual(data['global_availability'], 0.75)
+
+    def test_admissions_per_day(self):
+        today = tz.now()
+        yesterday = today - timedelta(days=1)
+        self.admit('RED', yesterday)
+        self.admit('RED', today)
+        self.admit('YELLOW', today)
+        self.admit(None, today)
+
+        with self.assertNumQueries(1):
+            per_day = Admission.objects.admissions_per_day()
+        self.assertEqual(per_day, [
+            {'date': yesterday.date(), 'count': [{'label': 'RED', 'value': 1}]},
+            {'date': today.date(), 'count': [{'label': 'RED', 'value': 1}, {'label': 'YELLOW', 'value': 1}]},
+        ])
+        self.assertEqual(Admission.objects.admissions_per_day(start=today.date()), per_day[1:])
+
+        response = self.client.get(reverse('v1:dashboard'))
+        self.assertEqual(response.json()['admissions_per_day'], [
+            {'date': yesterday.date().isoformat(), 'count': [{'label': 'RED', 'value': 1.0}]},
+            {'date': today.date().isoformat(), 'count': [{'label': 'RED', 'value': 1.0},
+                                                         {'label': 'YELLOW', 'value': 1.0}]},
+        ])
+
+        response = self.client.get(reverse('v1:dashboard'), {'from': today.date().isoformat()})
+        self.assertEqual(response.json()['admissions_per_day'], [
+            {'date': today.date().isoformat(), 'count': [{'label': 'RED', 'value': 1.0},
+                                                         {'label': 'YELLOW', 'value': 1.0}]},
+        ])
+
+        response = self.client.get(reverse('v1:dashboard'), {'to': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_dashboard_is_cached_until_hospital_state_changes(self):
+        icu = BedType.objects.create(name='Intensive Care Unit', severity_match='RED', total=2,
+                                     current_user=self.test_user)
+        self.client.get(reverse('v1:dashboard'))
+
+        with self.assertNumQueries(0):
+            data = self.client.get(reverse('v1:dashboard')).json()
+        self.assertEqual(data['global_availability'], 1.0)
+
+        version = get_state_version()
+        self.admit().assign_bed(icu)
+        self.assertGreater(get_state_version(), version)
+
+        data = self.client.get(reverse('v1:dashboard')).json()
+        self.assertEqual(data['global_availability'], 0.5)
+
+    def test_bulk_provisioning_invalidates_the_dashboard(self):
+        self.assertEqual(self.client.get(reverse('v1:dashboard')).json()['bed_availability'], [])
+
+        icu = BedType.objects.create(name='Intensive Care Unit', total=3, current_user=self.test_user)
+        self.admit().assign_bed(icu)
+        data = self.client.get(reverse('v1:dashboard')).json()
+        self.assertEqual(data['bed_availability'], [{'label': 'Intensive Care Unit', 'value': 2 / 3}])
+
+        icu.total = 1
+        icu.save()
+        data = self.client.get(reverse('v1:dashboard')).json()
+        self.assertEqual(data['bed_availability'], [{'label': 'Intensive Care Unit', 'value': 0.0}])
+
+    def test_renaming_a_bed_type_invalidates_the_dashboard(self):
+        icu = BedType.objects.create(name='Intensive Care Unit', total=1, current_user=self.test_user)
+        self.client.get(reverse('v1:dashboard'))
+
+        icu.name = 'ICU'
+        icu.save()
+        data = self.client.get(reverse('v1:dashboard')).json()
+        self.assertEqual(data['bed_availability'], [{'label': 'ICU', 'value': 1.0}])
+
+    def test_concurrent_miss_serves_previous_value(self):
+        self.assertEqual(get_or_compute('test', lambda: 'first'), 'first')
+
+        self.admit()
+        # Another worker is already recomputing the value for the new version
+        cache.add(f'dashboard:{get_state_version()}:test:lock', True)
+
+        def compute():
+            raise AssertionError('The value must only be computed once')
+
+        self.assertEqual(get_or_compute('test', compute), 'first')
+
+    def rollup_rows(self):
+        return sorted(ActivityRollup.objects.values_list(
+            'granularity', 'period', 'severity', 'bed_type', 'admissions', 'discharges', 'stays', 'stay_total'))
+
+    def test_rollups_are_maintained_and_rebuilt(self):
+        icu = BedType.objects.create(name='Intensive Care Unit', severity_match='RED', total=2,
+                                     current_user=self.test_user)
+        two_days_ago = tz.now() - timedelta(days=2)
+        admission = self.admit('RED', two_days_ago)
+        admission.assign_bed(icu)
+        HealthSnapshot.objects.create(admission=admission, severity='YELLOW', current_user=self.test_user)
+        admission.discharge()
+        self.admit('GREEN')
+
+        day = ActivityRollup.objects.between(ActivityRollup.GranularityChoices.DAY)
+        self.assertEqual(day.get(admissions=1, severity='RED').period.date(), two_days_ago.date())
+        discharge = day.get(discharges=1)
+        self.assertEqual((discharge.severity, discharge.bed_type), ('YELLOW', icu))
+        self.assertAlmostEqual(discharge.stay_total.total_seconds(), timedelta(days=2).total_seconds(), delta=60)
+
+        incremental = self.rollup_rows()
+        ActivityRollup.objects.all().delete()
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_backfill_rollups_check(self):
+        admission = self.admit('RED', tz.now() - timedelta(days=3))
+        call_command('backfill_rollups', '--check', stdout=StringIO())
+
+        # A queryset update bypasses the signals, making the rollups drift
+        Admission.objects.filter(pk=admission.pk).update(admitted_at=tz.now())
+        self.assertEqual(len(ActivityRollup.objects.verify()), 2)
+        with self.assertRaises(CommandError):
+            call_command('backfill_rollups', '--check', stdout=StringIO())
+
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(ActivityRollup.objects.verify(), [])
+
+    def test_dashboard_reads_rollups(self):
+        icu = BedType.objects.create(name='Intensive Care Unit', severity_match='RED', total=2,
+                                     current_user=self.test_user)
+        today = tz.now()
+        admission = self.admit('RED', today - timedelta(hours=5))
+        admission.assign_bed(icu)
+        admission.discharge()
+        self.admit('RED', today - timedelta(days=30))
+
+        data = self.client.get(reverse('v1:dashboard'), {'from': (today - timedelta(days=1)).date().isoformat(),
+                                                         'granularity': 'hour'}).json()
+        self.assertEqual(data['total_discharges'], 1)
+        self.assertEqual(data['average_duration'][:2], '05')
+        self.assertEqual([(item['admissions'], item['discharges']) for item in data['activity']], [
+            ([{'label': 'RED', 'value': 1.0}], []),
+            ([], [{'label': 'Intensive Care Unit', 'value': 1.0}]),
+        ])
+
+        data = self.client.get(reverse('v1:dashboard')).json()
+        self.assertEqual(len(data['admissions_per_day']), 2)
+
+        response = self.client.get(reverse('v1:dashboard'), {'granularity': 'week'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_snapshots_are_rolled_up(self):
+        yesterday = tz.now() - timedelta(days=1)
+        first, second = self.admit(admitted_at=yesterday), self.admit('GREEN', yesterday)
+        version = get_state_version()
+        HealthSnapshot.objects.bulk_record([
+            HealthSnapshot(admission=first, severity='RED'),
+            HealthSnapshot(admission=second, severity='RED'),
+            HealthSnapshot(admission=first, severity='YELLOW'),
+        ], self.test_user)
+        self.assertGreater(get_state_version(), version)
+
+        incremental = self.rollup_rows()
+        ActivityRollup.objects.all().delete()
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(ActivityRollup.objects.totals()['admissions'], 2)
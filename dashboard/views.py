@@ -1,16 +1,93 @@
-from django.shortcuts import render
-from rest_framework import viewsets, permissions
+from datetime import timedelta
+
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import permissions, serializers
+from rest_framework.response import Response
 from rest_framework.views import APIView
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 
+from common.query_params import get_date_param
+from dashboard.cache import get_or_compute
+from dashboard.models import ActivityRollup
 from dashboard.serializers import DashboardSerializer
+from equipment.models import Bed, BedType
+from patient_tracker.models import BedAssignment, start_of_day
 
 dashboard_permissions = [permissions.IsAuthenticated]
 
 
 class DashboardView(APIView):
+    """Global metrics of the hospital.
+
+    Admission and discharge metrics are read from the hourly / daily rollups only, restricted
+    to the `from` and `to` days when given, so their cost does not depend on the history size.
+    """
     permission_classes = dashboard_permissions
 
+    def get_bed_occupancy(self):
+        """Total and available beds per bed type, read from the occupancy counters in one query"""
+        return BedType.objects.order_by('name').annotate(
+            beds_total=Coalesce(Sum('occupancy_counters__count'), 0),
+            beds_available=Coalesce(Sum('occupancy_counters__count',
+                                        filter=Q(occupancy_counters__state=Bed.StateChoices.AVAILABLE)), 0)
+        ).values('name', 'beds_total', 'beds_available')
+
+    def get_range(self):
+        start, end = get_date_param(self.request, 'from'), get_date_param(self.request, 'to')
+        return (
+            start_of_day(start) if start else None,
+            start_of_day(end + timedelta(days=1)) if end else None,
+        )
+
+    def get_granularity(self):
+        granularity = self.request.query_params.get('granularity', ActivityRollup.GranularityChoices.DAY)
+        if granularity not in ActivityRollup.GranularityChoices.values:
+            raise serializers.ValidationError(
+                {'granularity': f'Expected one of {", ".join(ActivityRollup.GranularityChoices.values)}'})
+        return granularity
+
+    def get_admissions_per_day(self, start, end):
+        qs = ActivityRollup.objects.between(ActivityRollup.GranularityChoices.DAY, start, end)
+        qs = qs.exclude(severity='')
+        qs = qs.order_by('period', 'severity')
+        qs = qs.values('period', 'severity')
+        qs = qs.annotate(value=Sum('admissions'))
+        qs = qs.filter(value__gt=0)
+
+        admissions = {}
+        for row in qs:
+            admissions.setdefault(row['period'].date(), []).append({'label': row['severity'], 'value': row['value']})
+        return [{'date': day, 'count': count} for day, count in admissions.items()]
+
+    def get_activity(self, granularity, start, end):
+        """Admissions per severity, discharges per bed type and average stay for every period"""
+        qs = ActivityRollup.objects.between(granularity, start, end)
+        qs = qs.order_by('period', 'severity', 'bed_type__name')
+        qs = qs.values_list('period', 'severity', 'bed_type__name', 'admissions', 'discharges', 'stays', 'stay_total')
+
+        periods = {}
+        for period, severity, bed_type, admissions, discharges, stays, stay_total in qs:
+            activity = periods.setdefault(period, {
+                'period': period, 'admissions': {}, 'discharges': {}, 'stays': 0, 'stay_total': timedelta(0)
+            })
+            if admissions:
+                label = severity or '-'
+                activity['admissions'][label] = activity['admissions'].get(label, 0) + admissions
+            if discharges:
+                label = bed_type or '-'
+                activity['discharges'][label] = activity['discharges'].get(label, 0) + discharges
+            activity['stays'] += stays
+            activity['stay_total'] += stay_total
+
+        return [{
+            'period': activity['period'],
+            'admissions': [{'label': label, 'value': value} for label, value in activity['admissions'].items()],
+            'discharges': [{'label': label, 'value': value} for label, value in activity['discharges'].items()],
+            'average_duration': activity['stay_total'] / activity['stays'] if activity['stays'] else None,
+        } for activity in periods.values()]
+
     def get_data(self):
         data = {
             'bed_availability': [],
@@ -18,38 +95,48 @@ class DashboardView(APIView):
             'total_discharges': 0,
             'assignments': [],
             'admissions_per_day': [],
-            'average_duration': None
+            'average_duration': None,
+            'activity': [],
         }
 
-        bed_types = BedType.objects.all()
-        for bt in bed_types:
-            bt: BedType
-            available_beds_ratio = (1 / bt.beds.count()) * bt.number_available if bt.beds.count() > 0 else 1
-            data['bed_availability'].append({'label': bt.name, 'value': available_beds_ratio})
-
-        total_beds = Bed.objects.count()
-        total_available = 1 / total_beds * Bed.objects.available().count() if total_beds > 0 else 1
+        total_beds = 0
+        total_available = 0
+        for bt in self.get_bed_occupancy():
+            available_beds_ratio = bt['beds_available'] / bt['beds_total'] if bt['beds_total'] > 0 else 1
+            data['bed_availability'].append({'label': bt['name'], 'value': available_beds_ratio})
+            total_beds += bt['beds_total']
+            total_available += bt['beds_available']
 
-        data['global_availability'] = total_available
-        data['total_discharges'] = Discharge.objects.count()
+        data['global_availability'] = total_available / total_beds if total_beds > 0 else 1
 
         data['assignments'] = list(BedAssignment.objects.current_per_severity())
 
-        duration = Admission.objects.average_duration()
-        data['average_duration'] = duration
+        start, end = self.get_range()
+        totals = ActivityRollup.objects.totals(start, end)
+        data['total_discharges'] = totals['discharges'] or 0
+        data['average_duration'] = totals['stay_total'] / totals['stays'] if totals['stays'] else None
 
-        admissions_per_day = Admission.objects.admissions_per_day()
-        data['admissions_per_day'] = admissions_per_day
+        data['admissions_per_day'] = self.get_admissions_per_day(start, end)
+        data['activity'] = self.get_activity(self.get_granularity(), start, end)
 
         return data
 
     @swagger_auto_schema(
-        operation_description="Returns read only global metrics",
+        operation_description="Returns read only global metrics. "
+                              "Admission and discharge metrics can be restricted to the `from` and `to` days, "
+                              "`granularity` sets the period of the activity series",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('granularity', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=ActivityRollup.GranularityChoices.values),
+        ],
         responses={200: DashboardSerializer()}
     )
     def get(self, request):
-        serializer = DashboardSerializer(data=self.get_data())
+        params = [get_date_param(request, 'from'), get_date_param(request, 'to'), self.get_granularity()]
+        data = get_or_compute('data:' + ':'.join(str(param) for param in params), self.get_data)
+        serializer = DashboardSerializer(data=data)
         serializer.is_valid(raise_exception=True)
 
         return Response(serializer.data)
-
@@ -21,6 +21,20 @@ class BedTypeAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
         'number_out_of_service',
     ]
 
+    actions = ['provision_beds']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('occupancy_counters')
+
+    def provision_beds(self, request, queryset):
+        for bed_type in queryset:
+            bed_type.current_user = request.user
+            result = bed_type.provision_beds()
+            messages.success(request, f'{bed_type.name}: {result["created"]} beds created, '
+                                      f'{result["reinstated"]} reinstated, {result["retired"]} retired')
+
+    provision_beds.short_description = _('Provision beds to match the total')
+
 
 @admin.register(Bed, site=admin_site)
 class BedsAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
@@ -56,39 +70,43 @@ class BedsAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
 
     def set_to_available(self, request, pk):
         bed = Bed.objects.get(pk=pk)
+        bed.current_user = request.user
         bed.state = Bed.StateChoices.AVAILABLE
         bed.save()
-        return redirect(reverse_lazy('admin:patient_tracker_bed_changelist'))
+        return redirect(reverse_lazy('admin:equipment_bed_changelist'))
 
     set_to_available.short_description = _('Available')
     set_to_available.url_path = 'set-available'
 
     def set_to_equipment_failure(self, request, pk):
         bed = Bed.objects.get(pk=pk)
+        bed.current_user = request.user
         bed.state = Bed.StateChoices.OUT_OF_SERVICE
         bed.reason = Bed.ReasonChoices.EQUIP_FAIL
         bed.save()
-        return redirect(reverse_lazy('admin:patient_tracker_bed_changelist'))
+        return redirect(reverse_lazy('admin:equipment_bed_changelist'))
 
     set_to_equipment_failure.short_description = _('Equipment failed')
     set_to_equipment_failure.url_path = 'set-equip-fail'
 
     def set_to_unavailable(self, request, pk):
         bed = Bed.objects.get(pk=pk)
+        bed.current_user = request.user
         bed.state = Bed.StateChoices.OUT_OF_SERVICE
         bed.reason = Bed.ReasonChoices.UNAVAILABLE
         bed.save()
-        return redirect(reverse_lazy('admin:patient_tracker_bed_changelist'))
+        return redirect(reverse_lazy('admin:equipment_bed_changelist'))
 
     set_to_unavailable.short_description = _('Unavailable')
     set_to_unavailable.url_path = 'set-unavailable'
 
     def set_to_cleaning(self, request, pk):
         bed = Bed.objects.get(pk=pk)
+        bed.current_user = request.user
         bed.state = Bed.StateChoices.OUT_OF_SERVICE
         bed.reason = Bed.ReasonChoices.CLEANING
         bed.save()
-        return redirect(reverse_lazy('admin:patient_tracker_bed_changelist'))
+        return redirect(reverse_lazy('admin:equipment_bed_changelist'))
 
     set_to_cleaning.short_description = _('Cleaning required')
     set_to_cleaning.url_path = 'set-cleaning'
@@ -0,0 +1,64 @@
+"""Catalog of the bed types, cached for the admin actions and invalidated by a version stamp.
+
+`BedType.save` and `BedType.delete` bump the version. Each process keeps the catalog of the
+version it last saw, so that a read only costs a cache lookup of the version. On a version
+change the catalog is loaded from the shared cache, or from the database by the first process
+that needs it.
+
+The cache backend is the `default` Django cache, as for the dashboard: it must be shared
+(`CACHE_URL`) for the other processes to see the version bumps. With local memory, they only
+see the new bed types once their catalog is `BED_TYPE_CATALOG_CACHE_TIMEOUT` seconds old, a
+minute by default.
+"""
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'equipment:bed-types-version'
+
+BedTypeEntry = namedtuple('BedTypeEntry', ['id', 'name', 'severity_match'])
+
+# (version, expiry time, bed types) of this process
+_local = (None, 0, ())
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Restart from the clock so that an evicted version never goes back to a cached catalog
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Missing key, start a new version sequence
+        get_version()
+        return cache.incr(VERSION_KEY)
+
+
+def get_bed_types():
+    """Bed types as `BedTypeEntry` tuples ordered by name"""
+    global _local
+
+    version = get_version()
+    local_version, expires_at, bed_types = _local
+    if local_version == version and time.monotonic() < expires_at:
+        return bed_types
+
+    key = f'equipment:bed-types:{version}'
+    bed_types = cache.get(key)
+    if bed_types is None:
+        from equipment.models import BedType
+
+        bed_types = tuple(BedTypeEntry(*row) for row in
+                          BedType.objects.order_by('name').values_list('id', 'name', 'severity_match'))
+        cache.set(key, bed_types, settings.BED_TYPE_CATALOG_CACHE_TIMEOUT)
+
+    _local = (version, time.monotonic() + settings.BED_TYPE_CATALOG_CACHE_TIMEOUT, bed_types)
+    return bed_types
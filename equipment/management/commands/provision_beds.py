@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from custom_auth.utils import get_user_model
+from equipment.models import BedType
+
+
+class Command(BaseCommand):
+    help = 'Create or update bed types and provision their beds in bulk, for the initial hospital setup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('bed_types', nargs='+', metavar='NAME:TOTAL[:SEVERITY]',
+                            help='Bed type name, number of beds and optional severity match, e.g. "ICU:40:RED"')
+        parser.add_argument('--user', default='admin', help='Username recorded as creator of the beds')
+
+    def parse(self, value):
+        parts = value.split(':')
+        if len(parts) not in (2, 3) or not parts[1].isdigit():
+            raise CommandError(f'Invalid bed type "{value}", expected NAME:TOTAL[:SEVERITY]')
+        severity = parts[2] if len(parts) == 3 else None
+        if severity and severity not in BedType.SeverityMatchChoices.values:
+            raise CommandError(f'Invalid severity "{severity}" for bed type {parts[0]}')
+        return parts[0], int(parts[1]), severity
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+        for name, total, severity in [self.parse(value) for value in options['bed_types']]:
+            bed_type = BedType.objects.filter(name=name).first() or BedType(name=name)
+            bed_type.current_user = user
+            bed_type.total = total
+            if severity is not None:
+                bed_type.severity_match = severity
+            bed_type.save()
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {total} beds in service, {bed_type.number_available} available'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment.models import BedOccupancy
+
+
+class Command(BaseCommand):
+    help = 'Verify the bed occupancy counters against the beds, and rebuild them unless --check is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report the counters that drifted, exit with an error if any did')
+
+    def handle(self, *args, **options):
+        mismatches = BedOccupancy.objects.verify()
+
+        for bed_type_id, state, stored, expected in mismatches:
+            self.stdout.write(f'Bed type {bed_type_id}, state {state}: counter is {stored}, beds say {expected}')
+
+        if options['check']:
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} bed occupancy counter(s) out of sync')
+            self.stdout.write(self.style.SUCCESS('Bed occupancy counters are in sync'))
+            return
+
+        BedOccupancy.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Bed occupancy counters rebuilt ({len(mismatches)} fixed)'))
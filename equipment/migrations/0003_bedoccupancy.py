@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Bed = apps.get_model('equipment', 'Bed')
+    BedType = apps.get_model('equipment', 'BedType')
+    BedOccupancy = apps.get_model('equipment', 'BedOccupancy')
+
+    counts = {
+        (row['bed_type_id'], row['state']): row['total']
+        for row in Bed.objects.order_by().values('bed_type_id', 'state').annotate(total=Count('id'))
+    }
+    BedOccupancy.objects.bulk_create([
+        BedOccupancy(bed_type_id=bed_type_id, state=state, count=counts.get((bed_type_id, state), 0))
+        for bed_type_id in BedType.objects.values_list('id', flat=True)
+        for state in (0, 1, 2)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0002_historicalbed_historicalbedtype'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BedOccupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'Out of service'), (1, 'Assigned'), (2, 'Available')])),
+                ('count', models.IntegerField(default=0)),
+                ('bed_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy_counters', to='equipment.bedtype')),
+            ],
+            options={
+                'verbose_name_plural': 'bed occupancies',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bedoccupancy',
+            constraint=models.UniqueConstraint(fields=('bed_type', 'state'), name='unique_bed_occupancy_state'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
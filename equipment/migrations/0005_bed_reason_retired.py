@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0004_bed_bed_type_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bed',
+            name='reason',
+            field=models.CharField(blank=True, choices=[('cleaning', 'Cleaning'), ('equip fail', 'Equipment failure'), ('unavailable', 'Unavailable'), ('retired', 'Retired')], max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalbed',
+            name='reason',
+            field=models.CharField(blank=True, choices=[('cleaning', 'Cleaning'), ('equip fail', 'Equipment failure'), ('unavailable', 'Unavailable'), ('retired', 'Retired')], max_length=20, null=True),
+        ),
+    ]
@@ -2,14 +2,18 @@ import os
 import string
 
 from common.base_models import ImmutableBaseModel, CurrentBaseModel
+from equipment import catalog
+from equipment.signals import beds_provisioned
 from django.conf import settings
 from django.core.files.images import ImageFile
-from django.db import transaction
+from django.db import connection, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Count, F, Avg, Subquery, OuterRef, Max
+from django.db.models import Count, F, Avg, Subquery, OuterRef, Max, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone as tz
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
 # from patient_tracker.models import Admission, BedAssignment
 
@@ -23,6 +27,7 @@ class Bed(CurrentBaseModel):
         CLEANING = 'cleaning', 'Cleaning'
         EQUIP_FAIL = 'equip fail', 'Equipment failure'
         UNAVAILABLE = 'unavailable', 'Unavailable'
+        RETIRED = 'retired', 'Retired'
 
     class StateChoices(models.IntegerChoices):
         OUT_OF_SERVICE = 0, 'Out of service'
@@ -40,6 +45,37 @@ class Bed(CurrentBaseModel):
         def out_of_service(self):
             return self.get_queryset().filter(state=Bed.StateChoices.OUT_OF_SERVICE)
 
+        def for_board(self):
+            """Beds with everything the bed board displays, loaded in a fixed number of queries.
+
+            The assignments of the beds are prefetched in a single query, which gives both the
+            assignment ids and the open assignments, whose admission is then loaded by
+            `Admission.objects.with_current_state()`.
+            """
+            from patient_tracker.models import Admission
+
+            return self.get_queryset().prefetch_related(
+                'assignments',
+                Prefetch('open_assignments__admission', queryset=Admission.objects.with_current_state()),
+            )
+
+        def claim(self, bed_type):
+            """Lock and return an available bed of `bed_type`, to be assigned in the current transaction.
+
+            Beds locked by concurrent claims are skipped (`SELECT ... FOR UPDATE SKIP LOCKED`), so
+            simultaneous allocations neither get the same bed nor wait on each other.
+
+            Raises:
+                NoBedAvailable -- there is no available bed of this type left
+            """
+            qs = self.available().filter(bed_type=bed_type).order_by('modified')
+            if connection.features.has_select_for_update_skip_locked:
+                qs = qs.select_for_update(skip_locked=True)
+            bed = qs.first()
+            if not bed:
+                raise NoBedAvailable(f'There are no bed available for this type: {bed_type.name}')
+            return bed
+
     objects = BedManager()
 
     def delete(self, using=None, keep_parents=False):
@@ -53,8 +89,16 @@ class Bed(CurrentBaseModel):
     reason = models.CharField(max_length=20, choices=ReasonChoices.choices, null=True, blank=True)
     state = models.PositiveSmallIntegerField(choices=StateChoices.choices, default=StateChoices.AVAILABLE)
 
+    @property
+    def open_assignments(self):
+        """Assignments not ended yet, read from the prefetched assignments"""
+        return [assignment for assignment in self.assignments.all() if assignment.unassigned_at is None]
+
     @property
     def current_assignment(self):
+        if 'assignments' in getattr(self, '_prefetched_objects_cache', {}):
+            open_assignments = self.open_assignments
+            return open_assignments[0] if open_assignments else None
         return self.assignments.filter(unassigned_at__isnull=True).first()
 
     @property
@@ -68,17 +112,35 @@ class Bed(CurrentBaseModel):
         if self.reason == self.StateChoices.OUT_OF_SERVICE and not self.state:
             raise ValidationError('Please provide the reason for this bed to be out of service')
 
+    @transaction.atomic
     def save(self, **kwargs):
         self.clean()
         if self.state != self.StateChoices.OUT_OF_SERVICE:
             self.reason = None
+
+        previous = None
+        if not self._state.adding:
+            # Move the counters from the stored state of the bed rather than the one this instance was
+            # loaded with, which a concurrent change may have made stale. The row stays locked until commit.
+            previous = Bed.objects.select_for_update().filter(pk=self.pk) \
+                .values_list('bed_type_id', 'state').first()
         super().save(**kwargs)
 
+        current = (self.bed_type_id, self.state)
+        if previous != current:
+            BedOccupancy.objects.move(previous, current)
+
+        if self.state == self.StateChoices.AVAILABLE and (previous is None or previous[1] != self.state):
+            # The bed has been freed (e.g. cleaning completed): give it to the first patient waiting for one
+            from patient_tracker.models import WaitingListEntry
+            WaitingListEntry.objects.serve(self.bed_type, self.current_user, bed=self)
+
     @transaction.atomic
     def leave_bed(self):
         """The patient is leaving the bed. The current assignment to this patient can be removed.
 
-        The bed must be taken out of service for cleaning.
+        The bed must be taken out of service for cleaning. It goes to the first patient waiting for
+        a bed of its type once the cleaning is completed and the bed is available again.
         """
         assignment = self.current_assignment
         if assignment:
@@ -88,6 +150,15 @@ class Bed(CurrentBaseModel):
     def __str__(self):
         return self.bed_type.name
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['bed_type', 'state'], name='bed_type_state'),
+        ]
+
+
+class NoBedAvailable(Bed.DoesNotExist):
+    """Raised when a bed type has no capacity left"""
+
 
 class BedType(CurrentBaseModel):
     """The numbers of each type of bed that a hospital has as resources.
@@ -102,34 +173,149 @@ class BedType(CurrentBaseModel):
         YELLOW = 'YELLOW', 'Yellow'
         GREEN = 'GREEN', 'Green'
 
+    class BedTypeManager(models.Manager):
+
+        def with_occupancy(self):
+            """Bed types annotated with their occupancy and waiting patients, in a single query.
+
+            The bed counts come from the occupancy counters through conditional aggregation, the
+            waiting patients from a correlated count of the waiting list of the bed type.
+            """
+            from patient_tracker.models import WaitingListEntry
+
+            def beds_in(state):
+                return Coalesce(Sum('occupancy_counters__count', filter=Q(occupancy_counters__state=state)), 0)
+
+            waiting = WaitingListEntry.objects.filter(bed_type=OuterRef('pk'))
+            waiting = waiting.order_by().values('bed_type').annotate(total=Count('pk')).values('total')
+
+            return self.get_queryset().annotate(
+                beds_out_of_service=beds_in(Bed.StateChoices.OUT_OF_SERVICE),
+                beds_assigned=beds_in(Bed.StateChoices.ASSIGNED),
+                beds_available=beds_in(Bed.StateChoices.AVAILABLE),
+                beds_waiting=Coalesce(Subquery(waiting, output_field=models.IntegerField()), 0),
+            )
+
+    objects = BedTypeManager()
+
     name = models.CharField(max_length=50, blank=False)
     severity_match = models.CharField(max_length=6, blank=True, choices=SeverityMatchChoices.choices)
     total = models.IntegerField(null=False)
 
+    provisioning_batch_size = 500
+
     def save(self, **kwargs):
         super().save(**kwargs)
-        nb_to_create = self.total - self.beds.count()
-        if nb_to_create <= 0:
+        BedOccupancy.objects.ensure_counters(self.pk)
+        # Beds created, reinstated and retired to match `total`
+        self.provisioned = self.provision_beds()
+        self.bump_catalog_version()
+
+    def delete(self, **kwargs):
+        result = super().delete(**kwargs)
+        self.bump_catalog_version()
+        return result
+
+    @staticmethod
+    def bump_catalog_version():
+        # Bumped again on commit, so that a catalog read before the commit is not kept
+        catalog.bump_version()
+        transaction.on_commit(catalog.bump_version)
+
+    @transaction.atomic
+    def provision_beds(self):
+        """Create or retire beds in bulk so that `total` beds of this type are in service.
+
+        Missing beds are first taken from the retired beds, put back in service, then created.
+        Surplus beds are retired among the available ones, assigned beds are never retired.
+        Beds and their historical records are written in batches of `provisioning_batch_size`,
+        without their `post_save` signals: `beds_provisioned` is sent instead.
+
+        Returns:
+            dict -- number of beds `created`, `reinstated` and `retired`
+        """
+        result = {'created': 0, 'reinstated': 0, 'retired': 0}
+
+        # Serialize the provisioning of a bed type
+        list(BedType.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+
+        retired = Bed.objects.filter(bed_type=self, state=Bed.StateChoices.OUT_OF_SERVICE,
+                                     reason=Bed.ReasonChoices.RETIRED)
+        missing = self.total - (self.beds.count() - retired.count())
+
+        if missing > 0:
+            reinstated = list(retired.order_by('modified')[:missing])
+            self._bulk_set_state(reinstated, Bed.StateChoices.AVAILABLE, None)
+            result['reinstated'] = len(reinstated)
+
+            new_beds = [Bed(bed_type=self, creator=self.current_user) for _ in range(missing - len(reinstated))]
+            bulk_create_with_history(new_beds, Bed, batch_size=self.provisioning_batch_size,
+                                     default_user=self.current_user)
+            BedOccupancy.objects.adjust(self.pk, Bed.StateChoices.AVAILABLE, len(new_beds))
+            result['created'] = len(new_beds)
+
+        elif missing < 0:
+            surplus = list(Bed.objects.available().filter(bed_type=self).order_by('-modified')[:-missing])
+            self._bulk_set_state(surplus, Bed.StateChoices.OUT_OF_SERVICE, Bed.ReasonChoices.RETIRED)
+            result['retired'] = len(surplus)
+
+        if missing > 0:
+            from patient_tracker.models import WaitingListEntry
+            WaitingListEntry.objects.serve(self, self.current_user)
+
+        if any(result.values()):
+            beds_provisioned.send(sender=BedType, bed_type=self)
+        return result
+
+    def _bulk_set_state(self, beds, state, reason):
+        """Move beds that all share the same state to another state"""
+        if not beds:
             return
-        for i in range(nb_to_create):
-            b = Bed(bed_type=self, current_user=self.current_user)
-            b.save()
+        BedOccupancy.objects.adjust(self.pk, beds[0].state, -len(beds))
+        now = tz.now()
+        for bed in beds:
+            bed.state, bed.reason = state, reason
+            bed.modifier, bed.modified = self.current_user, now
+        bulk_update_with_history(beds, Bed, ['state', 'reason', 'modifier', 'modified'],
+                                 batch_size=self.provisioning_batch_size, default_user=self.current_user)
+        BedOccupancy.objects.adjust(self.pk, state, len(beds))
+
+    @property
+    def occupancy(self):
+        """Number of beds of this type per state, read from the maintained counters.
+
+        Uses the annotations of `BedType.objects.with_occupancy()` or the prefetched counters
+        (`prefetch_related('occupancy_counters')`) when available, otherwise a single indexed lookup.
+        """
+        if hasattr(self, 'beds_available'):
+            return {
+                Bed.StateChoices.OUT_OF_SERVICE: self.beds_out_of_service,
+                Bed.StateChoices.ASSIGNED: self.beds_assigned,
+                Bed.StateChoices.AVAILABLE: self.beds_available,
+            }
+        counts = {state: 0 for state in Bed.StateChoices.values}
+        counts.update({counter.state: counter.count for counter in self.occupancy_counters.all()})
+        return counts
 
     @property
     def number_out_of_service(self):
-        return self.beds.out_of_service().count()
+        return self.occupancy[Bed.StateChoices.OUT_OF_SERVICE]
 
     @property
     def number_assigned(self):
-        return self.beds.assigned().count()
+        return self.occupancy[Bed.StateChoices.ASSIGNED]
 
     @property
     def number_available(self):
-        return self.beds.available().count()
+        return self.occupancy[Bed.StateChoices.AVAILABLE]
 
     @property
     def number_waiting(self):
-        return self.waiting_for_assigned_beds.count()
+        """Admissions in the waiting list of this bed type"""
+        if hasattr(self, 'beds_waiting'):
+            return self.beds_waiting
+        from patient_tracker.models import WaitingListEntry
+        return WaitingListEntry.objects.filter(bed_type=self).count()
 
     @property
     def is_available(self):
@@ -148,3 +334,86 @@ class BedType(CurrentBaseModel):
         else:
             return bed_types[0]
 
+
+class BedOccupancy(models.Model):
+    """Running number of beds per bed type and state.
+
+    Kept up to date by `Bed.save` in the same transaction as the bed change, so that
+    occupancy can be read without counting the beds. `rebuild_bed_occupancy` recomputes
+    the counters from `Bed.objects` if they ever drift (e.g. after a queryset `update()`).
+
+    Concurrent changes of beds of the same type and state wait on each other's counter row
+    until commit. The claim of a bed (`Bed.objects.claim`) does not: the counters of the claimed
+    bed are moved at the end of `BedAssignment.save`, the last step of `Admission.assign_bed`, so
+    the wait only covers the commit of the allocation ahead, not its claim. That wait
+    is accepted in exchange for exact counts read without counting the beds.
+    """
+
+    class BedOccupancyManager(models.Manager):
+
+        def ensure_counters(self, bed_type_id):
+            """Create the zeroed counters of a bed type, leaving existing ones untouched"""
+            self.bulk_create([
+                BedOccupancy(bed_type_id=bed_type_id, state=state, count=0)
+                for state in Bed.StateChoices.values
+            ], ignore_conflicts=True)
+
+        def adjust(self, bed_type_id, state, delta):
+            updated = self.filter(bed_type_id=bed_type_id, state=state).update(count=F('count') + delta)
+            if not updated:
+                self.ensure_counters(bed_type_id)
+                self.filter(bed_type_id=bed_type_id, state=state).update(count=F('count') + delta)
+
+        def move(self, previous, current):
+            """Move one bed from the `previous` (bed type, state) counter to the `current` one.
+
+            Either side can be None, when a bed is created or its previous state is unknown. The
+            counters are updated in a fixed order, so that moves in opposite directions (a bed being
+            assigned while another one becomes available) cannot deadlock.
+            """
+            deltas = [(counter, delta) for counter, delta in [(previous, -1), (current, 1)]
+                      if counter and counter[1] is not None]
+            for (bed_type_id, state), delta in sorted(deltas, key=lambda item: (str(item[0][0]), item[0][1])):
+                self.adjust(bed_type_id, state, delta)
+
+        def expected(self):
+            """Counts per (bed type id, state) computed from the beds themselves"""
+            qs = Bed.objects.order_by().values('bed_type_id', 'state').annotate(total=Count('id'))
+            return {(row['bed_type_id'], row['state']): row['total'] for row in qs}
+
+        def verify(self):
+            """Return the counters that differ from the beds, as (bed type id, state, stored, expected)"""
+            expected = self.expected()
+            stored = {(c.bed_type_id, c.state): c.count for c in self.all()}
+            keys = set(expected) | set(stored)
+            return sorted(
+                [(bed_type_id, state, stored.get((bed_type_id, state), 0), expected.get((bed_type_id, state), 0))
+                 for (bed_type_id, state) in keys
+                 if stored.get((bed_type_id, state), 0) != expected.get((bed_type_id, state), 0)],
+                key=lambda row: (str(row[0]), row[1])
+            )
+
+        @transaction.atomic
+        def rebuild(self):
+            expected = self.expected()
+            self.all().delete()
+            self.bulk_create([
+                BedOccupancy(bed_type_id=bed_type_id, state=state, count=expected.get((bed_type_id, state), 0))
+                for bed_type_id in BedType.objects.values_list('id', flat=True)
+                for state in Bed.StateChoices.values
+            ])
+
+    objects = BedOccupancyManager()
+
+    bed_type = models.ForeignKey(BedType, on_delete=models.CASCADE, related_name='occupancy_counters')
+    state = models.PositiveSmallIntegerField(choices=Bed.StateChoices.choices)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'bed occupancies'
+        constraints = [
+            models.UniqueConstraint(fields=['bed_type', 'state'], name='unique_bed_occupancy_state'),
+        ]
+
+    def __str__(self):
+        return f'{self.bed_type_id} - {self.get_state_display()}: {self.count}'
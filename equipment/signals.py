@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by `BedType.provision_beds` with the `bed_type` whose beds it created, reinstated or
+# retired in bulk, whose `post_save` signals are not sent
+beds_provisioned = Signal()
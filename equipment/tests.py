@@ -1,10 +1,22 @@
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
 
-from patient.models import Patient
-from patient_tracker.models import Admission
-from equipment.models import BedType, Bed
+from patient.models import Patient, PersonalData
+from patient_tracker.models import Admission, HealthSnapshot, WaitingListEntry
+from equipment import catalog
+from equipment.admin import BedsAdmin
+from equipment.models import BedType, Bed, BedOccupancy
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from common.base_tests import TestUser
+from project.admin import admin_site
 
 
 class PatientTrackerTestCase(TestCase, TestUser):
@@ -19,3 +31,246 @@ class PatientTrackerTestCase(TestCase, TestUser):
         self.assertEqual(Bed.objects.filter(bed_type__name="Intensive Care Unit").count(), 2)
         self.assertEqual(Bed.objects.filter(bed_type__name="Intermediate Care").count(), 3)
         self.assertEqual(Bed.objects.available().count(), 5)
+
+    def test_occupancy_counters_follow_bed_changes(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        self.assertEqual(icu.occupancy, {
+            Bed.StateChoices.OUT_OF_SERVICE: 0,
+            Bed.StateChoices.ASSIGNED: 0,
+            Bed.StateChoices.AVAILABLE: 2,
+        })
+
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        bed = admission.assign_bed(icu)
+        self.assertEqual(icu.number_assigned, 1)
+        self.assertEqual(icu.number_available, 1)
+
+        bed.leave_bed()
+        self.assertEqual(icu.number_assigned, 0)
+        self.assertEqual(icu.number_out_of_service, 1)
+
+        bed.refresh_from_db()
+        bed.state = Bed.StateChoices.AVAILABLE
+        bed.save()
+        self.assertEqual(icu.number_out_of_service, 0)
+        self.assertEqual(icu.number_available, 2)
+
+        self.assertEqual(BedOccupancy.objects.verify(), [])
+
+    def test_occupancy_counters_with_stale_instances(self):
+        bed = Bed.objects.filter(bed_type__name='Intensive Care Unit').first()
+        stale = Bed.objects.get(pk=bed.pk)
+
+        bed.state, bed.reason = Bed.StateChoices.OUT_OF_SERVICE, Bed.ReasonChoices.CLEANING
+        bed.save()
+        # Loaded as available, but the bed is already out of service
+        stale.state, stale.reason = Bed.StateChoices.OUT_OF_SERVICE, Bed.ReasonChoices.EQUIP_FAIL
+        stale.save()
+
+        self.assertEqual(BedOccupancy.objects.verify(), [])
+
+    def test_occupancy_read_uses_one_query(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        with self.assertNumQueries(1):
+            self.assertEqual(icu.number_available, 2)
+
+        icu = BedType.objects.prefetch_related('occupancy_counters').get(name='Intensive Care Unit')
+        with self.assertNumQueries(0):
+            self.assertEqual(icu.number_available, 2)
+            self.assertEqual(icu.number_assigned, 0)
+
+    def test_rebuild_bed_occupancy_command(self):
+        # A queryset update bypasses Bed.save, making the counters drift
+        Bed.objects.filter(bed_type__name='Intermediate Care').update(state=Bed.StateChoices.OUT_OF_SERVICE)
+        self.assertEqual(len(BedOccupancy.objects.verify()), 2)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_bed_occupancy', '--check', stdout=StringIO())
+
+        call_command('rebuild_bed_occupancy', stdout=StringIO())
+        self.assertEqual(BedOccupancy.objects.verify(), [])
+        self.assertEqual(BedType.objects.get(name='Intermediate Care').number_out_of_service, 3)
+
+    def test_bed_type_list_query_count_is_constant(self):
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+
+        with CaptureQueriesContext(connection) as two_types:
+            response = client.get(reverse('v1:bed-type-list'))
+        self.assertEqual(len(response.json()), 2)
+
+        for i in range(5):
+            BedType.objects.create(name=f'Ward {i}', total=1, current_user=self.test_user)
+
+        with self.assertNumQueries(len(two_types)):
+            response = client.get(reverse('v1:bed-type-list'))
+        self.assertEqual(len(response.json()), 7)
+
+    def test_bed_list_query_count_is_constant(self):
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        ward = BedType.objects.create(name='Ward', severity_match='GREEN', total=6, current_user=self.test_user)
+
+        def admit(bed_type, severity, name):
+            patient = Patient.objects.create(current_user=self.test_user)
+            PersonalData.objects.create(patient=patient, first_name=name, last_name='Doe', gender='F',
+                                        date_of_birth=date(1980, 1, 1), current_user=self.test_user)
+            admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+            HealthSnapshot.objects.create(admission=admission, severity=severity, current_user=self.test_user)
+            admission.assign_bed(bed_type)
+            return admission
+
+        admit(icu, 'RED', 'Ann')
+        with CaptureQueriesContext(connection) as one_assigned:
+            response = client.get(reverse('v1:bed-list'))
+        self.assertEqual(len(response.json()), 11)
+
+        admissions = [admit(ward, 'GREEN', f'Patient {i}') for i in range(5)]
+        with self.assertNumQueries(len(one_assigned)):
+            response = client.get(reverse('v1:bed-list'))
+
+        beds = {bed['id']: bed for bed in response.json()}
+        admission = admissions[0]
+        current_admission = beds[str(admission.current_bed.pk)]['current_admission']
+        self.assertEqual(current_admission['id'], str(admission.pk))
+        self.assertEqual(current_admission['current_severity'], 'GREEN')
+        self.assertEqual(current_admission['current_bed'], str(admission.current_bed.pk))
+        self.assertEqual(current_admission['patient_display'], 'Patient 0 Doe')
+        self.assertEqual(sum(bed['current_admission'] is not None for bed in beds.values()), 6)
+
+    def test_bed_type_list_counts(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        patient = Patient.objects.create(current_user=self.test_user)
+        Admission.objects.create(patient=patient, current_user=self.test_user).assign_bed(icu)
+        waiting = Admission.objects.create(patient=patient, current_user=self.test_user)
+        HealthSnapshot.objects.create(admission=waiting, severity='RED', current_user=self.test_user)
+        WaitingListEntry.objects.enqueue(waiting, icu)
+        # Not queued, so not waiting whatever its severity
+        unqueued = Admission.objects.create(patient=patient, current_user=self.test_user)
+        HealthSnapshot.objects.create(admission=unqueued, severity='RED', current_user=self.test_user)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        results = {bt['name']: bt for bt in client.get(reverse('v1:bed-type-list')).json()}
+
+        self.assertEqual(
+            [results['Intensive Care Unit'][key] for key in
+             ['number_available', 'number_assigned', 'number_out_of_service', 'number_waiting', 'is_available']],
+            [1, 1, 0, 1, True]
+        )
+        self.assertEqual(results['Intermediate Care']['number_waiting'], 0)
+        self.assertEqual(icu.number_waiting, 1)
+
+    def test_admin_frees_a_bed_for_the_waiting_list(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        patient = Patient.objects.create(current_user=self.test_user)
+        occupant, _ = [Admission.objects.create(patient=patient, current_user=self.test_user).assign_bed(icu)
+                       for _ in range(2)]
+        waiting = Admission.objects.create(patient=patient, current_user=self.test_user)
+        self.assertIsNone(waiting.request_bed(icu))
+        self.assertEqual(icu.number_waiting, 1)
+        occupant.leave_bed()
+
+        request = RequestFactory().post('/')
+        request.user = self.test_user
+        response = BedsAdmin(Bed, admin_site).set_to_available(request, occupant.pk)
+        self.assertEqual(response.status_code, 302)
+
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.current_bed, occupant)
+        self.assertEqual(waiting.assignments.get().creator, self.test_user)
+        self.assertEqual(icu.number_waiting, 0)
+
+        # Without a user to record the assignment on, the bed is not freed
+        waiting.current_bed.leave_bed()
+        WaitingListEntry.objects.enqueue(Admission.objects.create(patient=patient, current_user=self.test_user), icu)
+        bed = Bed.objects.get(pk=occupant.pk)
+        bed.state = Bed.StateChoices.AVAILABLE
+        with self.assertRaises(ValueError):
+            bed.save()
+        self.assertEqual(Bed.objects.get(pk=bed.pk).state, Bed.StateChoices.OUT_OF_SERVICE)
+
+    def test_bulk_provisioning(self):
+        with CaptureQueriesContext(connection) as queries:
+            ward = BedType.objects.create(name='Large ward', total=1200, current_user=self.test_user)
+        # A few batched inserts instead of two inserts per bed
+        self.assertLess(len(queries), 50)
+
+        self.assertEqual(ward.beds.count(), 1200)
+        self.assertEqual(Bed.history.filter(bed_type=ward, history_type='+').count(), 1200)
+        self.assertEqual(ward.number_available, 1200)
+        self.assertEqual(BedOccupancy.objects.verify(), [])
+
+    def test_shrink_and_grow_bed_type(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        patient = Patient.objects.create(current_user=self.test_user)
+        Admission.objects.create(patient=patient, current_user=self.test_user).assign_bed(icu)
+
+        icu.total = 0
+        icu.current_user = self.test_user
+        icu.save()
+        # The assigned bed cannot be retired
+        self.assertEqual(icu.beds.filter(reason=Bed.ReasonChoices.RETIRED).count(), 1)
+        self.assertEqual((icu.number_assigned, icu.number_available), (1, 0))
+
+        icu.total = 3
+        self.assertEqual(icu.provision_beds(), {'created': 1, 'reinstated': 1, 'retired': 0})
+        self.assertEqual((icu.number_assigned, icu.number_available, icu.beds.count()), (1, 2, 3))
+        self.assertEqual(BedOccupancy.objects.verify(), [])
+
+    def test_provision_beds_command_and_action(self):
+        call_command('provision_beds', 'Recovery:4:GREEN', 'Intensive Care Unit:1',
+                     '--user', self.test_user.username, stdout=StringIO())
+        recovery = BedType.objects.get(name='Recovery')
+        self.assertEqual((recovery.severity_match, recovery.number_available), ('GREEN', 4))
+        self.assertEqual(BedType.objects.get(name='Intensive Care Unit').number_available, 1)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        response = client.post(reverse('v1:bed-type-provision', kwargs={'pk': recovery.pk}), {'total': 6})
+        data = response.json()
+        self.assertEqual({key: data[key] for key in ['created', 'reinstated', 'retired']},
+                         {'created': 2, 'reinstated': 0, 'retired': 0})
+        self.assertEqual((data['bed_type']['total'], data['bed_type']['number_available']), (6, 6))
+        recovery = BedType.objects.get(name='Recovery')
+        self.assertEqual((recovery.total, recovery.modifier), (6, self.test_user))
+        self.assertEqual(recovery.history.first().total, 6)
+
+    def test_update_bed_type_total_returns_new_counts(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        patient = Patient.objects.create(current_user=self.test_user)
+        Admission.objects.create(patient=patient, current_user=self.test_user).assign_bed(icu)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        response = client.patch(reverse('v1:bed-type-detail', kwargs={'pk': icu.pk}), {'total': 5})
+        data = response.json()
+        self.assertEqual([data[key] for key in ['total', 'number_available', 'number_assigned', 'is_available']],
+                         [5, 4, 1, True])
+
+        response = client.patch(reverse('v1:bed-type-detail', kwargs={'pk': icu.pk}), {'total': 1})
+        self.assertEqual([response.json()[key] for key in ['number_available', 'number_assigned', 'is_available']],
+                         [0, 1, False])
+
+    def test_bed_type_catalog(self):
+        self.assertEqual([bed_type.name for bed_type in catalog.get_bed_types()],
+                         ['Intensive Care Unit', 'Intermediate Care'])
+        with self.assertNumQueries(0):
+            catalog.get_bed_types()
+
+        # Saving and deleting bed types refreshes the catalog
+        recovery = BedType.objects.create(name='Recovery', severity_match='GREEN', total=0,
+                                          current_user=self.test_user)
+        self.assertIn(('Recovery', 'GREEN'), [(b.name, b.severity_match) for b in catalog.get_bed_types()])
+        recovery.delete()
+        self.assertEqual(len(catalog.get_bed_types()), 2)
+
+        # A rename made by another process does not bump the version of a local memory cache: the
+        # catalog of this process and its cache entry expire instead
+        with self.settings(BED_TYPE_CATALOG_CACHE_TIMEOUT=0):
+            catalog.bump_version()
+            catalog.get_bed_types()
+            BedType.objects.filter(name='Intermediate Care').update(name='Step-down Unit')
+            self.assertIn('Step-down Unit', [bed_type.name for bed_type in catalog.get_bed_types()])
@@ -1,4 +1,6 @@
-from rest_framework import viewsets, permissions, mixins
+from rest_framework import viewsets, permissions, mixins, serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from equipment.models import Bed, BedType
 from equipment.serializers import BedSerializer, BedTypeSerializer
@@ -7,15 +9,39 @@ equipment_permissions = [permissions.DjangoModelPermissions]
 
 
 class BedViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
-    queryset = Bed.objects.all()
+    queryset = Bed.objects.for_board()
     serializer_class = BedSerializer
 
     permission_classes = equipment_permissions
 
 
 class BedTypeViewSet(ModelViewSet):
-    queryset = BedType.objects.all()
+    queryset = BedType.objects.with_occupancy()
     serializer_class = BedTypeSerializer
 
     permission_classes = equipment_permissions
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # The occupancy annotations were read before the beds were provisioned to the new total
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    @action(detail=True, methods=['post'])
+    def provision(self, request, pk=None):
+        """Create or retire beds in bulk to match the bed type total, optionally changing the total first.
+
+        Returns the numbers of beds created, reinstated and retired, and the bed type with its new counts.
+        """
+        bed_type = self.get_object()
+        bed_type.current_user = request.user
+
+        total = request.data.get('total')
+        if total is None:
+            provisioned = bed_type.provision_beds()
+        else:
+            bed_type.total = serializers.IntegerField(min_value=0).run_validation(total)
+            bed_type.save()
+            provisioned = bed_type.provisioned
+
+        bed_type = self.get_queryset().get(pk=bed_type.pk)
+        return Response(dict(provisioned, bed_type=self.get_serializer(bed_type).data))
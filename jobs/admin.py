@@ -0,0 +1,28 @@
+from django.contrib import admin
+
+from jobs.models import Job
+from project.admin import admin_site
+
+
+@admin.register(Job, site=admin_site)
+class JobAdmin(admin.ModelAdmin):
+    list_display = [
+        'name',
+        'state',
+        'attempts',
+        'run_after',
+        'created',
+        'finished_at',
+    ]
+
+    list_filter = [
+        'state',
+        'name',
+    ]
+
+    readonly_fields = [
+        'last_error',
+    ]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.models import Job
+from jobs.queue import run
+
+
+class Command(BaseCommand):
+    help = 'Run the background jobs: pending ones, retries, and those abandoned by crashed processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Number of jobs run at the same time, 1 to run them in the main thread')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait before polling again when no job is due')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        succeeded = failed = 0
+
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='jobs') as executor:
+            run_all = executor.map if threads > 1 else map
+            while True:
+                jobs = Job.objects.claim(limit=threads)
+                if not jobs:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['interval'])
+                    continue
+
+                for ok in run_all(run, jobs):
+                    if ok:
+                        succeeded += 1
+                    else:
+                        failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{succeeded} job(s) done, {failed} failed'))
@@ -0,0 +1,104 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone as tz
+
+
+class Job(models.Model):
+    """A call to a task, run in the background by the in-process thread pool or by `run_jobs` workers.
+
+    Jobs are written in the transaction that requests them, so they are not lost once it commits,
+    and handed to the thread pool after the commit. A running job is invisible to the other workers
+    until `locked_until`: past that visibility timeout it is considered abandoned (e.g. the process
+    crashed) and is claimed again. Failed jobs are retried with an exponential backoff, up to
+    `max_attempts` attempts.
+    """
+
+    class StateChoices(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    class JobManager(models.Manager):
+
+        def due(self):
+            """Jobs waiting to run, and running jobs whose visibility timeout expired"""
+            now = tz.now()
+            return self.get_queryset().filter(
+                Q(state=Job.StateChoices.PENDING, run_after__lte=now) |
+                Q(state=Job.StateChoices.RUNNING, locked_until__lt=now)
+            )
+
+        @transaction.atomic
+        def claim(self, limit=1, pk=None):
+            """Lock due jobs for the current worker and return them, oldest first.
+
+            Jobs claimed concurrently by other workers are skipped. Each claimed job gets a new
+            `lock_token`, so that a worker whose job was claimed again cannot complete it.
+            """
+            qs = self.due().order_by('run_after')
+            if pk is not None:
+                qs = qs.filter(pk=pk)
+            if connection.features.has_select_for_update_skip_locked:
+                qs = qs.select_for_update(skip_locked=True)
+            jobs = list(qs[:limit])
+
+            locked_until = tz.now() + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT)
+            for job in jobs:
+                job.state = Job.StateChoices.RUNNING
+                job.attempts += 1
+                job.locked_until = locked_until
+                job.lock_token = uuid.uuid4()
+                self.filter(pk=job.pk).update(state=job.state, attempts=F('attempts') + 1,
+                                              locked_until=locked_until, lock_token=job.lock_token)
+            return jobs
+
+    objects = JobManager()
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+
+    state = models.CharField(max_length=7, choices=StateChoices.choices, default=StateChoices.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=tz.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    lock_token = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['state', 'run_after'], name='job_state_run_after'),
+            models.Index(fields=['state', 'locked_until'], name='job_state_locked_until'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.state})'
+
+    def _finish(self, **changes):
+        """Apply the outcome of an attempt, unless the job has been claimed again since"""
+        return bool(Job.objects.filter(pk=self.pk, lock_token=self.lock_token).update(
+            locked_until=None, lock_token=None, **changes))
+
+    def complete(self):
+        self.state = Job.StateChoices.DONE
+        return self._finish(state=self.state, finished_at=tz.now())
+
+    def fail(self, error):
+        """Record a failed attempt, and schedule a retry unless the attempts are exhausted"""
+        self.last_error = error
+        if self.attempts >= self.max_attempts:
+            self.state = Job.StateChoices.FAILED
+            return self._finish(state=self.state, last_error=error, finished_at=tz.now())
+        self.state = Job.StateChoices.PENDING
+        self.run_after = tz.now() + timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (self.attempts - 1))
+        return self._finish(state=self.state, last_error=error, run_after=self.run_after)
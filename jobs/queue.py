@@ -0,0 +1,87 @@
+"""Registration, enqueueing and running of background tasks.
+
+A task is a function decorated with `@task`, declared in the `tasks` module of an app. Its arguments
+must be JSON serializable (e.g. primary keys rather than instances):
+
+    @task
+    def render_barcode_image(admission_id):
+        ...
+
+    enqueue(render_barcode_image, str(admission.pk))
+
+`enqueue` writes a `Job` in the current transaction and, once it commits, hands it to a thread pool
+of `JOBS_THREADS` threads in the current process. With `JOBS_THREADS = 0` jobs are only run by the
+`run_jobs` workers, which also pick up the jobs of crashed processes and the retries.
+
+With `JOBS_INLINE`, the default on SQLite, jobs are run by the thread enqueueing them right after its
+transaction commits instead, so that the database never has two writers in the same process.
+"""
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def task(func):
+    """Register a function as a task"""
+    func.task_name = f'{func.__module__}.{func.__qualname__}'
+    registry[func.task_name] = func
+    return func
+
+
+def enqueue(func, *args, max_attempts=None, **kwargs):
+    """Run a task in the background once the current transaction commits"""
+    job = Job.objects.create(name=func.task_name, args=list(args), kwargs=kwargs,
+                             max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS)
+    if settings.JOBS_INLINE:
+        transaction.on_commit(lambda: run_pending(job.pk))
+    elif settings.JOBS_THREADS:
+        transaction.on_commit(lambda: get_executor().submit(run_claimed, job.pk))
+    return job
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOBS_THREADS, thread_name_prefix='jobs')
+        return _executor
+
+
+def run(job):
+    """Run a claimed job and record the outcome. Returns True if the task succeeded."""
+    try:
+        registry[job.name](*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Job %s (%s) failed, attempt %s of %s', job.pk, job.name, job.attempts, job.max_attempts)
+        job.fail(traceback.format_exc())
+        return False
+    job.complete()
+    return True
+
+
+def run_pending(pk):
+    """Claim and run a job, if no worker took it already"""
+    for job in Job.objects.claim(pk=pk):
+        run(job)
+
+
+def run_claimed(pk):
+    """Claim and run a job in a thread of the pool"""
+    close_old_connections()
+    try:
+        run_pending(pk)
+    finally:
+        close_old_connections()
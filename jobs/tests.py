@@ -0,0 +1,77 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone as tz
+
+from jobs.models import Job
+from jobs.queue import enqueue, task
+
+calls = []
+
+
+@task
+def record(value, fail_first=0):
+    calls.append(value)
+    if calls.count(value) <= fail_first:
+        raise RuntimeError(f'{value} failed')
+
+
+@override_settings(JOBS_INLINE=False, JOBS_THREADS=2, JOBS_MAX_ATTEMPTS=2, JOBS_RETRY_DELAY=60)
+class JobsTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def run_jobs(self):
+        call_command('run_jobs', '--once', '--threads', '1', stdout=StringIO())
+
+    def test_enqueued_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = enqueue(record, 'a')
+        # The job is stored with the transaction and handed to the thread pool after the commit
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Job.objects.get().state, Job.StateChoices.PENDING)
+
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts, calls), (Job.StateChoices.DONE, 1, ['a']))
+
+    def test_run_inline(self):
+        with self.settings(JOBS_INLINE=True), self.captureOnCommitCallbacks(execute=True):
+            job = enqueue(record, 'i')
+            # Not run before the commit
+            self.assertEqual(calls, [])
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts, calls), (Job.StateChoices.DONE, 1, ['i']))
+
+    def test_retry(self):
+        job = enqueue(record, 'b', fail_first=5)
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (Job.StateChoices.PENDING, 1))
+        self.assertIn('b failed', job.last_error)
+        self.assertGreater(job.run_after, tz.now() + timedelta(seconds=50))
+
+        # Not due before its retry delay
+        self.run_jobs()
+        self.assertEqual(calls, ['b'])
+
+        Job.objects.update(run_after=tz.now())
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts, calls), (Job.StateChoices.FAILED, 2, ['b', 'b']))
+
+    def test_visibility_timeout(self):
+        enqueue(record, 'c')
+        [abandoned] = Job.objects.claim()
+        self.assertEqual(Job.objects.claim(), [])
+
+        # The worker running it crashed: once its lock expires, the job is run again
+        Job.objects.update(locked_until=tz.now() - timedelta(seconds=1))
+        self.run_jobs()
+        self.assertEqual(calls, ['c'])
+        # The first worker cannot overwrite the outcome anymore
+        self.assertFalse(abandoned.fail('too late'))
+        self.assertEqual(Job.objects.get().state, Job.StateChoices.DONE)
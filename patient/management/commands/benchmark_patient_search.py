@@ -0,0 +1,114 @@
+import random
+import uuid
+from itertools import product
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from custom_auth.utils import get_user_model
+from patient.models import PatientIdentifier, PersonalData, Patient, Phone
+from patient.search import PHONE_NUMBER_DIGITS, normalize_name, search_patient_ids, soundex
+
+FIRST_NAMES = [
+    'Aisha', 'Amelia', 'Ana', 'Chloé', 'Daniel', 'David', 'Elif', 'Emma', 'François', 'Grace', 'Hannah', 'Ivan',
+    'Jack', 'James', 'José', 'Leila', 'Liam', 'Lucas', 'Maria', 'Mohammed', 'Noah', 'Olivia', 'Oscar', 'Priya',
+    'Sofia', 'Thomas', 'Wei', 'Yusuf', 'Zoë', 'Zoe',
+]
+SYLLABLES = ['al', 'bar', 'ber', 'cal', 'dan', 'fer', 'gar', 'hal', 'kin', 'lo', 'mar', 'nel', 'ow', 'par',
+             'ros', 'sen', 'smi', 'ther', 'van', 'wil']
+ENDINGS = ['', 'son', 'ley', 'ton', 'ez', 'ski', 'th']
+
+
+class Command(BaseCommand):
+    help = 'Time patient searches by name, misspelled name, name and date of birth, phone number and ' \
+           'identifier among the given number of synthetic patients. Everything is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000000)
+        parser.add_argument('--searches', type=int, default=200, help='Searches timed of each kind')
+        parser.add_argument('--user', default='admin', help='Username creating the patients')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+        if connection.vendor != 'postgresql':
+            raise CommandError('The synthetic patients are generated with PostgreSQL')
+
+        with transaction.atomic():
+            self.run(user, options)
+            transaction.set_rollback(True)
+
+    def run(self, user, options):
+        last_names = [(first + second + ending).capitalize()
+                      for first, second, ending in product(SYLLABLES, SYLLABLES, ENDINGS)]
+        started_at = perf_counter()
+        self.fill(user, last_names, options['patients'])
+        self.stdout.write(f'{options["patients"]} patients generated in {perf_counter() - started_at:.0f}s')
+
+        count = options['patients']
+        searches = {
+            'last name': lambda: random.choice(last_names),
+            'first and last name': lambda: f'{random.choice(FIRST_NAMES)} {random.choice(last_names)}',
+            'name prefixes': lambda: f'{random.choice(FIRST_NAMES)[:2]} {random.choice(last_names)[:4]}',
+            'misspelled name': lambda: random.choice(last_names).replace('a', 'e', 1).replace('i', 'y', 1),
+            'name and date of birth': lambda: f'{random.choice(last_names)} '
+                                              f'{random.randint(1, 28):02}/{random.randint(1, 12):02}/1980',
+            'phone number': lambda: f'07700 {random.randrange(count):06}',
+            'identifier': lambda: f'nhs-{random.randrange(count):08}',
+        }
+        for kind, make_query in searches.items():
+            durations, found = [], 0
+            for _ in range(options['searches']):
+                query = make_query()
+                started_at = perf_counter()
+                found += bool(search_patient_ids(query))
+                durations.append((perf_counter() - started_at) * 1000)
+            durations.sort()
+            percentile = {p: durations[max(int(len(durations) * p / 100) - 1, 0)] for p in [50, 95, 99]}
+            self.stdout.write(f'{kind}: p50 {percentile[50]:.2f}ms, p95 {percentile[95]:.2f}ms, '
+                              f'p99 {percentile[99]:.2f}ms, {found} of {len(durations)} found')
+
+    def fill(self, user, last_names, count):
+        """Insert `count` patients with personal data, a phone number and an identifier, in SQL"""
+        # Keys computed in Python, as PostgreSQL does not compute the Soundex code without fuzzystrmatch
+        names = {
+            'first_names': FIRST_NAMES, 'last_names': last_names,
+            'first_name_keys': [normalize_name(name) for name in FIRST_NAMES],
+            'last_name_keys': [normalize_name(name) for name in last_names],
+            'first_name_sounds': [soundex(name) for name in FIRST_NAMES],
+            'last_name_sounds': [soundex(name) for name in last_names],
+        }
+        params = dict(names, now=timezone.now(), user=user.pk, rows=count, salt=uuid.uuid4().hex,
+                      phone_digits=PHONE_NUMBER_DIGITS,
+                      first_count=len(FIRST_NAMES), last_count=len(last_names))
+        patient_id = "md5(%(salt)s || i)::uuid"
+        # Last names cycle through the list more slowly than first names, for every combination to exist
+        first, last = '1 + i %% %(first_count)s', '1 + (i / %(first_count)s) %% %(last_count)s'
+        statements = [
+            (Patient, 'id, created, modified, is_removed, creator_id',
+             f"{patient_id}, %(now)s, %(now)s, false, %(user)s"),
+            (PersonalData, 'id, created, modified, creator_id, patient_id, first_name, last_name, gender, '
+                           'date_of_birth, first_name_key, last_name_key, first_name_sound, last_name_sound',
+             f"md5(%(salt)s || 'd' || i)::uuid, %(now)s, %(now)s, %(user)s, {patient_id}, "
+             f"(%(first_names)s::text[])[{first}], (%(last_names)s::text[])[{last}], 'O', "
+             f"date '1950-01-01' + i %% 20000, (%(first_name_keys)s::text[])[{first}], "
+             f"(%(last_name_keys)s::text[])[{last}], (%(first_name_sounds)s::text[])[{first}], "
+             f"(%(last_name_sounds)s::text[])[{last}]"),
+            (Phone, 'id, created, modified, creator_id, patient_id, phone_number, phone_type, phone_number_key',
+             f"md5(%(salt)s || 'p' || i)::uuid, %(now)s, %(now)s, %(user)s, {patient_id}, "
+             f"'+44 7700 ' || lpad(i::text, 6, '0'), 'mobile', "
+             f"right('447700' || lpad(i::text, 6, '0'), %(phone_digits)s)"),
+            (PatientIdentifier, 'id, created, modified, creator_id, patient_id, identifier, id_type, identifier_key',
+             f"md5(%(salt)s || 'i' || i)::uuid, %(now)s, %(now)s, %(user)s, {patient_id}, "
+             f"'nhs-' || lpad(i::text, 8, '0'), 'NHS', 'NHS' || lpad(i::text, 8, '0')"),
+        ]
+        with connection.cursor() as cursor:
+            for model, columns, values in statements:
+                table = model._meta.db_table
+                cursor.execute(f'INSERT INTO "{table}" ({columns}) SELECT {values} '
+                               f'FROM generate_series(0, %(rows)s - 1) AS i', params)
+                cursor.execute(f'ANALYZE "{table}"')
@@ -0,0 +1,174 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:31
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Copies of the keys of `patient.search` as of this migration, so that later changes to them
+# do not change what the migration computes
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+PHONE_NUMBER_DIGITS = 9
+
+
+def normalize_name(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if char.isascii() and char.isalnum()).lower()
+
+
+def normalize_identifier(value):
+    return normalize_name(value).upper()
+
+
+def normalize_phone_number(value):
+    return re.sub(r'\D', '', value or '')[-PHONE_NUMBER_DIGITS:]
+
+
+def soundex(value):
+    letters = [char for char in normalize_name(value) if char.isalpha()]
+    if not letters:
+        return ''
+    code, previous = letters[0].upper(), SOUNDEX_CODES.get(letters[0])
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char)
+        if digit and digit != previous:
+            code += digit
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def update_in_batches(model, fields, set_keys, batch_size=1000):
+    batch = []
+    for instance in model.objects.iterator(chunk_size=batch_size):
+        set_keys(instance)
+        batch.append(instance)
+        if len(batch) == batch_size:
+            model.objects.bulk_update(batch, fields)
+            batch = []
+    model.objects.bulk_update(batch, fields)
+
+
+def set_personal_data_keys(data):
+    data.first_name_key, data.last_name_key = normalize_name(data.first_name), normalize_name(data.last_name)
+    data.first_name_sound, data.last_name_sound = soundex(data.first_name), soundex(data.last_name)
+
+
+def set_phone_key(phone):
+    phone.phone_number_key = normalize_phone_number(phone.phone_number)
+
+
+def set_identifier_key(identifier):
+    identifier.identifier_key = normalize_identifier(identifier.identifier)
+
+
+def set_search_keys(apps, schema_editor):
+    """Normalize the names, phone numbers and identifiers already recorded"""
+    update_in_batches(apps.get_model('patient', 'PersonalData'),
+                      ['first_name_key', 'last_name_key', 'first_name_sound', 'last_name_sound'],
+                      set_personal_data_keys)
+    update_in_batches(apps.get_model('patient', 'Phone'), ['phone_number_key'], set_phone_key)
+    update_in_batches(apps.get_model('patient', 'PatientIdentifier'), ['identifier_key'], set_identifier_key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0006_auto_20200422_2010'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalpatientidentifier',
+            name='identifier_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='historicalpersonaldata',
+            name='first_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='historicalpersonaldata',
+            name='first_name_sound',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='historicalpersonaldata',
+            name='last_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='historicalpersonaldata',
+            name='last_name_sound',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='historicalphone',
+            name='phone_number_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='patientidentifier',
+            name='identifier_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='personaldata',
+            name='first_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='personaldata',
+            name='first_name_sound',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='personaldata',
+            name='last_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='personaldata',
+            name='last_name_sound',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='phone_number_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='patientidentifier',
+            index=models.Index(fields=['identifier_key'], name='patient_identifier_key'),
+        ),
+        migrations.AddIndex(
+            model_name='personaldata',
+            index=models.Index(fields=['last_name_key', 'first_name_key'], name='personal_data_name_key', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='personaldata',
+            index=models.Index(fields=['first_name_key'], name='personal_data_first_name_key', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='personaldata',
+            index=models.Index(fields=['last_name_sound'], name='personal_data_last_name_sound'),
+        ),
+        migrations.AddIndex(
+            model_name='personaldata',
+            index=models.Index(fields=['first_name_sound'], name='personal_data_first_name_sound'),
+        ),
+        migrations.AddIndex(
+            model_name='personaldata',
+            index=models.Index(fields=['date_of_birth'], name='personal_data_date_of_birth'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['phone_number_key'], name='phone_number_key'),
+        ),
+        migrations.RunPython(set_search_keys, migrations.RunPython.noop),
+    ]
@@ -4,8 +4,11 @@ import hashlib
 from django.db import transaction
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, When
+from model_utils.managers import SoftDeletableManager
 
 from common.base_models import ImmutableBaseModel, CurrentBaseModel
+from patient.search import normalize_identifier, normalize_name, normalize_phone_number, soundex
 
 
 class Patient(ImmutableBaseModel):
@@ -13,7 +16,26 @@ class Patient(ImmutableBaseModel):
     Patient record, ties all patient related info together.
     """
 
-    class PatientManager(models.Manager):
+    class PatientManager(SoftDeletableManager):
+
+        def with_current_admission(self):
+            """Patients with what `PatientSerializer` displays loaded up front: the id of the current
+            admission annotated in SQL, personal data, contacts and users
+            """
+            import patient_tracker.models
+
+            current_admission = patient_tracker.models.Admission.objects \
+                .filter(patient=OuterRef('pk')).order_by('-created', '-id') \
+                .annotate(current_id=Case(When(admitted=True, then=F('id')))).values('current_id')[:1]
+
+            qs = self.get_queryset()
+            qs = qs.annotate(current_admission_id=Subquery(current_admission, output_field=models.UUIDField()))
+            qs = qs.select_related('creator', 'personal_data')
+            qs = qs.prefetch_related(
+                'creator__groups', 'creator__user_permissions',
+                'patient_identifiers', 'phones', 'next_of_kin_contacts',
+            )
+            return qs
 
         @transaction.atomic
         def start_new_patient_admission(current_user=None):
@@ -36,19 +58,30 @@ class Patient(ImmutableBaseModel):
             patient_tracker.models.Admission.objects.create(patient=patient, current_user=current_user)
             return patient
 
+    objects = PatientManager()
+
     class Meta:
         ordering = ['-created']
 
     @property
     def current_admission(self):
-        admission = self.admissions.first()
-        if not admission.admitted:
-            admission = None
+        """Latest admission of the patient, unless it was not admitted"""
+        admission = self.admissions.order_by('-created', '-id').first()
+        if admission is None or not admission.admitted:
+            return None
         return admission
 
     @property
     def current_admission_id(self):
-        return self.current_admission.id
+        if hasattr(self, '_current_admission_id'):
+            return self._current_admission_id
+        admission = self.current_admission
+        return admission.id if admission else None
+
+    @current_admission_id.setter
+    def current_admission_id(self, value):
+        # Set by the annotation of `with_current_admission`
+        self._current_admission_id = value
 
 
 class PatientIdentifier(CurrentBaseModel):
@@ -56,6 +89,17 @@ class PatientIdentifier(CurrentBaseModel):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='patient_identifiers')
     identifier = models.CharField(max_length=50, null=False)
     id_type = models.CharField(max_length=50, null=False)
+    # Searched identifier, see `patient.search`
+    identifier_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['identifier_key'], name='patient_identifier_key'),
+        ]
+
+    def save(self, **kwargs):
+        self.identifier_key = normalize_identifier(self.identifier)
+        super().save(**kwargs)
 
 
 class PersonalData(CurrentBaseModel):
@@ -70,6 +114,48 @@ class PersonalData(CurrentBaseModel):
     gender = models.CharField(max_length=1, choices=GenderChoices.choices)
     date_of_birth = models.DateField(auto_now=False, auto_now_add=False)
 
+    # Searched names and their Soundex codes, see `patient.search`
+    first_name_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+    last_name_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+    first_name_sound = models.CharField(max_length=4, blank=True, default='', editable=False)
+    last_name_sound = models.CharField(max_length=4, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # The pattern operator class lets PostgreSQL match prefixes with the index whatever the collation
+            models.Index(fields=['last_name_key', 'first_name_key'], name='personal_data_name_key',
+                         opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+            models.Index(fields=['first_name_key'], name='personal_data_first_name_key',
+                         opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['last_name_sound'], name='personal_data_last_name_sound'),
+            models.Index(fields=['first_name_sound'], name='personal_data_first_name_sound'),
+            models.Index(fields=['date_of_birth'], name='personal_data_date_of_birth'),
+        ]
+
+    @property
+    def display_name(self):
+        return f'{self.first_name} {self.last_name}'
+
+    @transaction.atomic
+    def save(self, **kwargs):
+        self.first_name_key, self.last_name_key = normalize_name(self.first_name), normalize_name(self.last_name)
+        self.first_name_sound, self.last_name_sound = soundex(self.first_name), soundex(self.last_name)
+        super().save(**kwargs)
+
+        import patient_tracker.models
+
+        patient_tracker.models.Admission.objects.filter(patient=self.patient_id) \
+            .update(display_name=self.display_name)
+
+    @transaction.atomic
+    def delete(self, **kwargs):
+        result = super().delete(**kwargs)
+
+        import patient_tracker.models
+
+        patient_tracker.models.Admission.objects.filter(patient=self.patient_id).update(display_name='')
+        return result
+
 
 class Phone(CurrentBaseModel):
     """
@@ -80,6 +166,17 @@ class Phone(CurrentBaseModel):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='phones')
     phone_number = models.CharField(max_length=50)
     phone_type = models.CharField(max_length=10)
+    # Searched phone number, see `patient.search`
+    phone_number_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['phone_number_key'], name='phone_number_key'),
+        ]
+
+    def save(self, **kwargs):
+        self.phone_number_key = normalize_phone_number(self.phone_number)
+        super().save(**kwargs)
 
 
 class NextOfKinContact(CurrentBaseModel):
@@ -0,0 +1,138 @@
+"""Search of the patients by name, date of birth, phone number and identifier.
+
+Names, phone numbers and identifiers are stored along with a normalized key, set on save and
+indexed: names lowercased without accents, spaces or punctuation (`Zoë O'Brien` is `zoe` `obrien`),
+phone numbers as their last 9 digits, so that they match with or without the country code or the
+trunk prefix, identifiers uppercased without spaces or punctuation. Names also get their Soundex
+code, so that misspelled names sounding alike (`Smyth` for `Smith`) match.
+
+A query is split into terms. Terms holding a digit are looked up as identifiers and phone
+numbers, and dates (`YYYY-MM-DD` or `DD/MM/YYYY`) as dates of birth. Each other term must match
+the first or last name of a patient, in order of rank: the whole name, a prefix of it, or its
+Soundex code. Patients are ranked by the kind of their matches, identifiers and phone numbers
+first, then by name.
+"""
+import operator
+import re
+import unicodedata
+from datetime import datetime
+from functools import reduce
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y']
+
+# Trailing digits of the phone numbers compared
+PHONE_NUMBER_DIGITS = 9
+# Shortest term matched as a name prefix, shorter ones only match whole names
+MIN_PREFIX_LENGTH = 2
+# Rank of a name term: whole name, prefix, Soundex code
+EXACT, PREFIX, SOUNDS_LIKE = 0, 1, 2
+
+
+def normalize_name(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if char.isascii() and char.isalnum()).lower()
+
+
+def normalize_identifier(value):
+    return normalize_name(value).upper()
+
+
+def normalize_phone_number(value):
+    return re.sub(r'\D', '', value or '')[-PHONE_NUMBER_DIGITS:]
+
+
+def soundex(value):
+    """American Soundex code of a name, e.g. `R163` for Robert and Rupert, empty without any letter"""
+    letters = [char for char in normalize_name(value) if char.isalpha()]
+    if not letters:
+        return ''
+    code, previous = letters[0].upper(), SOUNDEX_CODES.get(letters[0])
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char)
+        if digit and digit != previous:
+            code += digit
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_query(query):
+    """Identifier and phone number keys, dates of birth and name terms of a query"""
+    identifiers, phone_numbers, dates, names = set(), set(), set(), []
+    for term in re.split(r'[\s,;]+', query.strip()):
+        day = parse_date(term)
+        if day:
+            dates.add(day)
+        elif any(char.isdigit() for char in term):
+            if normalize_identifier(term):
+                identifiers.add(normalize_identifier(term))
+            if len(normalize_phone_number(term)) >= 6:
+                phone_numbers.add(normalize_phone_number(term))
+        elif normalize_name(term):
+            names.append(normalize_name(term))
+
+    # Phone numbers and identifiers are often typed with spaces
+    if not names and not dates and any(char.isdigit() for char in query):
+        identifiers.add(normalize_identifier(query))
+        if len(normalize_phone_number(query)) >= 6:
+            phone_numbers.add(normalize_phone_number(query))
+    return identifiers, phone_numbers, dates, names
+
+
+def name_rank(term):
+    """Condition on the personal data matching a name term, and the rank of its match"""
+    sound = soundex(term)
+    exact = Q(first_name_key=term) | Q(last_name_key=term)
+    condition = exact | Q(first_name_sound=sound) | Q(last_name_sound=sound)
+    whens = [When(exact, then=Value(EXACT))]
+    if len(term) >= MIN_PREFIX_LENGTH:
+        prefix = Q(first_name_key__startswith=term) | Q(last_name_key__startswith=term)
+        condition |= prefix
+        whens.append(When(prefix, then=Value(PREFIX)))
+    return condition, Case(*whens, default=Value(SOUNDS_LIKE), output_field=IntegerField())
+
+
+def search_patient_ids(query, limit=20):
+    """Ids of the patients matching `query`, the best ranked first, `limit` at most"""
+    from patient.models import PatientIdentifier, PersonalData, Phone
+
+    identifiers, phone_numbers, dates, names = parse_query(query)
+    ids = []
+    if identifiers:
+        ids += PatientIdentifier.objects.filter(identifier_key__in=identifiers) \
+            .order_by('patient_id').values_list('patient_id', flat=True)[:limit]
+    if phone_numbers:
+        ids += Phone.objects.filter(phone_number_key__in=phone_numbers) \
+            .order_by('patient_id').values_list('patient_id', flat=True)[:limit]
+
+    if names or dates:
+        personal_data = PersonalData.objects.all()
+        if dates:
+            personal_data = personal_data.filter(date_of_birth__in=dates)
+        ranks = []
+        for term in names:
+            condition, rank = name_rank(term)
+            personal_data = personal_data.filter(condition)
+            ranks.append(rank)
+        ordering = ['last_name_key', 'first_name_key', 'patient_id']
+        if ranks:
+            personal_data = personal_data.annotate(rank=reduce(operator.add, ranks))
+            ordering.insert(0, 'rank')
+        ids += personal_data.order_by(*ordering).values_list('patient_id', flat=True)[:limit]
+
+    return list(dict.fromkeys(ids))[:limit]
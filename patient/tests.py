@@ -1,8 +1,13 @@
+import uuid
+from datetime import date
+
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
 
 from patient_tracker.models import Admission, HealthSnapshot
 from equipment.models import BedType, Bed
-from patient.models import Patient
+from patient.models import Patient, PersonalData, PatientIdentifier, Phone, NextOfKinContact
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 
 from common.base_tests import TestUser
@@ -84,4 +89,75 @@ class AutoAssignBedTestCase(TestCase, TestUser):
         self.assertFalse(bed)
 
 
-
+class PatientApiTestCase(TestCase, TestUser):
+
+    def create_patients(self, number):
+        for index in range(number):
+            patient = Patient.objects.create(current_user=self.test_user)
+            PersonalData.objects.create(patient=patient, first_name=f'Patient {index}', last_name='Doe', gender='O',
+                                        date_of_birth=date(1970, 1, 1), current_user=self.test_user)
+            PatientIdentifier.objects.create(patient=patient, identifier=f'ID{index}', id_type='passport',
+                                             current_user=self.test_user)
+            for phone_type in ['mobile', 'home']:
+                Phone.objects.create(patient=patient, phone_number=f'555-{index}', phone_type=phone_type,
+                                     current_user=self.test_user)
+            NextOfKinContact.objects.create(patient=patient, first_name='Jane', last_name='Doe', title='Ms',
+                                            relationship='OTHER', phone_number='555', notes='',
+                                            current_user=self.test_user)
+            Admission.objects.create(patient=patient, admitted=index % 2 == 0, current_user=self.test_user)
+
+    def test_list_queries(self):
+        self.create_patients(3)
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:patient-list')
+
+        # Count, page, creator groups and permissions, identifiers, phones and next of kin contacts
+        with self.assertNumQueries(7):
+            client.get(url, {'limit': 100})
+
+        self.create_patients(20)
+        with self.assertNumQueries(7):
+            page = client.get(url, {'limit': 100}).json()['results']
+        self.assertEqual(len(page), 23)
+
+        patients = {patient.pk: patient for patient in Patient.objects.all()}
+        for row in page:
+            patient = patients[uuid.UUID(row['id'])]
+            expected = patient.current_admission_id
+            self.assertEqual(row['current_admission_id'], str(expected) if expected else None)
+            self.assertEqual(len(row['phones']), 2)
+            self.assertEqual(row['personal_data']['last_name'], 'Doe')
+
+        with self.assertNumQueries(6):
+            client.get(reverse('v1:patient-detail', kwargs={'pk': page[0]['id']}))
+
+    def test_search(self):
+        self.create_patients(3)
+        smith = Patient.objects.create(current_user=self.test_user)
+        PersonalData.objects.create(patient=smith, first_name='Zoë', last_name="Smith-O'Brien", gender='F',
+                                    date_of_birth=date(1980, 2, 1), current_user=self.test_user)
+        Phone.objects.create(patient=smith, phone_number='+44 (0)7700 900123', phone_type='mobile',
+                             current_user=self.test_user)
+        PatientIdentifier.objects.create(patient=smith, identifier='ab-123 456', id_type='passport',
+                                         current_user=self.test_user)
+        smyth = Patient.objects.create(current_user=self.test_user)
+        PersonalData.objects.create(patient=smyth, first_name='Zoe', last_name='Smyth', gender='F',
+                                    date_of_birth=date(1990, 5, 6), current_user=self.test_user)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:patient-search')
+
+        def search(query):
+            return [row['id'] for row in client.get(url, {'q': query}).json()]
+
+        self.assertEqual(search('zoe smith'), [str(smith.pk), str(smyth.pk)])
+        self.assertEqual(search('Smithe'), [str(smyth.pk)])
+        self.assertEqual(search('smi zo'), [str(smith.pk)])
+        self.assertEqual(search('zoe 06/05/1990'), [str(smyth.pk)])
+        self.assertEqual(search('07700 900123'), [str(smith.pk)])
+        self.assertEqual(search('AB123456'), [str(smith.pk)])
+        self.assertEqual(search('ID1'), [str(Patient.objects.get(patient_identifiers__identifier='ID1').pk)])
+        self.assertEqual(search('nobody'), [])
+        self.assertEqual(client.get(url).status_code, 400)
@@ -1,7 +1,9 @@
-from rest_framework import viewsets, permissions, mixins
+from rest_framework import viewsets, permissions, mixins, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from patient.models import Patient, PersonalData, NextOfKinContact, Phone, PatientIdentifier
+from patient.search import search_patient_ids
 from patient.serializers import PatientSerializer, PersonalDataSerializer, \
     PatientIdentifierSerializer, PhoneSerializer, NextOfKinContactSerializer
 
@@ -11,7 +13,7 @@ patient_permissions = [permissions.DjangoModelPermissions]
 
 class PatientViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
 
-    queryset = Patient.objects.all()
+    queryset = Patient.objects.with_current_admission()
     serializer_class = PatientSerializer
 
     permission_classes = patient_permissions
@@ -22,6 +24,26 @@ class PatientViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.Cr
         serializer = self.get_serializer(patient)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Patients matching the terms of `q`, the best matches first, at most `limit` (default 20).
+
+        Terms are matched against identifiers, phone numbers, dates of birth (YYYY-MM-DD or
+        DD/MM/YYYY), and the start or sound of first and last names.
+        """
+        query = request.query_params.get(api_settings.SEARCH_PARAM, '')
+        if not query.strip():
+            raise serializers.ValidationError({api_settings.SEARCH_PARAM: 'Expected search terms'})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Expected a number'})
+
+        ids = search_patient_ids(query, limit)
+        patients = {patient.pk: patient for patient in self.get_queryset().filter(pk__in=ids)}
+        serializer = self.get_serializer([patients[pk] for pk in ids if pk in patients], many=True)
+        return Response(serializer.data)
+
 
 class PatientIdentifierViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
 
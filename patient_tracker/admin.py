@@ -1,15 +1,17 @@
 from common.base_admin import SaveCurrentUser, SaveCurrentUserAdmin
 from django.utils.translation import gettext_lazy as _
 from project.admin import admin_site
-from patient_tracker.models import Admission, BedAssignment, HealthSnapshot, \
+from patient_tracker.models import Admission, BedAssignment, HealthSnapshot, WaitingListEntry, \
     HealthSnapshotFile, OverallWellbeing, GradedSymptoms, RelatedConditions, CommonSymptoms
 from admin_actions.admin import ActionsModelAdmin
 from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import path, reverse, reverse_lazy
+from django.views.decorators.http import require_POST
 
-from django.shortcuts import redirect
-from django.urls import reverse_lazy
-
-from equipment.models import BedType, Bed
+from equipment import catalog
+from equipment.models import BedType
 
 
 class AdmissionInline(SaveCurrentUser, admin.TabularInline):
@@ -63,33 +65,44 @@ class HealthSnapshotInline(SaveCurrentUser, admin.TabularInline):
 @admin.register(Admission, site=admin_site)
 class AdmissionAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        actions_details = (
-            'discharge_patient',
-            'deceased_patient',
-        )
-
-        # This blocks a migration, so put in try... except
-        try:
-            for bed_type in BedType.objects.all():
-                action_slug = '-'.join(bed_type.name.lower().split(' '))
-
-                def action(request, pk, bed_type=bed_type):
-                    return self.bed_type_dispatch_action(request, pk, bed_type)
-
-                setattr(action, 'short_description', f'Assign to bed: {bed_type.name}')
-                setattr(action, 'url_path', f'set-{action_slug}')
-
-                action_name = f'assign_to_{action_slug.replace("-", "_")}'
-                setattr(self, action_name, action)
-                actions_details += (action_name,)
-
-        except Exception:
-            pass
+    actions_detail = (
+        'discharge_patient',
+        'deceased_patient',
+    )
 
-        setattr(self, 'actions_detail', actions_details)
+    def get_urls(self):
+        # The actions change the admission: POST only, where admin_view checks the CSRF token.
+        # Assigning a bed type is a single route: the bed types are not known when the urls are built
+        urls = [
+            path(f'{getattr(self, name).url_path}/<uuid:pk>/',
+                 self.admin_site.admin_view(require_POST(getattr(self, name))),
+                 name=f'patient_tracker_admission_{name}')
+            for name in self.actions_detail
+        ]
+        urls.append(path('assign-bed/<uuid:pk>/<uuid:bed_type_id>/',
+                         self.admin_site.admin_view(require_POST(self.bed_type_dispatch_action)),
+                         name='patient_tracker_admission_assign_bed'))
+        return urls + super().get_urls()
+
+    def get_actions_detail(self, object_id):
+        """Buttons of the change view: the detail actions, then one per bed type of the cached catalog.
+
+        They are rendered as forms posting to the action, see `change_form_object_tools.html`.
+        """
+        actions = [{
+            'title': getattr(self, name).short_description,
+            'path': reverse(f'admin:patient_tracker_admission_{name}', args=(object_id,)),
+        } for name in self.actions_detail]
+        actions += [{
+            'title': f'Assign to bed: {bed_type.name}',
+            'path': reverse('admin:patient_tracker_admission_assign_bed', args=(object_id, bed_type.id)),
+        } for bed_type in catalog.get_bed_types()]
+        return actions
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['actions_list'] = self.get_actions_detail(object_id)
+        return super().change_view(request, object_id, form_url, extra_context)
 
     fields = [
         'local_barcode',
@@ -123,11 +136,16 @@ class AdmissionAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
     ]
 
     list_filter = [
-        'admitted_at'
+        'admitted_at',
+        'current_severity',
+        'current_bed_type',
     ]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('latest_vitals')
+
     def current_main_complain(self, obj):
-        return obj.flattened_snapshot['main_complain']
+        return obj.flattened_snapshot.get('main_complain')
 
     def has_delete_permission(self, request, obj=None):
         return False
@@ -135,17 +153,26 @@ class AdmissionAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
-    def bed_type_dispatch_action(self, request, pk, bed_type):
-        admission = Admission.objects.get(pk=pk)
-        try:
-            admission.assign_bed(bed_type)
+    def get_action_admission(self, request, pk):
+        """The admission an action changes, if the user may change it"""
+        admission = get_object_or_404(Admission, pk=pk)
+        if not self.has_change_permission(request, admission):
+            raise PermissionDenied
+        admission.current_user = request.user
+        return admission
+
+    def bed_type_dispatch_action(self, request, pk, bed_type_id):
+        admission = self.get_action_admission(request, pk)
+        bed_type = get_object_or_404(BedType, pk=bed_type_id)
+        if admission.request_bed(bed_type):
             messages.success(request, 'Person successfuly moved to another bed')
-        except Bed.DoesNotExist as e:
-            messages.error(request, str(e))
+        else:
+            messages.warning(request, f'There are no bed available for this type: {bed_type.name}, '
+                                      f'person added to the waiting list')
         return redirect(reverse_lazy('admin:patient_tracker_admission_changelist'))
 
     def discharge_patient(self, request, pk):
-        admission = Admission.objects.get(pk=pk)
+        admission = self.get_action_admission(request, pk)
         admission.discharge()
         messages.success(request, 'Person has been successfully discharged')
         return redirect(reverse_lazy('admin:patient_tracker_admission_changelist'))
@@ -154,7 +181,7 @@ class AdmissionAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
     discharge_patient.short_description = 'Discharge'
 
     def deceased_patient(self, request, pk):
-        admission = Admission.objects.get(pk=pk)
+        admission = self.get_action_admission(request, pk)
         admission.record_deceased()
         messages.success(request, 'Person has been recorded deceased')
         return redirect(reverse_lazy('admin:patient_tracker_admission_changelist'))
@@ -163,6 +190,26 @@ class AdmissionAdmin(SaveCurrentUserAdmin, admin.ModelAdmin):
     deceased_patient.short_description = 'deceased'
 
 
+@admin.register(WaitingListEntry, site=admin_site)
+class WaitingListEntryAdmin(admin.ModelAdmin):
+    list_display = [
+        'bed_type',
+        'admission',
+        'priority',
+        'arrived_at',
+    ]
+
+    list_filter = [
+        'bed_type'
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 class HealthSnapshotProxy(HealthSnapshot):
     class Meta:
         verbose_name = 'Health Snapshot'
@@ -0,0 +1,102 @@
+"""Allocation of the admission barcode numbers.
+
+A barcode is an EAN13 number made of the site prefix (`BARCODE_SITE_PREFIX`), a serial number
+zero-padded to 12 digits and the EAN13 check digit. Serial numbers come from a database sequence
+that is never rolled back, so a number is never handed out twice.
+
+Barcodes used to be random numbers: the sequence starts in the largest range they leave free
+(migration 0005), but it eventually reaches the legacy barcode ending that range. The numbers of
+each reserved block that are already taken are skipped, with a single query per block.
+
+Each process reserves serial numbers by blocks of `BARCODE_BLOCK_SIZE`, so most admissions get their
+number without any query. Numbers of a block that a process does not use before it exits are lost.
+Without a native sequence (SQLite), numbers reserved within a transaction come one at a time, see
+`reserve_serials`.
+"""
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+SEQUENCE_NAME = 'patient_tracker_barcode_seq'
+
+
+def ean13_check_digit(digits):
+    """Check digit of the 12 first digits of an EAN13 number"""
+    total = sum(int(digit) * (3 if position % 2 else 1) for position, digit in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def ean13(prefix, serial):
+    """EAN13 number of a serial number under a site prefix"""
+    width = 12 - len(prefix)
+    if serial >= 10 ** width:
+        raise ValueError(f'Barcode serial numbers exhausted for prefix {prefix!r}')
+    digits = f'{prefix}{serial:0{width}d}'
+    return digits + ean13_check_digit(digits)
+
+
+def site_prefix():
+    prefix = settings.BARCODE_SITE_PREFIX
+    if not prefix.isdigit() or len(prefix) > 10:
+        raise ImproperlyConfigured('BARCODE_SITE_PREFIX must be made of 1 to 10 digits')
+    return prefix
+
+
+def reserve_serials(size):
+    """Reserve up to `size` serial numbers, returned in ascending order.
+
+    PostgreSQL hands them out from a native sequence, which is never rolled back. Other databases
+    use the `BarcodeSequence` row, which a rollback of the surrounding transaction puts back: within
+    a transaction, a single number is reserved there, so that no number outlives a rollback in memory
+    to be handed out a second time. Blocks are only reserved in autocommit mode on those databases.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SEQUENCE_NAME, size])
+            return sorted(row[0] for row in cursor.fetchall())
+
+    from patient_tracker.models import BarcodeSequence
+    return BarcodeSequence.objects.reserve(1 if connection.in_atomic_block else size)
+
+
+def free_serials(prefix, serials):
+    """The serial numbers whose barcode no admission has yet"""
+    from patient_tracker.models import Admission
+
+    barcodes = {serial: ean13(prefix, serial) for serial in serials}
+    taken = set(Admission.objects.filter(local_barcode__in=barcodes.values())
+                .values_list('local_barcode', flat=True))
+    return [serial for serial, barcode in barcodes.items() if barcode not in taken]
+
+
+class BarcodeAllocator:
+    """Hands out barcode numbers from blocks of serial numbers reserved for the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._serials = deque()
+        self._pid = None
+
+    def allocate(self):
+        prefix = site_prefix()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Never share a block with a forked process
+                self._serials.clear()
+                self._pid = os.getpid()
+            while not self._serials:
+                self._serials.extend(free_serials(prefix, reserve_serials(settings.BARCODE_BLOCK_SIZE)))
+            serial = self._serials.popleft()
+        return ean13(prefix, serial)
+
+    def reset(self):
+        """Forget the reserved numbers"""
+        with self._lock:
+            self._serials.clear()
+
+
+allocator = BarcodeAllocator()
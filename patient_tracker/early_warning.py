@@ -0,0 +1,113 @@
+"""NEWS2 early warning score of the admissions, computed with NumPy for many admissions at once.
+
+The score adds up the points of the latest known value of each vital, from the `LatestVital`
+projection: breathing rate, oxygen saturation (scale 1), systolic blood pressure, heart rate,
+temperature, and consciousness from the Glasgow coma scale (3 points below 15). Unknown vitals
+score 0 points. Whether the patient is on supplemental oxygen is not recorded, so it is not scored.
+
+`update_scores` loads the vitals of the admissions as one array per vital, scores them in a
+single vectorized pass, and stores the scores that changed on the latest snapshot of each
+admission and on its `current_early_warning_score` column.
+"""
+import numpy as np
+from django.db import connection, models, transaction
+from django.db.models import Max, Q
+from django.db.models.functions import Cast
+
+# Vital: (upper bounds of the bands, points of each band). A value falls in the first band whose upper
+# bound it does not exceed, or in the last band.
+PARAMETERS = {
+    'breathing_rate': ([8, 11, 20, 24], [3, 1, 0, 2, 3]),
+    'oxygen_saturation': ([91, 93, 95], [3, 2, 1, 0]),
+    'blood_pressure_systolic': ([90, 100, 110, 219], [3, 2, 1, 0, 3]),
+    'heart_rate': ([40, 50, 90, 110, 130], [3, 1, 0, 1, 2, 3]),
+    'temperature': ([35.0, 36.0, 38.0, 39.0], [3, 1, 0, 1, 2]),
+}
+GCS_FIELDS = ['gcs_eye', 'gcs_verbal', 'gcs_motor']
+VITALS = list(PARAMETERS) + GCS_FIELDS
+
+# Lowest score of each clinical risk level
+RISKS = [(7, 'high'), (5, 'medium'), (0, 'low')]
+
+
+def score(vitals):
+    """Early warning scores of the columns of `vitals`, a float array per vital with NaN where unknown"""
+    total = np.zeros(len(next(iter(vitals.values()))), dtype=np.int16)
+    for name, (bounds, points) in PARAMETERS.items():
+        values = vitals[name]
+        earned = np.asarray(points, dtype=np.int16)[np.digitize(values, bounds, right=True)]
+        total += np.where(np.isnan(values), 0, earned).astype(np.int16)
+
+    gcs = vitals['gcs_eye'] + vitals['gcs_verbal'] + vitals['gcs_motor']
+    total += np.where(gcs < 15, 3, 0).astype(np.int16)
+    return total
+
+
+def risk(value):
+    """Clinical risk level of a score"""
+    return next(level for lowest, level in RISKS if value >= lowest)
+
+
+def load_vitals(admission_ids=None):
+    """Latest known vitals of the active admissions with a snapshot, or of `admission_ids` among them.
+
+    The vitals are pivoted by the database, one row per admission.
+
+    Returns:
+        tuple -- the admission ids, their stored current score, the id and stored score of their
+            latest snapshot, and the vitals as a float array per vital, NaN where unknown
+    """
+    from patient_tracker.models import Admission, LatestVital
+
+    admissions = Admission.objects.active()
+    if admission_ids is not None:
+        admissions = admissions.filter(pk__in=admission_ids)
+    latest = LatestVital.objects.filter(admission__in=admissions).order_by()
+
+    # Every snapshot records a severity, its latest value belongs to the latest snapshot
+    rows = list(latest.filter(name='severity').values_list(
+        'admission_id', 'admission__current_early_warning_score', 'snapshot_id', 'snapshot__early_warning_score'))
+    ids, current_scores, snapshot_ids, snapshot_scores = map(list, zip(*rows)) if rows else ([], [], [], [])
+    positions = {admission_id: position for position, admission_id in enumerate(ids)}
+
+    pivot = latest.filter(name__in=VITALS).values('admission_id').annotate(**{
+        name: Max(Cast('value', models.FloatField()), filter=Q(name=name)) for name in VITALS
+    }).values_list('admission_id', *VITALS)
+    values = np.full((len(ids), len(VITALS)), np.nan)
+    for row in pivot:
+        values[positions[row[0]]] = np.array(row[1:], dtype=float)
+
+    return ids, current_scores, snapshot_ids, snapshot_scores, dict(zip(VITALS, values.T))
+
+
+@transaction.atomic
+def update_scores(admission_ids=None):
+    """Score the active admissions, or `admission_ids` among them, and store the scores that changed.
+
+    Admissions without any snapshot are not scored.
+
+    Returns:
+        int -- number of admissions scored
+    """
+    from patient_tracker.models import Admission, HealthSnapshot
+
+    ids, current_scores, snapshot_ids, snapshot_scores, vitals = load_vitals(admission_ids)
+    if not ids:
+        return 0
+    scores = score(vitals).tolist()
+
+    # One update per score value, as there are few of them
+    snapshots_by_score, admissions_by_score = {}, {}
+    for position, value in enumerate(scores):
+        if snapshot_scores[position] != value:
+            snapshots_by_score.setdefault(value, []).append(snapshot_ids[position])
+        if current_scores[position] != value:
+            admissions_by_score.setdefault(value, []).append(ids[position])
+
+    batch_size = connection.features.max_query_params or 10000
+    for model, field, by_score in [(HealthSnapshot, 'early_warning_score', snapshots_by_score),
+                                   (Admission, 'current_early_warning_score', admissions_by_score)]:
+        for value, pks in by_score.items():
+            for start in range(0, len(pks), batch_size):
+                model.objects.filter(pk__in=pks[start:start + batch_size]).update(**{field: value})
+    return len(ids)
@@ -0,0 +1,90 @@
+"""Exports of the patient tracker records, streamed as NDJSON or CSV.
+
+Rows are read as tuples with `.iterator()`, a server-side cursor on PostgreSQL, and encoded one
+by one, so that an export holds a single chunk of rows in memory whatever its size, and the
+query runs once, without any count. They come in `(created, id)` order, and can be restricted
+to a range of `created` and to some admissions.
+"""
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Export: (model name, columns, field holding the admission id)
+EXPORTS = {
+    'health-snapshots': ('HealthSnapshot', [
+        'id', 'created', 'admission_id', 'creator_id',
+        'main_complain', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'breathing_rate',
+        'temperature', 'oxygen_saturation', 'gcs_eye', 'gcs_verbal', 'gcs_motor', 'observations', 'severity',
+        'early_warning_score',
+    ], 'admission_id'),
+    'admissions': ('Admission', [
+        'id', 'created', 'modified', 'patient_id', 'local_barcode', 'admitted', 'admitted_at',
+        'current_severity', 'current_bed_type_id', 'current_bed_id', 'current_early_warning_score', 'discharged_at',
+    ], 'id'),
+    'discharges': ('Discharge', [
+        'id', 'created', 'admission_id', 'creator_id', 'discharged_at', 'notes',
+    ], 'admission_id'),
+    'bed-assignments': ('BedAssignment', [
+        'id', 'created', 'admission_id', 'bed_id', 'assigned_at', 'unassigned_at', 'allocation_time',
+    ], 'admission_id'),
+}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_rows(name, start=None, end=None, admission_ids=None, chunk_size=None):
+    """Rows of the export `name` created from `start` (inclusive) to `end`, of `admission_ids` if given.
+
+    Returns:
+        tuple -- the columns, and an iterator over the rows as tuples
+    """
+    from django.apps import apps
+
+    model_name, columns, admission_field = EXPORTS[name]
+    queryset = apps.get_model('patient_tracker', model_name).objects.all()
+    if start:
+        queryset = queryset.filter(created__gte=start)
+    if end:
+        queryset = queryset.filter(created__lt=end)
+    if admission_ids is not None:
+        queryset = queryset.filter(**{f'{admission_field}__in': admission_ids})
+
+    rows = queryset.order_by('created', 'id').values_list(*columns) \
+        .iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+    return columns, rows
+
+
+class Echo:
+    """File-like object handing back what is written, for `csv.writer` to encode a single row"""
+
+    def write(self, value):
+        return value
+
+
+def encode_ndjson(columns, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def encode_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+}
+
+
+def stream_export(name, output, **filters):
+    """Lines of the export `name` encoded as `output`, NDJSON or CSV"""
+    columns, rows = export_rows(name, **filters)
+    return ENCODERS[output](columns, rows)
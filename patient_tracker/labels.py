@@ -0,0 +1,124 @@
+"""Printable sheets of admission labels (wristbands), as PNG or PDF.
+
+Each label shows the patient name above the admission barcode. Labels are rendered in parallel by
+a pool of `LABEL_RENDER_PROCESSES` processes, then laid out on A4 pages in memory.
+
+This module does not use the database, so that the pool processes do not need Django to be set up.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from barcode import EAN13
+from barcode.writer import ImageWriter
+from PIL import Image, ImageDraw, ImageFont
+
+DPI = 300
+# 2 x 1 inch labels on A4 pages, at 300 dpi
+LABEL_SIZE = (600, 300)
+PAGE_SIZE = (2480, 3508)
+PAGE_MARGIN = 60
+
+# Below this number of labels, rendering in the current process is faster than dispatching to the pool
+PARALLEL_THRESHOLD = 16
+
+FORMATS = {
+    'png': 'image/png',
+    'pdf': 'application/pdf',
+}
+
+# Process pools by number of processes
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def render_label(barcode, title):
+    """Render one label as raw grayscale pixels"""
+    writer = ImageWriter(mode='L')
+    code = EAN13(barcode, writer=writer).render({
+        'dpi': DPI,
+        'module_height': 8,
+        'font_size': 8,
+        'text_distance': 3,
+        'quiet_zone': 2,
+    })
+    code.thumbnail((LABEL_SIZE[0] - 20, LABEL_SIZE[1] - 60))
+
+    label = Image.new('L', LABEL_SIZE, 255)
+    draw = ImageDraw.Draw(label)
+    draw.text((LABEL_SIZE[0] // 2, 12), title[:36], fill=0, anchor='mt',
+              font=ImageFont.truetype(writer.font_path, 28))
+    label.paste(code, ((LABEL_SIZE[0] - code.width) // 2, 54))
+    return label.tobytes()
+
+
+def _render_label(item):
+    return render_label(*item)
+
+
+def get_pool(processes):
+    with _pool_lock:
+        if processes not in _pools:
+            # Spawned rather than forked: the web and job processes run threads holding locks
+            _pools[processes] = ProcessPoolExecutor(max_workers=processes,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+        return _pools[processes]
+
+
+def render_labels(items, processes=None):
+    """Render (barcode, title) pairs into label images, in the process pool for large batches"""
+    processes = processes or os.cpu_count() or 1
+    if processes > 1 and len(items) >= PARALLEL_THRESHOLD:
+        chunksize = max(1, len(items) // (processes * 4))
+        rendered = get_pool(processes).map(_render_label, items, chunksize=chunksize)
+    else:
+        rendered = map(_render_label, items)
+    return [Image.frombytes('L', LABEL_SIZE, pixels) for pixels in rendered]
+
+
+def layout(count):
+    """Position of `count` labels in a grid of pages, as (page, x, y)"""
+    columns = (PAGE_SIZE[0] - 2 * PAGE_MARGIN) // LABEL_SIZE[0]
+    rows = (PAGE_SIZE[1] - 2 * PAGE_MARGIN) // LABEL_SIZE[1]
+    for index in range(count):
+        page, cell = divmod(index, columns * rows)
+        row, column = divmod(cell, columns)
+        yield page, PAGE_MARGIN + column * LABEL_SIZE[0], PAGE_MARGIN + row * LABEL_SIZE[1]
+
+
+def compose_sheet(labels, file_format='png'):
+    """Lay the label images out and encode them.
+
+    A PDF has one A4 page per grid of labels. A PNG is a single A4 wide sheet, as long as needed:
+    about 8 MB of pixels per page of labels while it is composed, so callers cap its labels.
+    """
+    positions = list(layout(len(labels)))
+    pages = positions[-1][0] + 1 if positions else 1
+
+    if file_format == 'pdf':
+        sheets = [Image.new('L', PAGE_SIZE, 255) for _ in range(pages)]
+        for label, (page, x, y) in zip(labels, positions):
+            sheets[page].paste(label, (x, y))
+    else:
+        page_height = PAGE_SIZE[1] - 2 * PAGE_MARGIN
+        bottom = max((page * page_height + y for page, x, y in positions), default=0) + LABEL_SIZE[1]
+        sheets = [Image.new('L', (PAGE_SIZE[0], bottom + PAGE_MARGIN), 255)]
+        for label, (page, x, y) in zip(labels, positions):
+            sheets[0].paste(label, (x, page * page_height + y))
+
+    # Labels are black and white: bilevel pages are an order of magnitude smaller
+    sheets = [sheet.convert('1', dither=Image.NONE) for sheet in sheets]
+
+    output = BytesIO()
+    if file_format == 'pdf':
+        sheets[0].save(output, format='PDF', resolution=DPI, save_all=True, append_images=sheets[1:])
+    else:
+        sheets[0].save(output, format='PNG', dpi=(DPI, DPI))
+    return output.getvalue()
+
+
+def render_sheet(items, file_format='png', processes=None):
+    """Label sheet of (barcode, title) pairs, encoded as `file_format`"""
+    return compose_sheet(render_labels(items, processes), file_format)
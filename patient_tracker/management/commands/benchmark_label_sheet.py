@@ -0,0 +1,35 @@
+import os
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from patient_tracker.barcodes import ean13
+from patient_tracker.labels import PARALLEL_THRESHOLD, compose_sheet, render_labels
+
+
+class Command(BaseCommand):
+    help = 'Time the rendering of a label sheet, in the current process and in the process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labels', type=int, default=500)
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--output', choices=['png', 'pdf'], default='pdf')
+
+    def handle(self, *args, **options):
+        items = [(ean13('20', serial), f'Patient {serial}') for serial in range(options['labels'])]
+
+        for label, processes in [('current process', 1), (f'{options["processes"]} processes', options['processes'])]:
+            if processes > 1:
+                # Start the pool outside of the measure, as a long running process would have
+                render_labels(items[:max(PARALLEL_THRESHOLD, processes * 4)], processes)
+
+            started_at = perf_counter()
+            labels = render_labels(items, processes)
+            rendered_at = perf_counter()
+            sheet = compose_sheet(labels, options['output'])
+            finished_at = perf_counter()
+
+            self.stdout.write(
+                f'{label}: {len(items)} labels rendered in {rendered_at - started_at:.2f}s, '
+                f'{options["output"]} of {len(sheet) // 1024} KiB composed in {finished_at - rendered_at:.2f}s'
+            )
@@ -0,0 +1,69 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from custom_auth.utils import get_user_model
+from patient.models import Patient
+from patient_tracker.models import Admission
+from patient_tracker.views import HealthSnapshotViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compare the snapshots per second recorded through the single and bulk health snapshot endpoints. ' \
+           'Everything is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshots', type=int, default=2000)
+        parser.add_argument('--admissions', type=int, default=50)
+        parser.add_argument('--batch', type=int, default=1000, help='Snapshots per bulk request')
+        parser.add_argument('--user', default='admin', help='Username posting the snapshots')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+        with transaction.atomic():
+            self.run(user, options)
+            transaction.set_rollback(True)
+
+    def run(self, user, options):
+        patient = Patient.objects.create(current_user=user)
+        admission_ids = [str(Admission.objects.create(patient=patient, current_user=user).pk)
+                         for _ in range(options['admissions'])]
+        items = [{
+            'admission_id': admission_ids[index % len(admission_ids)],
+            'severity': random.choice(['RED', 'YELLOW', 'GREEN']),
+            'heart_rate': random.randint(40, 160),
+            'breathing_rate': random.randint(8, 30),
+            'temperature': round(random.uniform(35, 41), 1),
+            'oxygen_saturation': random.randint(85, 100),
+        } for index in range(options['snapshots'])]
+
+        factory = APIRequestFactory()
+
+        def post(action, data):
+            request = factory.post('/', data, format='json')
+            force_authenticate(request, user)
+            response = HealthSnapshotViewSet.as_view({'post': action})(request)
+            if response.status_code != 201:
+                raise CommandError(f'{action} failed with {response.status_code}: {response.data}')
+
+        started_at = perf_counter()
+        for item in items:
+            post('create', item)
+        single = perf_counter() - started_at
+
+        started_at = perf_counter()
+        for start in range(0, len(items), options['batch']):
+            post('bulk', items[start:start + options['batch']])
+        bulk = perf_counter() - started_at
+
+        for label, duration in [('single', single), (f'bulk of {options["batch"]}', bulk)]:
+            self.stdout.write(f'{label}: {len(items)} snapshots in {duration:.2f}s, '
+                              f'{len(items) / duration:.0f} snapshots/s')
+        self.stdout.write(self.style.SUCCESS(f'Bulk ingestion is {single / bulk:.1f}x faster'))
@@ -0,0 +1,73 @@
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from custom_auth.utils import get_user_model
+from patient.models import Patient
+from patient_tracker import partitions
+from patient_tracker.models import Admission, HealthSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Time the lookup of the latest snapshot of an admission as the partitioned health snapshot table ' \
+           'grows to each of the given sizes. Everything is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000, 50000000],
+                            help='Numbers of snapshots to time the lookup at')
+        parser.add_argument('--admissions', type=int, default=1000)
+        parser.add_argument('--months', type=int, default=24, help='Months the snapshots are spread over')
+        parser.add_argument('--lookups', type=int, default=500, help='Lookups timed at each size')
+        parser.add_argument('--user', default='admin', help='Username creating the snapshots')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError('The health snapshot table is only partitioned on PostgreSQL')
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+        with transaction.atomic():
+            self.run(user, options)
+            transaction.set_rollback(True)
+
+    def run(self, user, options):
+        now = timezone.now()
+        partitions.create_partitions(options['months'] + 1, start=partitions.month_start(now, -options['months']))
+
+        patient = Patient.objects.create(current_user=user)
+        admission_ids = [Admission.objects.create(patient=patient, current_user=user).pk
+                         for _ in range(options['admissions'])]
+
+        table = HealthSnapshot._meta.db_table
+        size = HealthSnapshot.all_objects.count()
+        for target in sorted(options['sizes']):
+            started_at = perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO "{table}" (id, created, modified, is_removed, severity, heart_rate, '
+                    f'admission_id, creator_id) '
+                    f"SELECT md5(random()::text || i)::uuid, %(now)s - random() * %(months)s * interval '1 month', "
+                    f"%(now)s, false, 'GREEN', 60 + i %% 60, (%(admissions)s::uuid[])[1 + i %% %(count)s], %(user)s "
+                    f'FROM generate_series(1, %(rows)s) AS i', {
+                        'now': now, 'months': options['months'], 'admissions': admission_ids,
+                        'count': len(admission_ids), 'user': user.pk, 'rows': max(target - size, 0),
+                    })
+                cursor.execute(f'ANALYZE "{table}"')
+            size = max(size, target)
+            filled = perf_counter() - started_at
+
+            durations = []
+            for admission_id in random.choices(admission_ids, k=options['lookups']):
+                started_at = perf_counter()
+                HealthSnapshot.objects.filter(admission_id=admission_id).order_by('-created').first()
+                durations.append((perf_counter() - started_at) * 1000)
+            durations.sort()
+            self.stdout.write(f'{size} snapshots (filled in {filled:.0f}s): latest snapshot lookup '
+                              f'median {median(durations):.2f}ms, '
+                              f'p95 {durations[int(len(durations) * 0.95) - 1]:.2f}ms')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from patient_tracker import partitions
+
+
+class Command(BaseCommand):
+    help = 'Find the snapshot files and latest vitals whose health snapshot no longer exists, as after a ' \
+           'partition is dropped, and delete them unless --check is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report the orphaned rows, exit with an error if there are any')
+
+    def handle(self, *args, **options):
+        counts = {model: queryset.count() for model, queryset in partitions.orphaned_rows().items()}
+
+        for model, count in counts.items():
+            if count:
+                self.stdout.write(f'{model.__name__}: {count} row(s) without a health snapshot')
+
+        if options['check']:
+            if any(counts.values()):
+                raise CommandError(f'{sum(counts.values())} orphaned row(s)')
+            self.stdout.write(self.style.SUCCESS('No orphaned rows'))
+            return
+
+        deleted = partitions.delete_orphaned_rows()
+        self.stdout.write(self.style.SUCCESS(f'Orphaned rows deleted ({sum(deleted.values())} rows)'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from patient_tracker import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of the health snapshot table ahead of time, from the current month ' \
+           'to the given number of months after it. Partitions that exist are kept.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help='Months after the current one')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError('The health snapshot table is only partitioned on PostgreSQL')
+
+        created = partitions.create_partitions(options['months'])
+        for name in created:
+            self.stdout.write(f'Created {name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partitions created'))
@@ -0,0 +1,47 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from patient_tracker.exports import ENCODERS, EXPORTS, stream_export
+
+
+def datetime_argument(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Stream the records of an export as NDJSON or CSV, to the standard output or a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--output', choices=list(ENCODERS), default='ndjson')
+        parser.add_argument('--from', dest='start', type=datetime_argument,
+                            help='Records created from this date and time (ISO 8601)')
+        parser.add_argument('--to', dest='end', type=datetime_argument,
+                            help='Records created before this date and time (ISO 8601)')
+        parser.add_argument('--admission-id', dest='admission_ids', type=uuid.UUID, nargs='+',
+                            help='Records of these admissions')
+        parser.add_argument('--file', help='File written instead of the standard output')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched at once from the database')
+
+    def handle(self, *args, **options):
+        lines = stream_export(options['name'], options['output'], start=options['start'], end=options['end'],
+                              admission_ids=options['admission_ids'], chunk_size=options['chunk_size'])
+        if not options['file']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        try:
+            with open(options['file'], 'w', newline='') as f:
+                for line in lines:
+                    f.write(line)
+                    count += 1
+        except OSError as error:
+            raise CommandError(error)
+        self.stderr.write(self.style.SUCCESS(f'{count} lines written to {options["file"]}'))
@@ -0,0 +1,65 @@
+import asyncio
+import signal
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_auth.utils import get_user_model
+from patient_tracker.monitors import MonitorIngestion
+
+
+class Command(BaseCommand):
+    help = 'Receive the vitals streamed by bedside monitors, as JSON lines over TCP, and record them ' \
+           'as health snapshots in batches. Runs until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1',
+                            help='Address to listen on, 0.0.0.0 to accept monitors from the network')
+        parser.add_argument('--port', type=int, default=9100)
+        parser.add_argument('--batch-size', type=int, default=500, help='Readings buffered before a flush')
+        parser.add_argument('--flush-interval', type=float, default=1.0, help='Seconds between flushes at most')
+        parser.add_argument('--max-pending', type=int, default=10000,
+                            help='Readings buffered or being recorded before the monitors are slowed down')
+        parser.add_argument('--report-interval', type=float, default=10.0, help='Seconds between statistics')
+        parser.add_argument('--user', default='admin', help='Username recording the snapshots')
+        parser.add_argument('--token', default=settings.MONITOR_INGESTION_TOKEN,
+                            help='Shared secret the monitors must send, MONITOR_INGESTION_TOKEN by default')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+        if not options['token']:
+            raise CommandError('Set MONITOR_INGESTION_TOKEN or --token for the monitors to authenticate')
+
+        service = MonitorIngestion(user, options['token'], batch_size=options['batch_size'],
+                                   flush_interval=options['flush_interval'],
+                                   max_pending=max(options['max_pending'], options['batch_size']))
+        asyncio.run(self.serve(service, options))
+
+    async def serve(self, service, options):
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(signum, stopped.set)
+
+        await service.start(options['host'], options['port'])
+        self.stdout.write(f'Listening on {options["host"]}:{options["port"]}')
+        started_at = perf_counter()
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), options['report_interval'])
+            except asyncio.TimeoutError:
+                self.report(service, started_at)
+        await service.stop()
+        self.report(service, started_at)
+
+    def report(self, service, started_at):
+        stats = service.stats
+        self.stdout.write(f'{stats["received"]} readings received, {stats["recorded"]} recorded '
+                          f'({stats["recorded"] / (perf_counter() - started_at):.0f}/s) in {stats["flushes"]} '
+                          f'flushes, {stats["rejected"]} rejected, {stats["throttled"]} throttled, '
+                          f'{stats["failures"]} failed flushes, {stats["refused"]} refused connections, '
+                          f'{service.pending} pending')
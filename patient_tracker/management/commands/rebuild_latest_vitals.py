@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from patient_tracker.models import LatestVital
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the latest known vitals of the admissions from their health snapshots'
+
+    def handle(self, *args, **options):
+        count = LatestVital.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Latest vitals rebuilt ({count} entries)'))
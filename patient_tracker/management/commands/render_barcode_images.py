@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from patient_tracker.models import Admission
+
+
+class Command(BaseCommand):
+    help = 'Render and store the barcode images of the admissions that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Check every admission, including those already pointing to a stored image')
+
+    def handle(self, *args, **options):
+        admissions = Admission.objects.filter(local_barcode__isnull=False)
+        admissions = admissions.only('id', 'local_barcode', 'local_barcode_image').order_by()
+
+        rendered = checked = 0
+        for admission in admissions.iterator():
+            if not options['all'] and admission.local_barcode_image.name == admission.barcode_image_key:
+                continue
+            checked += 1
+            if admission.store_barcode_image() is not None:
+                rendered += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{rendered} barcode image(s) rendered, {checked} admission(s) checked'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from patient_tracker.models import Admission
+
+
+class Command(BaseCommand):
+    help = 'Verify the current state columns of the admissions against their records, ' \
+           'and repair them unless --check is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report the columns that drifted, exit with an error if any did')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = Admission.objects.verify_current_state()
+        else:
+            mismatches = Admission.objects.repair_current_state()
+
+        for admission_id, column, stored, expected in mismatches:
+            self.stdout.write(f'Admission {admission_id}, {column}: stored {stored!r}, records say {expected!r}')
+
+        if options['check']:
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} admission column(s) out of sync')
+            self.stdout.write(self.style.SUCCESS('Admission current state is in sync'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Admission current state repaired ({len(mismatches)} fixed)'))
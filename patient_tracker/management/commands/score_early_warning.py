@@ -0,0 +1,15 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from patient_tracker import early_warning
+
+
+class Command(BaseCommand):
+    help = 'Compute the early warning score of every active admission from its latest vitals'
+
+    def handle(self, *args, **options):
+        started_at = perf_counter()
+        scored = early_warning.update_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'{scored} admissions scored in {perf_counter() - started_at:.2f}s'))
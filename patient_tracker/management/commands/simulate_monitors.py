@@ -0,0 +1,89 @@
+import asyncio
+import json
+import random
+import time
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from patient_tracker.models import Admission, HealthSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Replay synthetic bedside monitor feeds against `ingest_monitor_vitals`, one connection per monitor, ' \
+           'and measure the readings recorded per second. The monitors watch the active admissions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9100)
+        parser.add_argument('--monitors', type=int, default=50)
+        parser.add_argument('--readings', type=int, default=200, help='Readings sent by each monitor')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Readings per second of each monitor, 0 to send them as fast as possible')
+        parser.add_argument('--token', default=settings.MONITOR_INGESTION_TOKEN,
+                            help='Shared secret of the ingestion service, MONITOR_INGESTION_TOKEN by default')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait for the readings to be recorded')
+
+    def handle(self, *args, **options):
+        barcodes = list(Admission.objects.active().exclude(local_barcode=None)
+                        .values_list('local_barcode', flat=True)[:options['monitors']])
+        if not barcodes:
+            raise CommandError('No active admission to monitor')
+        snapshots = HealthSnapshot.objects.filter(admission__local_barcode__in=barcodes)
+        recorded_before = snapshots.count()
+
+        started_at = perf_counter()
+        asyncio.run(self.replay(barcodes, options))
+        sent = options['monitors'] * options['readings']
+        self.stdout.write(f'{sent} readings sent by {options["monitors"]} monitors in '
+                          f'{perf_counter() - started_at:.2f}s')
+
+        recorded = 0
+        while perf_counter() - started_at < options['timeout']:
+            recorded = snapshots.count() - recorded_before
+            if recorded >= sent:
+                break
+            time.sleep(0.1)
+        duration = perf_counter() - started_at
+        style = self.style.SUCCESS if recorded >= sent else self.style.WARNING
+        self.stdout.write(style(f'{recorded} of {sent} readings recorded in {duration:.2f}s, '
+                                f'{recorded / duration:.0f} readings/s'))
+
+    async def replay(self, barcodes, options):
+        await asyncio.gather(*[
+            self.monitor(barcodes[index % len(barcodes)], options) for index in range(options['monitors'])
+        ])
+
+    async def monitor(self, barcode, options):
+        reader, writer = await asyncio.open_connection(options['host'], options['port'])
+        writer.write(options['token'].encode() + b'\n')
+
+        # Vital: (first value, lowest value, highest value, step of the random walk)
+        walks = {
+            'heart_rate': (80, 40, 180, 1),
+            'breathing_rate': (16, 8, 35, 1),
+            'oxygen_saturation': (96, 80, 100, 1),
+            'temperature': (37.0, 35.0, 41.0, 0.1),
+            'blood_pressure_systolic': (120, 80, 200, 1),
+            'blood_pressure_diastolic': (80, 40, 120, 1),
+        }
+        vitals = {name: first for name, (first, lowest, highest, step) in walks.items()}
+        for _ in range(options['readings']):
+            for name, (first, lowest, highest, step) in walks.items():
+                vitals[name] = min(max(vitals[name] + random.choice([-step, 0, step]), lowest), highest)
+            reading = dict(vitals, local_barcode=barcode, temperature=round(vitals['temperature'], 1))
+            reading['severity'] = 'RED' if reading['oxygen_saturation'] < 92 else \
+                'YELLOW' if reading['oxygen_saturation'] < 95 else 'GREEN'
+            reading['recorded_at'] = timezone.now().isoformat()
+
+            writer.write(json.dumps(reading).encode() + b'\n')
+            # Waits while the ingestion service no longer reads the connection
+            await writer.drain()
+            if options['rate']:
+                await asyncio.sleep(1 / options['rate'])
+
+        writer.close()
+        await writer.wait_closed()
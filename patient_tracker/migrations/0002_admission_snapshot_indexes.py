@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(fields=['admitted_at'], name='admission_admitted_at'),
+        ),
+        migrations.AddIndex(
+            model_name='healthsnapshot',
+            index=models.Index(fields=['admission', 'created'], name='snapshot_admission_created'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0002_admission_snapshot_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bedassignment',
+            name='allocation_time',
+            field=models.DurationField(blank=True, editable=False, null=True),
+        ),
+    ]
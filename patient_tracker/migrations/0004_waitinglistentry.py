@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0005_bed_reason_retired'),
+        ('patient_tracker', '0003_bedassignment_allocation_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitingListEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.PositiveSmallIntegerField()),
+                ('arrived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('admission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='waiting_list_entry', to='patient_tracker.admission')),
+                ('bed_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waiting_list', to='equipment.bedtype')),
+            ],
+            options={
+                'verbose_name_plural': 'waiting list entries',
+                'ordering': ['priority', 'arrived_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='waitinglistentry',
+            index=models.Index(fields=['bed_type', 'priority', 'arrived_at', 'id'], name='waiting_list_order'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+SEQUENCE_NAME = 'patient_tracker_barcode_seq'
+
+
+def first_free_serial(serials, width):
+    """Serial number the largest range of numbers that no barcode uses starts after.
+
+    Barcodes used to be random 13 digit numbers: the highest one under the prefix is usually close
+    to the end of the serial space, and the sequence cannot simply start after it.
+    """
+    bounds = [0] + sorted(serials) + [10 ** width]
+    start, _ = max(zip(bounds, bounds[1:]), key=lambda gap: gap[1] - gap[0])
+    return start
+
+
+def create_sequence(apps, schema_editor):
+    """Start the serial numbers in the largest range the barcodes handed out under the site prefix leave"""
+    Admission = apps.get_model('patient_tracker', 'Admission')
+    BarcodeSequence = apps.get_model('patient_tracker', 'BarcodeSequence')
+
+    prefix = settings.BARCODE_SITE_PREFIX
+    width = 12 - len(prefix)
+    barcodes = Admission.objects.filter(local_barcode__startswith=prefix) \
+        .values_list('local_barcode', flat=True).iterator()
+    last_value = first_free_serial([int(barcode[len(prefix):12]) for barcode in barcodes
+                                    if len(barcode) == 13 and barcode.isdigit()], width)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME} START WITH {last_value + 1}')
+    else:
+        BarcodeSequence.objects.create(pk=1, last_value=last_value)
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0004_waitinglistentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodeSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
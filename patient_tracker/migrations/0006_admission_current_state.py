@@ -0,0 +1,102 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+
+def populate_current_state(apps, schema_editor):
+    Admission = apps.get_model('patient_tracker', 'Admission')
+    BedAssignment = apps.get_model('patient_tracker', 'BedAssignment')
+    Discharge = apps.get_model('patient_tracker', 'Discharge')
+    HealthSnapshot = apps.get_model('patient_tracker', 'HealthSnapshot')
+    PersonalData = apps.get_model('patient', 'PersonalData')
+
+    latest_severity = HealthSnapshot.objects.filter(admission=OuterRef('pk')) \
+        .order_by('-created').values('severity')[:1]
+    open_assignment = BedAssignment.objects.filter(admission=OuterRef('pk'), unassigned_at__isnull=True) \
+        .order_by('-assigned_at')
+    last_discharge = Discharge.objects.filter(admission=OuterRef('pk')) \
+        .order_by('-discharged_at').values('discharged_at')[:1]
+    display_name = PersonalData.objects.filter(patient=OuterRef('patient')) \
+        .annotate(name=Concat('first_name', Value(' '), 'last_name')).values('name')[:1]
+
+    Admission.objects.update(
+        current_severity=Subquery(latest_severity),
+        current_bed=Subquery(open_assignment.values('bed')[:1]),
+        current_bed_type=Subquery(open_assignment.values('bed__bed_type')[:1]),
+        discharged_at=Subquery(last_discharge),
+        display_name=Coalesce(Subquery(display_name), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0005_bed_reason_retired'),
+        ('patient', '0006_auto_20200422_2010'),
+        ('patient_tracker', '0005_barcodesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='admission',
+            name='current_bed',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='equipment.bed'),
+        ),
+        migrations.AddField(
+            model_name='admission',
+            name='current_bed_type',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='equipment.bedtype'),
+        ),
+        migrations.AddField(
+            model_name='admission',
+            name='current_severity',
+            field=models.CharField(blank=True, editable=False, max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='admission',
+            name='discharged_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='admission',
+            name='display_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=101),
+        ),
+        migrations.AddField(
+            model_name='historicaladmission',
+            name='current_bed',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='equipment.bed'),
+        ),
+        migrations.AddField(
+            model_name='historicaladmission',
+            name='current_bed_type',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='equipment.bedtype'),
+        ),
+        migrations.AddField(
+            model_name='historicaladmission',
+            name='current_severity',
+            field=models.CharField(blank=True, editable=False, max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaladmission',
+            name='discharged_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaladmission',
+            name='display_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=101),
+        ),
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(fields=['current_bed_type', 'current_severity'], name='admission_bed_type_severity'),
+        ),
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(condition=models.Q(('admitted', True), ('current_bed__isnull', True)), fields=['current_severity'], name='admission_waiting_severity'),
+        ),
+        migrations.RunPython(populate_current_state, migrations.RunPython.noop),
+    ]
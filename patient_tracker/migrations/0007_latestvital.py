@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+VITAL_FIELDS = [
+    'main_complain', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'breathing_rate',
+    'temperature', 'oxygen_saturation', 'gcs_eye', 'gcs_verbal', 'gcs_motor', 'observations', 'severity',
+]
+
+
+def populate_latest_vitals(apps, schema_editor):
+    HealthSnapshot = apps.get_model('patient_tracker', 'HealthSnapshot')
+    LatestVital = apps.get_model('patient_tracker', 'LatestVital')
+
+    latest = {}
+    snapshots = HealthSnapshot.objects.order_by('admission_id', 'created').values('id', 'admission_id', 'created',
+                                                                                  *VITAL_FIELDS)
+    for snapshot in snapshots.iterator():
+        for name in VITAL_FIELDS:
+            value = snapshot[name]
+            if value != '' and value is not None:
+                latest[(snapshot['admission_id'], name)] = (value, snapshot['id'], snapshot['created'])
+
+    LatestVital.objects.bulk_create([
+        LatestVital(admission_id=admission_id, name=name, value=value, snapshot_id=snapshot_id,
+                    recorded_at=recorded_at)
+        for (admission_id, name), (value, snapshot_id, recorded_at) in latest.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0006_admission_current_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestVital',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30)),
+                ('value', models.JSONField()),
+                ('recorded_at', models.DateTimeField()),
+                ('admission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_vitals', to='patient_tracker.admission')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patient_tracker.healthsnapshot')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='latestvital',
+            constraint=models.UniqueConstraint(fields=('admission', 'name'), name='unique_latest_vital'),
+        ),
+        migrations.RunPython(populate_latest_vitals, migrations.RunPython.noop),
+    ]
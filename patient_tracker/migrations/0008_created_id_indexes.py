@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0007_latestvital'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(fields=['created', 'id'], name='admission_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='healthsnapshot',
+            index=models.Index(fields=['created', 'id'], name='snapshot_created_id'),
+        ),
+    ]
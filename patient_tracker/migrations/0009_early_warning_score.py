@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0008_created_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='admission',
+            name='current_early_warning_score',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='healthsnapshot',
+            name='early_warning_score',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaladmission',
+            name='current_early_warning_score',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='admission',
+            index=models.Index(condition=models.Q(('admitted', True), ('discharged_at__isnull', True)), fields=['-current_early_warning_score', 'admitted_at'], name='admission_active_ews'),
+        ),
+    ]
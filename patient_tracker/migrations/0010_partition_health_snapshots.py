@@ -0,0 +1,118 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:11
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+TABLE = 'patient_tracker_healthsnapshot'
+OLD_TABLE = f'{TABLE}_old'
+MONTHS_AHEAD = 3
+
+
+def month_start(day, months=0):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def move_indexes_and_foreign_keys(cursor, source, target):
+    """Recreate on `target` the indexes, except the primary key, and the foreign keys of `source`.
+
+    Both tables are in the current schema, the first one of the `search_path`, which `pg_indexes`
+    qualifies the table names of the index definitions with.
+    """
+    cursor.execute("SELECT quote_ident(current_schema())")
+    schema = cursor.fetchone()[0]
+    cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+                   "AND tablename = %s AND indexname NOT IN "
+                   "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+                   [source, source])
+    indexes = cursor.fetchall()
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                   "WHERE conrelid = %s::regclass AND contype = 'f'", [source])
+    foreign_keys = cursor.fetchall()
+
+    for name, definition in indexes:
+        moved = definition.replace(' ON ONLY ', ' ON ').replace(f' ON {schema}.{source} ', f' ON {schema}.{target} ')
+        if f' ON {schema}.{target} ' not in moved:
+            raise RuntimeError(f'Cannot move index {name} to {target}: {definition}')
+        cursor.execute(f'DROP INDEX "{name}"')
+        cursor.execute(moved)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{source}" DROP CONSTRAINT "{name}"')
+        cursor.execute(f'ALTER TABLE "{target}" ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_snapshots(apps, schema_editor):
+    """Move the snapshots to a table partitioned by month of `created`, on PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+        cursor.execute(f'ALTER TABLE "{OLD_TABLE}" RENAME CONSTRAINT "{TABLE}_pkey" TO "{OLD_TABLE}_pkey"')
+        cursor.execute(f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+                       f'PRIMARY KEY (id, created)) PARTITION BY RANGE (created)')
+        move_indexes_and_foreign_keys(cursor, OLD_TABLE, TABLE)
+        cursor.execute(f'CREATE INDEX "{TABLE}_created_brin" ON "{TABLE}" USING brin (created)')
+
+        cursor.execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+        cursor.execute(f'SELECT min(created) FROM "{OLD_TABLE}"')
+        now = datetime.now(timezone.utc)
+        first = month_start(cursor.fetchone()[0] or now)
+        month, last = first, month_start(now, MONTHS_AHEAD)
+        while month <= last:
+            cursor.execute(f'CREATE TABLE "{TABLE}_p{month:%Y_%m}" PARTITION OF "{TABLE}" '
+                           f'FOR VALUES FROM (%s) TO (%s)', [month, month_start(month, 1)])
+            month = month_start(month, 1)
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+        # Check the foreign keys of the copied rows now, before the table is altered again
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'DROP TABLE "{OLD_TABLE}"')
+
+
+def unpartition_snapshots(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP INDEX "{TABLE}_created_brin"')
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+        cursor.execute(f'ALTER TABLE "{OLD_TABLE}" RENAME CONSTRAINT "{TABLE}_pkey" TO "{OLD_TABLE}_pkey"')
+        cursor.execute(f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+                       f'PRIMARY KEY (id))')
+        move_indexes_and_foreign_keys(cursor, OLD_TABLE, TABLE)
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+        # Check the foreign keys of the copied rows now, before the table is altered again
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'DROP TABLE "{OLD_TABLE}" CASCADE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_tracker', '0009_early_warning_score'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='healthsnapshot',
+            name='snapshot_admission_created',
+        ),
+        migrations.AlterField(
+            model_name='healthsnapshotfile',
+            name='patient',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='health_snapshot_files', to='patient_tracker.healthsnapshot'),
+        ),
+        migrations.AlterField(
+            model_name='latestvital',
+            name='snapshot',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patient_tracker.healthsnapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='healthsnapshot',
+            index=models.Index(fields=['admission', '-created'], name='snapshot_admission_created'),
+        ),
+        migrations.RunPython(partition_snapshots, unpartition_snapshots),
+    ]
@@ -1,22 +1,42 @@
-import os
-import string
+import hashlib
+from datetime import datetime, time, timedelta
+from io import BytesIO
+from time import perf_counter
 
 from common.base_models import ImmutableBaseModel, CurrentBaseModel
-from patient.models import Patient
-from equipment.models import Bed, BedType
+from patient.models import Patient, PersonalData
+from equipment.models import Bed, BedType, NoBedAvailable
+from patient_tracker import early_warning
+from patient_tracker.barcodes import allocator as barcode_allocator
+from patient_tracker.signals import health_snapshots_created
 
-from random import choice
 from barcode import EAN13
 from barcode.writer import ImageWriter
 from django.conf import settings
-from django.core.files.images import ImageFile
-from django.db import transaction
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Count, F, Avg, Subquery, OuterRef, Max
-from django.forms import model_to_dict
+from django.db.models import Count, F, Avg, Subquery, OuterRef, Max, Q, Value
+from django.db.models.functions import Coalesce, Concat, TruncDate
 from django.utils import timezone as tz
+from model_utils.managers import SoftDeletableManager
+
+
+def start_of_day(day):
+    """Aware datetime at midnight of `day` in the current timezone"""
+    return tz.make_aware(datetime.combine(day, time.min))
+
+
+def update_current_state(record, **values):
+    """Write current state columns of the admission a record belongs to, and of its loaded instance"""
+    if type(record)._meta.get_field('admission').is_cached(record):
+        record.admission.update_current_state(**values)
+    else:
+        Admission.objects.filter(pk=record.admission_id).update(**values)
 
 
 class BedAssignment(ImmutableBaseModel):
@@ -24,6 +44,7 @@ class BedAssignment(ImmutableBaseModel):
     bed = models.ForeignKey('equipment.Bed', related_name='assignments', on_delete=models.CASCADE)
     assigned_at = models.DateTimeField(auto_now_add=True)
     unassigned_at = models.DateTimeField(null=True, blank=True, default=None)
+    allocation_time = models.DurationField(null=True, blank=True, editable=False)
 
     class BedAssignmentManager(models.Manager):
 
@@ -41,6 +62,11 @@ class BedAssignment(ImmutableBaseModel):
     @transaction.atomic
     def save(self, **kwargs):
         super().save(**kwargs)
+        if self.unassigned_at:
+            update_current_state(self, current_bed_id=None, current_bed_type_id=None)
+        else:
+            update_current_state(self, current_bed_id=self.bed_id, current_bed_type_id=self.bed.bed_type_id)
+            WaitingListEntry.objects.filter(admission_id=self.admission_id).delete()
         bed = self.bed
         if self.unassigned_at:
             bed.state = Bed.StateChoices.OUT_OF_SERVICE
@@ -74,6 +100,78 @@ class Admission(CurrentBaseModel):
         def rejected(self):
             return self.get_queryset().filter(admitted_at__isnull=True)
 
+        def with_current_state(self):
+            """Admissions with what `AdmissionSerializer` displays loaded up front: patient and users"""
+            qs = self.get_queryset()
+            qs = qs.select_related('patient', 'creator', 'modifier')
+            qs = qs.prefetch_related(
+                'creator__groups', 'creator__user_permissions', 'modifier__groups', 'modifier__user_permissions',
+            )
+            return qs
+
+        def active(self):
+            """Admitted patients not discharged yet"""
+            return self.get_queryset().filter(admitted=True, discharged_at__isnull=True)
+
+        def deteriorating(self):
+            """Active admissions with an early warning score, the highest first, with their previous score"""
+            previous_score = HealthSnapshot.objects \
+                .filter(admission=OuterRef('pk'), early_warning_score__isnull=False) \
+                .order_by('-created').values('early_warning_score')[1:2]
+            return self.active().filter(current_early_warning_score__isnull=False) \
+                .annotate(previous_early_warning_score=Subquery(previous_score)) \
+                .order_by('-current_early_warning_score', 'admitted_at')
+
+        def waiting(self):
+            """Admitted patients without a bed"""
+            return self.get_queryset().filter(admitted=True, current_bed__isnull=True)
+
+        def with_expected_state(self):
+            """Admissions annotated with the current state columns computed from the records they follow"""
+            latest_severity = HealthSnapshot.objects.filter(admission=OuterRef('pk')) \
+                .order_by('-created').values('severity')[:1]
+            open_assignment = BedAssignment.objects.filter(admission=OuterRef('pk'), unassigned_at__isnull=True) \
+                .order_by('-assigned_at')
+            last_discharge = Discharge.objects.filter(admission=OuterRef('pk')) \
+                .order_by('-discharged_at').values('discharged_at')[:1]
+            display_name = PersonalData.objects.filter(patient=OuterRef('patient')) \
+                .annotate(name=Concat('first_name', Value(' '), 'last_name')).values('name')[:1]
+            latest_score = HealthSnapshot.objects.filter(admission=OuterRef('pk')) \
+                .order_by('-created').values('early_warning_score')[:1]
+
+            return self.get_queryset().annotate(
+                expected_current_severity=Subquery(latest_severity),
+                expected_current_bed_id=Subquery(open_assignment.values('bed')[:1], output_field=models.UUIDField()),
+                expected_current_bed_type_id=Subquery(open_assignment.values('bed__bed_type')[:1],
+                                                      output_field=models.UUIDField()),
+                expected_discharged_at=Subquery(last_discharge),
+                expected_display_name=Coalesce(Subquery(display_name), Value('')),
+                expected_current_early_warning_score=Subquery(latest_score),
+            )
+
+        def verify_current_state(self):
+            """Return the current state columns that differ from the records, as (id, column, stored, expected)"""
+            columns = Admission.current_state_columns
+            rows = self.with_expected_state().order_by('pk').values_list(
+                'pk', *columns, *[f'expected_{column}' for column in columns])
+            return [
+                (row[0], column, row[1 + i], row[1 + len(columns) + i])
+                for row in rows.iterator()
+                for i, column in enumerate(columns)
+                if row[1 + i] != row[1 + len(columns) + i]
+            ]
+
+        @transaction.atomic
+        def repair_current_state(self):
+            """Rewrite the current state columns that drifted, returns the mismatches fixed"""
+            mismatches = self.verify_current_state()
+            columns = Admission.current_state_columns
+            rows = self.with_expected_state().filter(pk__in={mismatch[0] for mismatch in mismatches}) \
+                .values_list('pk', *[f'expected_{column}' for column in columns])
+            admissions = [Admission(pk=row[0], **dict(zip(columns, row[1:]))) for row in rows]
+            self.bulk_update(admissions, columns, batch_size=500)
+            return mismatches
+
         def average_duration(self):
             qs = self.get_queryset()
             qs = qs.annotate(nb_discharges=Count('discharge_events')).exclude(nb_discharges=0)
@@ -88,21 +186,36 @@ class Admission(CurrentBaseModel):
             average_duration = qs.aggregate(average_duration=Avg(F('left_at') - F('admitted_at')))['average_duration']
             return average_duration
 
-        def admissions_per_day(self):
+        def admissions_per_day(self, start=None, end=None):
+            """Number of accepted admissions per day, split by the severity of their first health snapshot.
+
+            Runs as a single query: the first snapshot is picked per admission by a correlated subquery
+            served by the (admission, created) index, and the database groups by day and severity.
+            Admissions without any snapshot are left out. The dashboard reads the same numbers from
+            `ActivityRollup`, which is verified against this query.
+
+            Arguments:
+                start -- first admission day to include (date, inclusive)
+                end -- last admission day to include (date, inclusive)
+            """
+            first_severity = HealthSnapshot.objects.filter(admission=OuterRef('pk')) \
+                .order_by('created').values('severity')[:1]
+
             qs = self.accepted()
-            qs = qs.order_by('admitted_at')
-            qs = qs.extra(select={'day': 'date(admitted_at)'})
-            all_results = [[x.day, x.health_snapshots.order_by(
-                'created')[0].severity] for x in qs if x.health_snapshots.order_by('created').count() > 0]
+            if start:
+                qs = qs.filter(admitted_at__gte=start_of_day(start))
+            if end:
+                qs = qs.filter(admitted_at__lt=start_of_day(end + timedelta(days=1)))
+            qs = qs.annotate(day=TruncDate('admitted_at'), label=Subquery(first_severity))
+            qs = qs.filter(label__isnull=False)
+            qs = qs.order_by('day', 'label')
+            qs = qs.values('day', 'label')
+            qs = qs.annotate(value=Count('id'))
+
             admissions = {}
-            for [day, label] in all_results:
-                if day not in admissions:
-                    admissions[day] = {}
-                if label not in admissions[day]:
-                    admissions[day][label] = 0
-                admissions[day][label] += 1
-            return [{'date': key, 'count': [{'label': label, 'value': count} for [label, count] in value.items()]} for
-                    [key, value] in admissions.items()]
+            for row in qs:
+                admissions.setdefault(row['day'], []).append({'label': row['label'], 'value': row['value']})
+            return [{'date': day, 'count': count} for day, count in admissions.items()]
 
     objects = AdmissionManager()
 
@@ -113,75 +226,155 @@ class Admission(CurrentBaseModel):
     admitted_at = models.DateTimeField(null=True, default=None)
     admitted = models.BooleanField(default=True)
 
+    # Current state, denormalized from the health snapshots, bed assignments, discharges and personal data.
+    # Written with the records they follow, by `update_current_state`, never by `save()`.
+    # `repair_admission_state` rebuilds them.
+    current_severity = models.CharField(max_length=6, null=True, blank=True, editable=False)
+    current_bed = models.ForeignKey(Bed, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                    related_name='+')
+    current_bed_type = models.ForeignKey(BedType, on_delete=models.SET_NULL, null=True, blank=True,
+                                         editable=False, db_index=False, related_name='+')
+    discharged_at = models.DateTimeField(null=True, blank=True, editable=False)
+    display_name = models.CharField(max_length=101, blank=True, default='', editable=False)
+    # Written by `early_warning.update_scores`
+    current_early_warning_score = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+
+    current_state_columns = ['current_severity', 'current_bed_id', 'current_bed_type_id', 'discharged_at',
+                             'display_name', 'current_early_warning_score']
+
     @property
     def patient_display(self):
-        if self.patient and self.patient.personal_data:
-            data = self.patient.personal_data
-            return f'{data.first_name} {data.last_name}'
-        else:
-            return '-'
+        return self.display_name or '-'
 
-    def generate_barcode_image(self):
+    def update_current_state(self, **values):
+        """Write current state columns, without saving the rest of the admission"""
+        Admission.objects.filter(pk=self.pk).update(**values)
+        for column, value in values.items():
+            setattr(self, column, value)
 
-        image = ImageFile(f'/tmp/{self.local_barcode}.jpeg')
+    # Bump when the rendering changes, so that images are stored under new keys
+    barcode_image_version = 1
 
-        with open(image.file, 'wb') as f:
-            EAN13(self.local_barcode, writer=ImageWriter()).write(f)
-
-        with open(image.file, 'rb') as f:
-            self.local_barcode_image.save(f'{self.local_barcode}.jpeg', ImageFile(f), save=False)
-
-        os.unlink(image.file)
+    @property
+    def barcode_image_key(self):
+        """Storage path of the barcode image, derived from what is rendered into it"""
+        digest = hashlib.sha256(f'{self.barcode_image_version}:{self.local_barcode}'.encode()).hexdigest()
+        return f'barcodes/{digest[:2]}/{digest}.png'
+
+    def render_barcode_image(self):
+        """Render the barcode as a PNG image, in memory"""
+        buffer = BytesIO()
+        EAN13(self.local_barcode, writer=ImageWriter()).write(buffer)
+        return buffer.getvalue()
+
+    def store_barcode_image(self):
+        """Render the barcode image into the storage unless it is already there.
+
+        Returns:
+            bytes -- the rendered image, None if it was already stored
+        """
+        key = self.barcode_image_key
+        content = None
+        if not default_storage.exists(key):
+            content = self.render_barcode_image()
+            name = default_storage.save(key, ContentFile(content))
+            if name != key:
+                # Stored concurrently under the same key
+                default_storage.delete(name)
+
+        if self.local_barcode_image.name != key:
+            # Bypass save(): storing the image is not a change of the admission
+            Admission.objects.filter(pk=self.pk).update(local_barcode_image=key)
+            self.local_barcode_image.name = key
+        return content
+
+    def get_barcode_image(self):
+        """PNG bytes of the barcode image, rendered and stored on first use then served from the cache.
+
+        Images are stored under a key derived from the barcode, so an image is only ever rendered
+        once per barcode and stored images never need to be invalidated.
+        """
+        cache_key = f'barcode-image:{self.barcode_image_key}'
+        content = cache.get(cache_key)
+        if content is None:
+            content = self.store_barcode_image()
+            if content is None:
+                with default_storage.open(self.barcode_image_key) as f:
+                    content = f.read()
+            cache.set(cache_key, content, settings.BARCODE_IMAGE_CACHE_TIMEOUT)
+        return content
 
     def save(self, **kwargs):
         if not self.local_barcode:
-            local_barcode = ''.join(choice(string.digits) for _ in range(13))
-            while Admission.objects.filter(local_barcode=local_barcode).exists():
-                local_barcode = ''.join(choice(string.digits) for _ in range(13))
-            self.local_barcode = local_barcode
+            self.local_barcode = barcode_allocator.allocate()
 
         if not self.admitted_at and self.admitted:
             self.admitted_at = tz.now()
 
+        adding = self._state.adding
+        if adding:
+            data = getattr(self.patient, 'personal_data', None)
+            self.display_name = data.display_name if data else ''
+        elif kwargs.get('update_fields') is None:
+            # Leave the current state columns alone: this instance may not hold their latest values
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.current_state_columns
+            ]
         super().save(**kwargs)
-        self.generate_barcode_image()
-
-    @property
-    def current_severity(self):
-        snapshot = self.health_snapshots.first()
-        return snapshot.severity if snapshot else None
+        if adding:
+            from jobs.queue import enqueue
+            from patient_tracker.tasks import render_barcode_image
+            enqueue(render_barcode_image, str(self.pk))
+        if not self.admitted:
+            WaitingListEntry.objects.filter(admission=self).delete()
 
     @property
     def flattened_snapshot(self):
-        result = {}
-        for ss in self.health_snapshots.all().reverse():
-            d = model_to_dict(ss, exclude=['admission'])
-            result.update({k: v for k, v in d.items() if v != "" and v is not None})
-        return result
-
-    @property
-    def current_bed(self):
-        try:
-            return self.assignments.filter(unassigned_at__isnull=True).latest('-assigned_at').bed
-        except BedAssignment.DoesNotExist:
-            return None
+        """Latest known value of each vital, read from the `latest_vitals` projection (prefetch-aware)"""
+        return {vital.name: vital.value for vital in self.latest_vitals.all()}
 
     @transaction.atomic
-    def assign_bed(self, bed_type):
-        current_bed = self.current_bed
-
-        if current_bed:
-            assignment = BedAssignment.objects.get(bed=current_bed, admission=self)
-            assignment.unassigned_at = tz.now()
-            assignment.save()
-
-        new_bed = bed_type.beds.available().first()
-        if not new_bed:
-            raise Bed.DoesNotExist(f'There are no bed available for this type: {bed_type.name}')
-        assignment = BedAssignment(admission=self, bed=new_bed, current_user=self.current_user)
+    def assign_bed(self, bed_type, bed=None):
+        """Move the patient to an available bed of `bed_type`, releasing their current bed.
+
+        The new bed is claimed with a row lock, so concurrent calls never get the same bed.
+        The time spent claiming it is recorded on the assignment.
+
+        Arguments:
+            bed_type -- type of the bed to move to
+            bed -- available bed already claimed in the current transaction, to use instead
+
+        Raises:
+            NoBedAvailable -- there is no available bed of this type left
+        """
+        started_at = perf_counter()
+        new_bed = bed or Bed.objects.claim(bed_type)
+        allocation_time = timedelta(seconds=perf_counter() - started_at)
+
+        current_assignment = self.assignments.filter(unassigned_at__isnull=True).first()
+        if current_assignment:
+            current_assignment.unassigned_at = tz.now()
+            current_assignment.save()
+
+        assignment = BedAssignment(admission=self, bed=new_bed, allocation_time=allocation_time,
+                                   current_user=self.current_user)
         assignment.save()
         return new_bed
 
+    @transaction.atomic
+    def request_bed(self, bed_type):
+        """Assign a bed of `bed_type`, or queue the admission for one when none is free.
+
+        Returns:
+            Bed -- the assigned bed, None when the admission has been queued
+        """
+        try:
+            return self.assign_bed(bed_type)
+        except NoBedAvailable:
+            WaitingListEntry.objects.enqueue(self, bed_type)
+            return None
+
     def discharge(self):
         res = Discharge(admission=self, current_user=self.current_user)
         res.save()
@@ -194,7 +387,7 @@ class Admission(CurrentBaseModel):
 
     @property
     def is_discharged(self):
-        return self.discharge_events.first() is not None
+        return self.discharged_at is not None
 
     def discharged(self):
         return self.is_discharged
@@ -212,8 +405,52 @@ class Admission(CurrentBaseModel):
     def __str__(self):
         return f'{str(self.id)[:12]}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['admitted_at'], name='admission_admitted_at'),
+            models.Index(fields=['created', 'id'], name='admission_created_id'),
+            models.Index(fields=['current_bed_type', 'current_severity'], name='admission_bed_type_severity'),
+            models.Index(fields=['current_severity'], condition=Q(admitted=True, current_bed__isnull=True),
+                         name='admission_waiting_severity'),
+            models.Index(fields=['-current_early_warning_score', 'admitted_at'],
+                         condition=Q(admitted=True, discharged_at__isnull=True), name='admission_active_ews'),
+        ]
+
 
 class HealthSnapshot(ImmutableBaseModel):
+
+    class HealthSnapshotManager(SoftDeletableManager):
+
+        @transaction.atomic
+        def bulk_record(self, snapshots, user, batch_size=1000):
+            """Insert new snapshots in batches, and update what `save` updates once per admission.
+
+            The admissions take the severity of their last snapshot in the list, and the latest
+            vitals the values of their snapshots. `health_snapshots_created` is sent instead of the
+            `post_save` signal of each snapshot.
+            """
+            for snapshot in snapshots:
+                snapshot.creator = user
+            self.bulk_create(snapshots, batch_size=batch_size)
+
+            severities = {snapshot.admission_id: snapshot.severity for snapshot in snapshots}
+            admissions_by_severity = {}
+            for admission_id, severity in severities.items():
+                admissions_by_severity.setdefault(severity, []).append(admission_id)
+            for severity, admission_ids in admissions_by_severity.items():
+                for start in range(0, len(admission_ids), batch_size):
+                    batch = admission_ids[start:start + batch_size]
+                    Admission.objects.filter(pk__in=batch).update(current_severity=severity)
+                    WaitingListEntry.objects.filter(admission_id__in=batch) \
+                        .update(priority=severity_priority(severity))
+
+            LatestVital.objects.record_many(snapshots)
+            early_warning.update_scores(list(severities))
+            health_snapshots_created.send(sender=HealthSnapshot, snapshots=snapshots)
+            return snapshots
+
+    objects = HealthSnapshotManager()
+
     class SeverityChoices(models.TextChoices):
         RED = 'RED', 'Red'
         YELLOW = 'YELLOW', 'Yellow'
@@ -240,6 +477,31 @@ class HealthSnapshot(ImmutableBaseModel):
     observations = models.TextField(null=True, blank=True)
 
     severity = models.CharField(max_length=6, choices=SeverityChoices.choices)
+    # NEWS2 score of the latest known vitals of the admission when this snapshot was its latest,
+    # see `patient_tracker.early_warning`
+    early_warning_score = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+
+    # Fields projected into `LatestVital`
+    vital_fields = [
+        'main_complain',
+        'blood_pressure_systolic',
+        'blood_pressure_diastolic',
+        'heart_rate',
+        'breathing_rate',
+        'temperature',
+        'oxygen_saturation',
+        'gcs_eye',
+        'gcs_verbal',
+        'gcs_motor',
+        'observations',
+        'severity',
+    ]
+
+    @property
+    def vitals(self):
+        """Values of the vital fields recorded by this snapshot, leaving out the empty ones"""
+        values = {name: getattr(self, name) for name in self.vital_fields}
+        return {name: value for name, value in values.items() if value != '' and value is not None}
 
     @property
     def gcs_total(self):
@@ -247,11 +509,231 @@ class HealthSnapshot(ImmutableBaseModel):
             return 0
         return self.gcs_eye + self.gcs_verbal + self.gcs_motor
 
+    @transaction.atomic
+    def save(self, **kwargs):
+        """Record the snapshot, and project it into the current state of its admission.
+
+        A new snapshot costs about 8 statements: its insert, the current severity, one upsert of the
+        latest vitals, the early warning score (2 reads, 1 or 2 updates) read back, and the waiting
+        list position. No row of the admission is locked. Use `HealthSnapshot.objects.bulk_record`
+        to record many snapshots, with a fixed number of statements per batch.
+        """
+        adding = self._state.adding
+        super().save(**kwargs)
+        if adding:
+            update_current_state(self, current_severity=self.severity)
+            LatestVital.objects.record(self)
+            early_warning.update_scores([self.admission_id])
+            self.refresh_from_db(fields=['early_warning_score'])
+        WaitingListEntry.objects.requeue(self.admission_id, self.severity)
+
     def __str__(self):
         return f'{self.created} - {self.severity or ""}'
 
     class Meta:
         ordering = ['-created']
+        # On PostgreSQL the table is partitioned by month of `created`, see `patient_tracker.partitions`
+        indexes = [
+            models.Index(fields=['admission', '-created'], name='snapshot_admission_created'),
+            models.Index(fields=['created', 'id'], name='snapshot_created_id'),
+        ]
+
+
+class LatestVital(models.Model):
+    """Latest known value of each vital of an admission, and the snapshot it was recorded by.
+
+    Maintained by `HealthSnapshot.save` as snapshots are recorded, so that the current vitals of an
+    admission are read without going through its snapshots. `rebuild_latest_vitals` regenerates the
+    projection from the snapshots.
+    """
+
+    class LatestVitalManager(models.Manager):
+
+        def record(self, snapshot):
+            """Project the values of a new snapshot, unless a later snapshot already set them"""
+            self.record_many([snapshot])
+
+        def record_many(self, snapshots):
+            """Project the values of new snapshots, of any admissions, with one upsert per 1000 vitals.
+
+            Each vital is inserted, or updated unless a later snapshot already set it, by `INSERT ... ON
+            CONFLICT` on `unique_latest_vital`: concurrent snapshots of an admission only wait on the
+            rows of the vitals they both record, and nothing is read first.
+            """
+            latest = {}
+            for snapshot in snapshots:
+                for name, value in snapshot.vitals.items():
+                    key = (snapshot.admission_id, name)
+                    # A statement can only upsert a row once
+                    if key not in latest or latest[key][2] <= snapshot.created:
+                        latest[key] = (value, snapshot.pk, snapshot.created)
+            if not latest:
+                return
+
+            fields = [self.model._meta.get_field(name)
+                      for name in ['admission', 'name', 'value', 'snapshot', 'recorded_at']]
+            rows = [[field.get_db_prep_save(value, connection) for field, value in
+                     zip(fields, [admission_id, name, value, snapshot_id, recorded_at])]
+                    for (admission_id, name), (value, snapshot_id, recorded_at) in latest.items()]
+            table, columns = self.model._meta.db_table, ', '.join(field.column for field in fields)
+            upsert = (f'ON CONFLICT (admission_id, name) DO UPDATE SET value = EXCLUDED.value, '
+                      f'snapshot_id = EXCLUDED.snapshot_id, recorded_at = EXCLUDED.recorded_at '
+                      f'WHERE "{table}".recorded_at <= EXCLUDED.recorded_at')
+            with connection.cursor() as cursor:
+                for start in range(0, len(rows), 1000):
+                    batch = rows[start:start + 1000]
+                    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+                    cursor.execute(f'INSERT INTO "{table}" ({columns}) VALUES {values} {upsert}',
+                                   [value for row in batch for value in row])
+
+        @transaction.atomic
+        def rebuild(self):
+            """Recompute the whole projection from the snapshots, returns the number of entries"""
+            latest = {}
+            snapshots = HealthSnapshot.objects.order_by('admission_id', 'created')
+            for snapshot in snapshots.iterator():
+                for name, value in snapshot.vitals.items():
+                    latest[(snapshot.admission_id, name)] = (value, snapshot.pk, snapshot.created)
+
+            self.all().delete()
+            self.bulk_create([
+                LatestVital(admission_id=admission_id, name=name, value=value, snapshot_id=snapshot_id,
+                            recorded_at=recorded_at)
+                for (admission_id, name), (value, snapshot_id, recorded_at) in latest.items()
+            ], batch_size=1000)
+            return len(latest)
+
+    objects = LatestVitalManager()
+
+    admission = models.ForeignKey(Admission, on_delete=models.CASCADE, related_name='latest_vitals')
+    name = models.CharField(max_length=30)
+    value = models.JSONField()
+    # The partitioned snapshot table has no unique constraint on `id` alone for a foreign key to reference:
+    # the reference is not enforced, see `partitions.orphaned_rows`
+    snapshot = models.ForeignKey(HealthSnapshot, on_delete=models.CASCADE, related_name='+', db_constraint=False)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['admission', 'name'], name='unique_latest_vital'),
+        ]
+
+    def __str__(self):
+        return f'{self.admission_id} - {self.name}: {self.value}'
+
+
+class WaitingListEntry(models.Model):
+    """An admission waiting for a bed of a given type.
+
+    Each bed type has its own queue, ordered by the severity of the admission (most severe first)
+    then by arrival. The `waiting_list_order` index covers that ordering, so the head of a queue
+    is found, and an entry moved within it, with a single index lookup rather than a scan of the
+    admissions.
+
+    Entries are removed when the admission gets a bed or is no longer admitted, and move with
+    the severity of each new health snapshot.
+    """
+
+    class WaitingListEntryManager(models.Manager):
+
+        def enqueue(self, admission, bed_type):
+            """Put the admission in the queue of `bed_type`, keeping its arrival time if already queued"""
+            entry, _ = self.update_or_create(admission=admission, defaults={
+                'bed_type': bed_type,
+                'priority': severity_priority(admission.current_severity),
+            })
+            return entry
+
+        def requeue(self, admission_id, severity):
+            """Move a queued admission to the position of its new severity"""
+            return self.filter(admission_id=admission_id).update(priority=severity_priority(severity))
+
+        def head(self, bed_type):
+            """Lock and return the first entry of the queue of `bed_type`, skipping entries being served"""
+            qs = self.filter(bed_type=bed_type).select_related('admission')
+            if connection.features.has_select_for_update_skip_locked:
+                qs = qs.select_for_update(skip_locked=True, of=('self',))
+            return qs.first()
+
+        @transaction.atomic
+        def serve(self, bed_type, user, bed=None):
+            """Assign available beds of `bed_type` to the head of its queue, until either runs out.
+
+            Arguments:
+                bed_type -- type of the beds and queue
+                user -- user to record on the assignments
+                bed -- available bed to give to the head of the queue, instead of claiming beds
+
+            Returns:
+                list -- the admissions that have been assigned a bed
+
+            Raises:
+                ValueError -- an admission is waiting but no user was given to record its assignment
+            """
+            served = []
+            while True:
+                entry = self.head(bed_type)
+                if not entry:
+                    break
+                if user is None:
+                    raise ValueError(f'A user is required to assign a {bed_type.name} bed to the waiting list')
+                admission = entry.admission
+                admission.current_user = user
+                try:
+                    admission.assign_bed(bed_type, bed=bed)
+                except NoBedAvailable:
+                    break
+                served.append(admission)
+                if bed:
+                    break
+            return served
+
+    objects = WaitingListEntryManager()
+
+    admission = models.OneToOneField(Admission, on_delete=models.CASCADE, related_name='waiting_list_entry')
+    bed_type = models.ForeignKey(BedType, on_delete=models.CASCADE, related_name='waiting_list')
+    priority = models.PositiveSmallIntegerField()
+    arrived_at = models.DateTimeField(default=tz.now)
+
+    class Meta:
+        verbose_name_plural = 'waiting list entries'
+        ordering = ['priority', 'arrived_at', 'id']
+        indexes = [
+            models.Index(fields=['bed_type', 'priority', 'arrived_at', 'id'], name='waiting_list_order'),
+        ]
+
+    def __str__(self):
+        return f'{self.bed_type_id} - {self.admission_id}'
+
+
+def severity_priority(severity):
+    """Rank of a severity in the waiting queues, the most severe first and unknown severities last"""
+    severities = HealthSnapshot.SeverityChoices.values
+    return severities.index(severity) if severity in severities else len(severities)
+
+
+class BarcodeSequence(models.Model):
+    """Last barcode serial number handed out, on databases without native sequences.
+
+    PostgreSQL uses the `patient_tracker_barcode_seq` sequence instead, see `patient_tracker.barcodes`.
+    """
+
+    class BarcodeSequenceManager(models.Manager):
+
+        @transaction.atomic
+        def reserve(self, size):
+            sequence, _ = self.select_for_update().get_or_create(pk=1)
+            start = sequence.last_value + 1
+            sequence.last_value += size
+            sequence.save()
+            return list(range(start, sequence.last_value + 1))
+
+    objects = BarcodeSequenceManager()
+
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.last_value)
 
 
 class Discharge(ImmutableBaseModel):
@@ -271,6 +753,7 @@ class Discharge(ImmutableBaseModel):
         """
         # Complete the discharge save
         super().save()
+        update_current_state(self, discharged_at=self.discharged_at)
 
         # Does the current admission have an assigned bed already?
         bed = self.admission.current_bed
@@ -316,7 +799,9 @@ class Deceased(ImmutableBaseModel):
 class HealthSnapshotFile(ImmutableBaseModel):
     image_path = 'health_snapshot_file'
 
-    patient = models.ForeignKey(HealthSnapshot, on_delete=models.CASCADE, related_name='health_snapshot_files')
+    # Not enforced by the database either, like `LatestVital.snapshot`
+    patient = models.ForeignKey(HealthSnapshot, on_delete=models.CASCADE, related_name='health_snapshot_files',
+                                db_constraint=False)
     file = models.ImageField(upload_to=image_path)
     notes = models.TextField()
 
@@ -0,0 +1,226 @@
+"""Vitals streamed by bedside monitors, recorded as batches of health snapshots.
+
+Monitors connect over TCP, send the shared token as the first line and then one JSON reading
+per line. Connections without the token are closed before any reading is read. A reading holds
+the `local_barcode` of the admission, vital fields of `HealthSnapshot` and optionally the time
+it was measured at, as ISO 8601 `recorded_at` with a UTC offset, e.g. `{"local_barcode":
+"2000000000015", "heart_rate": 72, "recorded_at": "2026-10-18T09:30:00Z"}`. Readings without a
+severity keep the current severity of the admission.
+
+The snapshots are created at the time of their reading, or at the time it was received without
+one, rather than when their batch is recorded, which can be much later after failed flushes.
+Readings measured more than `MAX_CLOCK_SKEW` in the future are rejected, as they would hide the
+later ones from the latest vitals.
+
+Readings are buffered per admission and recorded with `HealthSnapshot.objects.bulk_record` once
+`batch_size` readings are buffered, or `flush_interval` seconds after the previous flush. The
+database is written by a single thread, one batch at a time: readings keep buffering during a
+flush up to `max_pending`, past which the connections are no longer read until the flush ends,
+so that the monitors are slowed down by TCP rather than the buffers growing without bounds.
+
+The readings of a batch that could not be recorded, e.g. while the database is unavailable, are
+put back in front of the buffers and retried every `retry_delay` seconds, the monitors being
+slowed down in the meantime. Once stopping, they are only retried `max_attempts` times.
+"""
+import asyncio
+import hmac
+import json
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+MAX_CLOCK_SKEW = timedelta(minutes=1)
+
+
+def is_valid_token(candidate, token):
+    return hmac.compare_digest(candidate.encode(), token.encode())
+
+
+def recorded_at(reading, received_at):
+    """Time the reading was measured at, popped from it, or `received_at` without one"""
+    value = reading.pop('recorded_at', None)
+    if value is None:
+        return received_at
+    moment = parse_datetime(value)
+    if moment is None or timezone.is_naive(moment):
+        raise ValueError(f'Invalid recorded_at {value!r}, ISO 8601 with a UTC offset expected')
+    if moment > received_at + MAX_CLOCK_SKEW:
+        raise ValueError(f'recorded_at {value!r} is in the future')
+    return moment
+
+
+class MonitorIngestion:
+    """Server receiving the readings of the monitors and recording them in batches"""
+
+    def __init__(self, user, token, batch_size=500, flush_interval=1.0, max_pending=10000, retry_delay=1.0,
+                 max_attempts=5):
+        if not token:
+            raise ValueError('The monitors need a token to authenticate')
+        self.user = user
+        self.token = token
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+
+        # Readings of each admission waiting for the next flush, by barcode
+        self.buffers = {}
+        # Readings buffered or being recorded
+        self.pending = 0
+        self.stats = Counter()
+        self.connections = set()
+        self.stopping = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='monitors')
+
+    async def start(self, host, port):
+        self.space = asyncio.Condition()
+        self.flush_now = asyncio.Event()
+        self.flusher = asyncio.ensure_future(self.run_flusher())
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        """Close the connections, and record the buffered readings"""
+        self.server.close()
+        await self.server.wait_closed()
+        for writer in list(self.connections):
+            writer.close()
+        self.stopping = True
+        self.flush_now.set()
+        await self.flusher
+        for _ in range(self.max_attempts):
+            if await self.flush():
+                break
+            await asyncio.sleep(self.retry_delay)
+        else:
+            logger.error('Dropped %s monitor readings that could not be recorded', self.pending)
+        self.executor.shutdown()
+
+    async def handle_connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            first_line = await reader.readline()
+            if not is_valid_token(first_line.decode('latin-1').strip(), self.token):
+                self.refuse(writer)
+            else:
+                line = await reader.readline()
+                while line:
+                    await self.receive(line)
+                    line = await reader.readline()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as error:
+            # Line over the size limit of the reader
+            logger.warning('Monitor connection closed: %s', error)
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    def refuse(self, writer):
+        self.stats['refused'] += 1
+        logger.warning('Monitor connection from %s refused', writer.get_extra_info('peername'))
+
+    async def receive(self, line):
+        """Buffer the reading of a line, once there is room for it"""
+        if not line.strip():
+            return
+        self.stats['received'] += 1
+        try:
+            reading = json.loads(line)
+            barcode = reading.pop('local_barcode')
+            created = recorded_at(reading, timezone.now())
+        except (ValueError, TypeError, AttributeError, KeyError) as error:
+            self.stats['rejected'] += 1
+            logger.warning('Invalid monitor reading %r: %s', line[:200], error)
+            return
+
+        if self.pending >= self.max_pending:
+            self.stats['throttled'] += 1
+            async with self.space:
+                await self.space.wait_for(lambda: self.pending < self.max_pending)
+        if self.stopping:
+            return
+        self.buffers.setdefault(str(barcode), []).append((created, reading))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush_now.set()
+
+    async def run_flusher(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_now.clear()
+            if not await self.flush():
+                await asyncio.sleep(self.retry_delay)
+
+    async def flush(self):
+        """Record the buffered readings, putting them back in the buffers if they could not be.
+
+        Returns:
+            bool -- whether the readings were recorded or rejected
+        """
+        buffers, self.buffers = self.buffers, {}
+        size = sum(len(readings) for readings in buffers.values())
+        if not size:
+            return True
+        try:
+            recorded, rejected = await asyncio.get_running_loop().run_in_executor(self.executor, self.record, buffers)
+        except Exception:
+            logger.exception('Could not record %s monitor readings, retrying', size)
+            self.stats['failures'] += 1
+            # In front of the readings received meanwhile, to keep the order of each admission
+            for barcode, readings in buffers.items():
+                self.buffers[barcode] = readings + self.buffers.get(barcode, [])
+            return False
+        self.stats['recorded'] += recorded
+        self.stats['rejected'] += rejected
+        self.stats['flushes'] += 1
+
+        self.pending -= size
+        async with self.space:
+            self.space.notify_all()
+        return True
+
+    def record(self, buffers):
+        """Record the readings of `buffers` as health snapshots, in the thread writing to the database.
+
+        Returns:
+            tuple -- numbers of readings recorded and rejected
+        """
+        from patient_tracker.models import Admission, HealthSnapshot
+        from patient_tracker.serializers import validate_snapshots
+
+        close_old_connections()
+        admissions = {
+            barcode: (pk, severity) for barcode, pk, severity in Admission.objects
+            .filter(local_barcode__in=list(buffers)).values_list('local_barcode', 'id', 'current_severity')
+        }
+        items, times, rejected = [], [], 0
+        for barcode, readings in buffers.items():
+            if barcode not in admissions:
+                logger.warning('%s monitor readings of unknown admission %s', len(readings), barcode)
+                rejected += len(readings)
+                continue
+            admission_id, severity = admissions[barcode]
+            for created, reading in readings:
+                items.append(dict(reading, admission_id=admission_id, severity=reading.get('severity') or severity))
+                times.append(created)
+
+        snapshots, indexes, errors = validate_snapshots(items)
+        for snapshot, index in zip(snapshots, indexes):
+            snapshot.created = times[index]
+        for error in errors[:10]:
+            logger.warning('Invalid monitor reading %s: %s', items[error['index']], error['errors'])
+        if snapshots:
+            HealthSnapshot.objects.bulk_record(snapshots, self.user)
+        return len(snapshots), rejected + len(errors)
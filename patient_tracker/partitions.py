@@ -0,0 +1,128 @@
+"""Monthly partitions of the health snapshot table on PostgreSQL.
+
+The table is partitioned by range of `created`, one partition per calendar month (UTC) named
+`<table>_pYYYY_MM`, with a default partition holding the rows of the months without one. Queries
+on recent snapshots only read the partitions of their time window, and every partition keeps
+its own, small, `(admission_id, created DESC)` index, along with a BRIN index on `created`.
+
+Partitions have to exist before their month starts, or the new rows land in the default
+partition: `create_partitions` is run ahead of time by the `create_snapshot_partitions`
+management command.
+
+No foreign key can reference the snapshots, whose primary key is `(id, created)`: the references of
+`HealthSnapshotFile.patient` and `LatestVital.snapshot` are not enforced by the database. Deleting
+snapshots through the ORM still deletes their files and latest vitals, but deleting them in SQL, or
+dropping a partition, leaves those rows behind. `orphaned_rows` finds them and `delete_orphaned_rows`
+removes them, by the `clean_snapshot_orphans` management command.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+
+def table_name():
+    from patient_tracker.models import HealthSnapshot
+
+    return HealthSnapshot._meta.db_table
+
+
+def is_partitioned():
+    """Whether the snapshot table is partitioned, which it is on PostgreSQL once migrated"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table_name()])
+        return cursor.fetchone() is not None
+
+
+def month_start(day, months=0):
+    """First day of the month of `day`, moved by `months`"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{table_name()}_p{month:%Y_%m}'
+
+
+def existing_partitions():
+    """Names of the partitions of the snapshot table"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass "
+                       "ORDER BY 1", [table_name()])
+        return [row[0] for row in cursor.fetchall()]
+
+
+@transaction.atomic
+def create_partition(month):
+    """Create the partition of the month starting on `month`, unless it exists.
+
+    The rows of that month already in the default partition are moved to the new partition, as
+    PostgreSQL refuses to attach a partition whose rows the default partition holds.
+
+    Returns:
+        bool -- whether the partition was created
+    """
+    table, name = table_name(), partition_name(month)
+    if name in existing_partitions():
+        return False
+
+    bounds = [datetime(day.year, day.month, 1, tzinfo=dt_timezone.utc) for day in [month, month_start(month, 1)]]
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'WITH moved AS (DELETE FROM "{table}_default" WHERE created >= %s AND created < %s '
+                       f'RETURNING *) INSERT INTO "{name}" SELECT * FROM moved', bounds)
+        cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', bounds)
+    return True
+
+
+def create_partitions(months=3, start=None):
+    """Create the missing partitions from the month of `start`, today by default, to `months` after it.
+
+    Returns:
+        list -- names of the partitions created
+    """
+    first = month_start(start or timezone.now().date())
+    created = []
+    for offset in range(months + 1):
+        month = month_start(first, offset)
+        if create_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def orphaned_rows():
+    """Snapshot files and latest vitals whose snapshot no longer exists, removed or not.
+
+    Returns:
+        dict -- queryset of the orphaned rows of each model
+    """
+    from patient_tracker.models import HealthSnapshot, HealthSnapshotFile, LatestVital
+
+    def orphans(model, field):
+        snapshots = HealthSnapshot.all_objects.filter(pk=OuterRef(field))
+        return model._base_manager.filter(~Exists(snapshots))
+
+    return {
+        HealthSnapshotFile: orphans(HealthSnapshotFile, 'patient_id'),
+        LatestVital: orphans(LatestVital, 'snapshot_id'),
+    }
+
+
+@transaction.atomic
+def delete_orphaned_rows():
+    """Delete the orphaned rows, then project again the snapshots left of the admissions whose latest
+    vitals were deleted.
+
+    Returns:
+        dict -- number of rows deleted of each model
+    """
+    from patient_tracker.models import HealthSnapshot, LatestVital
+
+    orphans = orphaned_rows()
+    admissions = set(orphans[LatestVital].values_list('admission_id', flat=True))
+    deleted = {model: queryset.delete()[0] for model, queryset in orphans.items()}
+    LatestVital.objects.record_many(HealthSnapshot.objects.filter(admission_id__in=admissions).iterator())
+    return deleted
@@ -41,7 +41,8 @@ class AdmissionSerializer(BaseSaveSerializer, serializers.ModelSerializer):
             'admitted_at',
             'current_severity',
             'current_bed',
-            'patient_display'
+            'patient_display',
+            'current_early_warning_score',
         ]
         read_only_fields = CurrentSerializerMeta.read_only_fields
 
@@ -70,10 +71,50 @@ class HealthSnapshotSerializer(BaseSaveSerializer, serializers.ModelSerializer):
             'gcs_motor',
             'observations',
             'severity',
+            'early_warning_score',
         ]
         read_only_fields = ImmutableSerializerMeta.read_only_fields
 
 
+class HealthSnapshotBulkItemSerializer(serializers.ModelSerializer):
+    """A snapshot of a bulk ingestion, whose admission is resolved with the whole batch"""
+    admission_id = serializers.UUIDField()
+
+    class Meta:
+        model = HealthSnapshot
+        fields = ['admission_id'] + HealthSnapshot.vital_fields
+
+
+def validate_snapshots(items):
+    """Validate the snapshots of a bulk ingestion, resolving their admissions in a single query.
+
+    Returns:
+        tuple -- the unsaved `HealthSnapshot` of the valid items, their index in `items`, and
+            the errors of the other items, as a list of `{'index', 'errors'}`
+    """
+    # A single serializer validates every item, as a `ListSerializer` child does
+    serializer = HealthSnapshotBulkItemSerializer()
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as error:
+            errors.append({'index': index, 'errors': error.detail})
+
+    admission_ids = {data['admission_id'] for index, data in valid}
+    known = set(Admission.objects.filter(pk__in=admission_ids).values_list('pk', flat=True))
+
+    snapshots, indexes = [], []
+    for index, data in valid:
+        if data['admission_id'] not in known:
+            errors.append({'index': index, 'errors': {'admission_id': ['Admission not found']}})
+            continue
+        snapshots.append(HealthSnapshot(**data))
+        indexes.append(index)
+    errors.sort(key=lambda error: error['index'])
+    return snapshots, indexes, errors
+
+
 class DischargeSerializer(BaseSaveSerializer, serializers.ModelSerializer):
     admission_id=serializers.PrimaryKeyRelatedField(
         source='admission', write_only=True, queryset=Admission.objects.all())
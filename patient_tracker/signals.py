@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by `HealthSnapshot.objects.bulk_record` with the `snapshots` it inserted, whose
+# `post_save` signals are not sent
+health_snapshots_created = Signal()
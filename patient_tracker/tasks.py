@@ -0,0 +1,10 @@
+from jobs.queue import task
+from patient_tracker.models import Admission
+
+
+@task
+def render_barcode_image(admission_id):
+    """Store the barcode image of a new admission ahead of its first request"""
+    admission = Admission.objects.filter(pk=admission_id).only('id', 'local_barcode', 'local_barcode_image').first()
+    if admission:
+        admission.store_barcode_image()
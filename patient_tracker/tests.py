@@ -1,8 +1,39 @@
-from django.test import TestCase, RequestFactory
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import patch
+from uuid import uuid4
 
-from patient.models import Patient
-from patient_tracker.models import Admission
-from equipment.models import BedType, Bed
+import numpy as np
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+from django.test import Client, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone as tz
+from PIL import Image
+from rest_framework.test import APIClient
+
+from custom_auth.utils import get_user_model
+from jobs.models import Job
+from patient.models import Patient, PersonalData
+from patient_tracker import early_warning, labels, partitions
+from patient_tracker.barcodes import allocator as barcode_allocator, ean13, ean13_check_digit
+from patient_tracker.monitors import MonitorIngestion
+from patient_tracker.trends import lttb
+from patient_tracker.models import Admission, BedAssignment, HealthSnapshot, HealthSnapshotFile, LatestVital, \
+    WaitingListEntry
+from equipment.models import BedType, Bed, NoBedAvailable, BedOccupancy
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from common.base_tests import TestUser
 
@@ -83,3 +114,709 @@ class PatientTrackerTestCase(TestCase, TestUser):
         self.assertEqual(icu.number_assigned, 0)
         self.assertEqual(icu.number_available, 1)
         self.assertEqual(icu.number_out_of_service, 1)
+
+    def test_no_capacity(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        for _ in range(2):
+            Admission.objects.create(patient=patient, current_user=self.test_user).assign_bed(icu)
+
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        self.assertRaises(NoBedAvailable, lambda: admission.assign_bed(icu))
+        self.assertIsNone(admission.current_bed)
+
+        assignment = BedAssignment.objects.filter(bed__bed_type=icu).first()
+        self.assertIsNotNone(assignment.allocation_time)
+
+    def test_waiting_list(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        occupants = [Admission.objects.create(patient=patient, current_user=self.test_user) for _ in range(2)]
+        for admission in occupants:
+            self.assertTrue(admission.request_bed(icu))
+
+        def arrive(severity):
+            admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+            HealthSnapshot.objects.create(admission=admission, severity=severity, current_user=self.test_user)
+            self.assertIsNone(admission.request_bed(icu))
+            return admission
+
+        green, yellow, red = arrive('GREEN'), arrive('YELLOW'), arrive('RED')
+        self.assertEqual([entry.admission for entry in icu.waiting_list.all()], [red, yellow, green])
+
+        # A worse snapshot moves the patient up, ahead of later arrivals of the same severity
+        HealthSnapshot.objects.create(admission=green, severity='RED', current_user=self.test_user)
+        self.assertEqual([entry.admission for entry in icu.waiting_list.all()], [green, red, yellow])
+
+        # A queued patient leaving the hospital leaves the queue
+        red.discharge()
+        self.assertEqual([entry.admission for entry in icu.waiting_list.all()], [green, yellow])
+
+        # The bed freed by a discharge goes to the head of the queue once cleaned
+        bed = occupants[0].current_bed
+        occupants[0].discharge()
+        self.assertIsNone(green.current_bed)
+        bed.refresh_from_db()
+        bed.state = Bed.StateChoices.AVAILABLE
+        bed.current_user = self.test_user
+        bed.save()
+        self.assertEqual(bed.state, Bed.StateChoices.ASSIGNED)
+        green.refresh_from_db()
+        self.assertEqual(green.current_bed, bed)
+        self.assertEqual(BedOccupancy.objects.verify(), [])
+        self.assertEqual((icu.number_assigned, icu.number_available), (2, 0))
+
+        # New beds go to the queue as well
+        icu.total = 4
+        icu.current_user = self.test_user
+        icu.save()
+        yellow.refresh_from_db()
+        self.assertEqual(yellow.current_bed.bed_type, icu)
+        self.assertFalse(WaitingListEntry.objects.exists())
+        self.assertEqual((icu.number_assigned, icu.number_available), (3, 1))
+
+    def test_barcode_image(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        admission.discharge()
+        # Nothing is rendered when saving
+        self.assertFalse(Admission.objects.get(pk=admission.pk).local_barcode_image)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:admission-barcode', kwargs={'pk': admission.pk})
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            with patch.object(Admission, 'render_barcode_image', autospec=True,
+                              side_effect=Admission.render_barcode_image) as render:
+                response = client.get(url)
+                self.assertEqual(response['Content-Type'], 'image/png')
+                self.assertTrue(response.content.startswith(b'\x89PNG'))
+                self.assertEqual(client.get(url).content, response.content)
+                cache.clear()
+                self.assertEqual(client.get(url).content, response.content)
+                self.assertEqual(render.call_count, 1)
+
+            stored = Admission.objects.get(pk=admission.pk).local_barcode_image
+            self.assertEqual(stored.name, admission.barcode_image_key)
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+            other = Admission.objects.create(patient=patient, current_user=self.test_user)
+            # Pre-rendered in the background
+            self.assertTrue(Job.objects.filter(name='patient_tracker.tasks.render_barcode_image',
+                                               args=[str(other.pk)]).exists())
+            out = StringIO()
+            call_command('render_barcode_images', stdout=out)
+            self.assertIn('1 barcode image(s) rendered', out.getvalue())
+            self.assertTrue(default_storage.exists(Admission.objects.get(pk=other.pk).local_barcode_image.name))
+
+    def test_barcode_allocation(self):
+        self.assertEqual(ean13_check_digit('400638133393'), '1')
+        self.assertEqual(ean13('20', 42), '2000000000428')
+
+        patient = Patient.objects.create(current_user=self.test_user)
+        with self.settings(BARCODE_SITE_PREFIX='31', BARCODE_BLOCK_SIZE=3):
+            barcode_allocator.reset()
+            with CaptureQueriesContext(connection) as queries:
+                admissions = [Admission.objects.create(patient=patient, current_user=self.test_user)
+                              for _ in range(7)]
+        barcode_allocator.reset()
+
+        barcodes = [admission.local_barcode for admission in admissions]
+        self.assertEqual(len(set(barcodes)), 7)
+        for barcode in barcodes:
+            self.assertEqual(len(barcode), 13)
+            self.assertTrue(barcode.startswith('31'))
+            self.assertEqual(barcode[-1], ean13_check_digit(barcode))
+        # One reservation and one check of the taken numbers per block of 3, or per number within
+        # a transaction without a native sequence
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT')]
+        nb_blocks = 3 if connection.vendor == 'postgresql' else 7
+        self.assertEqual(len([sql for sql in selects if 'barcode_seq' in sql or 'barcodesequence' in sql]),
+                         nb_blocks)
+        self.assertEqual(len([sql for sql in selects if '"local_barcode" IN' in sql]), nb_blocks)
+
+    def test_barcode_allocation_skips_legacy_barcodes(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        with self.settings(BARCODE_BLOCK_SIZE=2):
+            barcode_allocator.reset()
+            # The random legacy barcodes ending the range the sequence runs in
+            serial = int(Admission.objects.create(patient=patient, current_user=self.test_user).local_barcode[2:12])
+            barcode_allocator.reset()
+            legacy = [ean13('20', serial + offset) for offset in [1, 2, 3]]
+            for barcode in legacy:
+                Admission.objects.create(patient=patient, local_barcode=barcode, current_user=self.test_user)
+
+            barcode = Admission.objects.create(patient=patient, current_user=self.test_user).local_barcode
+        barcode_allocator.reset()
+        self.assertNotIn(barcode, legacy)
+        self.assertGreater(int(barcode[2:12]), serial + 3)
+
+    def test_barcode_reservation_rolled_back(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        barcode_allocator.reset()
+        try:
+            with transaction.atomic():
+                rolled_back = Admission.objects.create(patient=patient, current_user=self.test_user).local_barcode
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        barcodes = {rolled_back}
+        barcodes.update(Admission.objects.create(patient=patient, current_user=self.test_user).local_barcode
+                        for _ in range(3))
+        self.assertEqual(Admission.objects.filter(local_barcode__in=barcodes).count(), 3)
+
+        # No number kept in memory is behind the sequence, that another process could get as well
+        if connection.vendor != 'postgresql':
+            self.assertFalse(barcode_allocator._serials)
+        barcode_allocator.reset()
+
+    def test_barcode_sequence_seed(self):
+        first_free_serial = import_module('patient_tracker.migrations.0005_barcodesequence').first_free_serial
+        self.assertEqual(first_free_serial([], 10), 0)
+        self.assertEqual(first_free_serial([1, 2, 3], 10), 3)
+        # Random legacy barcodes close to the end of the space
+        self.assertEqual(first_free_serial([6_000_000_000, 9_999_999_998], 10), 0)
+        self.assertEqual(first_free_serial([10, 7_000_000_000, 9_999_999_998], 10), 10)
+
+    def test_label_sheet(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admissions = [Admission.objects.create(patient=patient, current_user=self.test_user) for _ in range(20)]
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:admission-labels')
+
+        ids = ','.join(str(admission.pk) for admission in admissions[:3])
+        response = client.get(url, {'ids': ids})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        sheet = Image.open(BytesIO(b''.join(response.streaming_content)))
+        # Three labels on the first row
+        self.assertEqual(sheet.size, (2480, 300 + 2 * 60))
+
+        today = tz.localdate().isoformat()
+        response = client.get(url, {'from': today, 'to': today, 'output': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        self.assertEqual(client.get(url).status_code, 400)
+        self.assertEqual(client.get(url, {'ids': 'nope'}).status_code, 400)
+        self.assertEqual(client.get(url, {'ids': ids, 'output': 'gif'}).status_code, 400)
+
+        with self.settings(LABEL_SHEET_MAX_PNG_LABELS=2):
+            self.assertEqual(client.get(url, {'ids': ids}).status_code, 400)
+            self.assertEqual(client.get(url, {'ids': ids, 'output': 'pdf'}).status_code, 200)
+
+    def test_label_pools_by_number_of_processes(self):
+        self.assertIs(labels.get_pool(2), labels.get_pool(2))
+        self.assertIsNot(labels.get_pool(3), labels.get_pool(2))
+
+    def test_current_state_columns(self):
+        icu = BedType.objects.get(name='Intensive Care Unit')
+        inter = BedType.objects.get(name='Intermediate Care')
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        other = Admission.objects.create(patient=patient, current_user=self.test_user)
+        PersonalData.objects.create(patient=patient, first_name='Ann', last_name='Doe', gender='F',
+                                    date_of_birth=date(1980, 1, 1), current_user=self.test_user)
+
+        HealthSnapshot.objects.create(admission=admission, severity='YELLOW', current_user=self.test_user)
+        HealthSnapshot.objects.create(admission=admission, severity='RED', current_user=self.test_user)
+        first_bed = admission.assign_bed(icu)
+        HealthSnapshot.objects.create(admission=other, severity='RED', current_user=self.test_user)
+        other.assign_bed(inter)
+
+        admission = Admission.objects.get(pk=admission.pk)
+        self.assertEqual((admission.current_severity, admission.current_bed, admission.current_bed_type),
+                         ('RED', first_bed, icu))
+        self.assertEqual(admission.patient_display, 'Ann Doe')
+
+        # A stale instance does not overwrite the columns when saved
+        stale = Admission.objects.get(pk=admission.pk)
+        admission.current_user = self.test_user
+        new_bed = admission.assign_bed(inter)
+        stale.save()
+        admission.refresh_from_db()
+        self.assertEqual((admission.current_bed, admission.current_bed_type), (new_bed, inter))
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:admission-list')
+        response = client.get(url, {'severity': 'RED', 'bed_type_id': str(inter.pk)})
+        self.assertEqual({row['id'] for row in response.json()}, {str(admission.pk), str(other.pk)})
+        self.assertEqual(response.json()[0]['current_severity'], 'RED')
+        self.assertEqual(len(client.get(url, {'severity': 'RED', 'bed_type_id': str(icu.pk)}).json()), 0)
+        for params in [{'bed_type_id': 'abc'}, {'bed_id': '1'}, {'severity': 'PURPLE'}]:
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()), list(params))
+
+        other.discharge()
+        other.refresh_from_db()
+        self.assertTrue(other.is_discharged)
+        self.assertEqual((other.current_bed, other.current_bed_type), (None, None))
+        self.assertEqual([row['id'] for row in client.get(url, {'discharged': 'true'}).json()], [str(other.pk)])
+
+        # Drifted columns are reported and repaired
+        Admission.objects.filter(pk=admission.pk).update(current_severity='GREEN', display_name='')
+        with self.assertRaises(CommandError):
+            call_command('repair_admission_state', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('repair_admission_state', stdout=out)
+        self.assertIn('(2 fixed)', out.getvalue())
+        self.assertEqual(Admission.objects.verify_current_state(), [])
+        admission.refresh_from_db()
+        self.assertEqual((admission.current_severity, admission.display_name), ('RED', 'Ann Doe'))
+
+        patient.personal_data.delete()
+        admission.refresh_from_db()
+        self.assertEqual(admission.display_name, '')
+        self.assertEqual(Admission.objects.verify_current_state(), [])
+
+    def test_latest_vitals(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        first = HealthSnapshot.objects.create(admission=admission, severity='YELLOW', heart_rate=80, temperature=37.5,
+                                              main_complain='Cough', current_user=self.test_user)
+        HealthSnapshot.objects.create(admission=admission, severity='RED', heart_rate=110,
+                                      current_user=self.test_user)
+
+        expected = {'severity': 'RED', 'heart_rate': 110, 'temperature': 37.5, 'main_complain': 'Cough'}
+        admission = Admission.objects.prefetch_related('latest_vitals').get(pk=admission.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(admission.flattened_snapshot, expected)
+        self.assertEqual(LatestVital.objects.get(admission=admission, name='temperature').snapshot, first)
+
+        # A snapshot taken before the latest values, recorded late, leaves them
+        HealthSnapshot.objects.create(admission=admission, severity='GREEN', heart_rate=60, oxygen_saturation=97,
+                                      created=first.created - timedelta(minutes=1), current_user=self.test_user)
+        expected['oxygen_saturation'] = 97
+        self.assertEqual(Admission.objects.get(pk=admission.pk).flattened_snapshot, expected)
+
+        # The projection is regenerated from the snapshots
+        LatestVital.objects.filter(admission=admission, name='heart_rate').update(value=0)
+        LatestVital.objects.filter(admission=admission, name='severity').delete()
+        out = StringIO()
+        call_command('rebuild_latest_vitals', stdout=out)
+        self.assertIn('(5 entries)', out.getvalue())
+        self.assertEqual(Admission.objects.get(pk=admission.pk).flattened_snapshot, expected)
+
+    def test_clean_snapshot_orphans(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        first = HealthSnapshot.objects.create(admission=admission, severity='YELLOW', heart_rate=80,
+                                              current_user=self.test_user)
+        last = HealthSnapshot.objects.create(admission=admission, severity='RED', temperature=39,
+                                             current_user=self.test_user)
+        HealthSnapshotFile.objects.create(patient=last, file='health_snapshot_file/scan.png', notes='Scan',
+                                          current_user=self.test_user)
+        call_command('clean_snapshot_orphans', check=True, stdout=StringIO())
+
+        # As when the partition holding the snapshot is dropped
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {partitions.table_name()} WHERE id = %s', [last.pk.hex])
+        with self.assertRaisesMessage(CommandError, '3 orphaned row(s)'):
+            call_command('clean_snapshot_orphans', check=True, stdout=StringIO())
+
+        out = StringIO()
+        call_command('clean_snapshot_orphans', stdout=out)
+        self.assertIn('(3 rows)', out.getvalue())
+        self.assertFalse(HealthSnapshotFile.all_objects.exists())
+        # The vitals the deleted snapshot recorded last come from the snapshots left
+        self.assertEqual(Admission.objects.get(pk=admission.pk).flattened_snapshot,
+                         {'severity': 'YELLOW', 'heart_rate': 80})
+        self.assertEqual(set(LatestVital.objects.values_list('snapshot', flat=True)), {first.pk})
+        call_command('clean_snapshot_orphans', check=True, stdout=StringIO())
+
+    def test_admin_bed_type_actions(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        self.client.force_login(self.test_user)
+        change_url = reverse('admin:patient_tracker_admission_change', args=(admission.pk,))
+
+        # Bed types created after the admin was built get their action
+        recovery = BedType.objects.create(name='Recovery', severity_match='GREEN', total=1,
+                                          current_user=self.test_user)
+        assign_url = reverse('admin:patient_tracker_admission_assign_bed', args=(admission.pk, recovery.pk))
+        response = self.client.get(change_url)
+        self.assertContains(response, 'Assign to bed: Recovery')
+        self.assertContains(response, f'<form method="post" action="{assign_url}"')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+        # Actions change the admission: a link or an image must not trigger them
+        self.assertEqual(self.client.get(assign_url).status_code, 405)
+        csrf_client = Client(enforce_csrf_checks=True)
+        csrf_client.force_login(self.test_user)
+        self.assertEqual(csrf_client.post(assign_url).status_code, 403)
+        admission.refresh_from_db()
+        self.assertIsNone(admission.current_bed_type)
+
+        self.client.post(assign_url)
+        admission.refresh_from_db()
+        self.assertEqual(admission.current_bed_type, recovery)
+
+        discharge_url = reverse('admin:patient_tracker_admission_discharge_patient', args=(admission.pk,))
+        staff = get_user_model().objects.create_user('staff', password='staff', is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='view_admission'))
+        self.client.force_login(staff)
+        self.assertEqual(self.client.post(discharge_url).status_code, 403)
+
+        self.client.force_login(self.test_user)
+        self.assertEqual(self.client.post(reverse('admin:patient_tracker_admission_discharge_patient',
+                                                  args=(uuid4(),))).status_code, 404)
+        self.client.post(discharge_url)
+        admission.refresh_from_db()
+        self.assertTrue(admission.is_discharged)
+
+    def test_keyset_pagination(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        snapshots = [HealthSnapshot.objects.create(admission=admission, severity='GREEN', current_user=self.test_user)
+                     for _ in range(5)]
+        # Records sharing a timestamp are told apart by their id
+        HealthSnapshot.objects.filter(pk__in=[s.pk for s in snapshots[:3]]).update(created=snapshots[0].created)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url, seen = reverse('v1:health-snapshot-list') + '?limit=2', []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = client.get(url).json()
+            self.assertEqual(len(queries), 1)
+            if 'cursor=' in url:
+                # Bounded on `created` alone, for the index scan to start at the cursor
+                self.assertIn('."created" <= ', queries[0]['sql'])
+            self.assertNotIn('count', page)
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        expected = HealthSnapshot.objects.order_by('-created', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+        self.assertEqual(client.get(reverse('v1:health-snapshot-list'), {'cursor': 'nope'}).status_code, 404)
+
+        # Admissions page by keyset only when asked to
+        url = reverse('v1:admission-list')
+        self.assertEqual(len(client.get(url).json()), 1)
+        self.assertEqual(client.get(url, {'cursor': ''}).json(), {'next': None, 'results': client.get(url).json()})
+
+    def test_bulk_snapshots(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admissions = [Admission.objects.create(patient=patient, current_user=self.test_user) for _ in range(3)]
+        HealthSnapshot.objects.create(admission=admissions[0], severity='GREEN', temperature=37,
+                                      current_user=self.test_user)
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:health-snapshot-bulk')
+
+        def post(count):
+            items = [{'admission_id': str(admissions[i % 3].pk), 'severity': 'YELLOW', 'heart_rate': 60 + i}
+                     for i in range(count)]
+            items[-1]['severity'] = 'RED'
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(url, items)
+            return response, len(queries)
+
+        response, _ = post(6)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 6)
+        # Once the latest vitals exist, the queries do not depend on the number of snapshots
+        self.assertEqual(post(30)[1], post(6)[1])
+
+        admissions[2].refresh_from_db()
+        self.assertEqual(admissions[2].current_severity, 'RED')
+        self.assertEqual(Admission.objects.get(pk=admissions[0].pk).flattened_snapshot,
+                         {'severity': 'YELLOW', 'heart_rate': 63, 'temperature': 37})
+
+        # Invalid items are reported, the others recorded
+        response = client.post(url, [
+            {'admission_id': str(admissions[0].pk), 'severity': 'PURPLE'},
+            {'admission_id': str(uuid4()), 'severity': 'RED'},
+            {'admission_id': str(admissions[1].pk), 'severity': 'GREEN', 'gcs_eye': 2},
+        ])
+        self.assertEqual([item['index'] for item in response.json()['created']], [2])
+        self.assertEqual([(error['index'], list(error['errors'])) for error in response.json()['errors']],
+                         [(0, ['severity']), (1, ['admission_id'])])
+        self.assertEqual(client.post(url, [{'severity': 'RED'}]).status_code, 400)
+        self.assertEqual(client.post(url, {'severity': 'RED'}).status_code, 400)
+
+    def test_early_warning_score(self):
+        nan = float('nan')
+        scores = early_warning.score({
+            'breathing_rate': np.array([16, 26, 10, nan]),
+            'oxygen_saturation': np.array([97, 90, 94, nan]),
+            'blood_pressure_systolic': np.array([120, 85, 105, nan]),
+            'heart_rate': np.array([70, 135, 95, nan]),
+            'temperature': np.array([37.0, 34.5, 38.5, nan]),
+            'gcs_eye': np.array([4, 2, 4, nan]),
+            'gcs_verbal': np.array([5, 3, 5, nan]),
+            'gcs_motor': np.array([6, 5, 6, nan]),
+        })
+        self.assertEqual(scores.tolist(), [0, 18, 5, 0])
+
+        patient = Patient.objects.create(current_user=self.test_user)
+        stable, worsening, discharged = [Admission.objects.create(patient=patient, current_user=self.test_user)
+                                         for _ in range(3)]
+        HealthSnapshot.objects.create(admission=stable, severity='GREEN', heart_rate=70, current_user=self.test_user)
+        HealthSnapshot.objects.create(admission=worsening, severity='YELLOW', heart_rate=95,
+                                      current_user=self.test_user)
+        snapshot = HealthSnapshot.objects.create(admission=worsening, severity='RED', breathing_rate=26,
+                                                 oxygen_saturation=90, current_user=self.test_user)
+        self.assertEqual(snapshot.early_warning_score, 7)
+        HealthSnapshot.objects.create(admission=discharged, severity='RED', heart_rate=140,
+                                      current_user=self.test_user)
+        discharged.discharge()
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        ranked = client.get(reverse('v1:admission-deteriorating')).json()
+        self.assertEqual([(row['id'], row['early_warning_score'], row['risk'], row['change']) for row in ranked],
+                         [(str(worsening.pk), 7, 'high', 6), (str(stable.pk), 0, 'low', None)])
+
+        # Scores drifted from the vitals are recomputed
+        Admission.objects.filter(pk=stable.pk).update(current_early_warning_score=None)
+        out = StringIO()
+        call_command('score_early_warning', stdout=out)
+        self.assertIn('2 admissions scored', out.getvalue())
+        self.assertEqual(Admission.objects.get(pk=stable.pk).current_early_warning_score, 0)
+        self.assertEqual(Admission.objects.verify_current_state(), [])
+
+    def test_vitals_trend(self):
+        x = np.arange(1000, dtype=float)
+        y = np.sin(x / 50)
+        y[500] = 10
+        kept = lttb(x, y, 50)
+        self.assertEqual((len(kept), kept[0], kept[-1]), (50, 0, 999))
+        self.assertIn(500, kept)
+
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        start = tz.now() - timedelta(hours=100)
+        HealthSnapshot.objects.bulk_record([
+            HealthSnapshot(admission=admission, severity='GREEN', heart_rate=60 + i % 40,
+                           temperature=37 if i % 2 else None, created=start + timedelta(hours=i))
+            for i in range(100)
+        ], self.test_user)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:admission-vitals', kwargs={'pk': admission.pk})
+        trend = client.get(url, {'points': 10, 'vitals': 'heart_rate,temperature'}).json()
+        self.assertEqual(list(trend), ['heart_rate', 'temperature'])
+        self.assertEqual([len(trend['heart_rate']['values']), len(trend['temperature']['created'])], [10, 10])
+        self.assertEqual(trend['heart_rate']['values'][0], 60)
+
+        window = {'from': (start + timedelta(hours=90)).isoformat(), 'vitals': 'heart_rate'}
+        self.assertEqual(client.get(url, window).json()['heart_rate']['values'], list(range(70, 80)))
+        self.assertEqual(client.get(url, {'vitals': 'severity'}).status_code, 400)
+        self.assertEqual(client.get(url, {'from': 'yesterday'}).status_code, 400)
+
+    def test_export(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admissions = [Admission.objects.create(patient=patient, current_user=self.test_user) for _ in range(2)]
+        start = tz.now() - timedelta(hours=10)
+        HealthSnapshot.objects.bulk_record([
+            HealthSnapshot(admission=admissions[i % 2], severity='GREEN', heart_rate=60 + i,
+                           created=start + timedelta(hours=i))
+            for i in range(10)
+        ], self.test_user)
+
+        client = APIClient()
+        client.force_authenticate(self.test_user)
+        url = reverse('v1:export', kwargs={'name': 'health-snapshots'})
+        response = client.get(url, {'admission_id': str(admissions[0].pk),
+                                    'from': (start + timedelta(hours=2)).isoformat()})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['heart_rate'] for row in rows], [62, 64, 66, 68])
+        self.assertEqual(rows[0]['admission_id'], str(admissions[0].pk))
+
+        response = client.get(reverse('v1:export', kwargs={'name': 'admissions'}), {'output': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'created', 'modified'])
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(client.get(url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(client.get(url, {'admission_id': 'x'}).status_code, 400)
+        self.assertEqual(client.get(reverse('v1:export', kwargs={'name': 'patients'})).status_code, 404)
+
+        out = StringIO()
+        call_command('export_records', 'health-snapshots', '--output', 'csv', '--chunk-size', '3', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 11)
+
+
+class MonitorIngestionTestCase(TransactionTestCase, TestUser):
+
+    def test_ingest_monitor_readings(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        HealthSnapshot.objects.create(admission=admission, severity='YELLOW', current_user=self.test_user)
+        service = MonitorIngestion(self.test_user, 'secret', batch_size=3, flush_interval=0.05)
+
+        def line(**reading):
+            return json.dumps(reading).encode() + b'\n'
+
+        async def stream():
+            server = await service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'secret\n')
+            for heart_rate in [70, 72, 74]:
+                writer.write(line(local_barcode=admission.local_barcode, heart_rate=heart_rate, severity='GREEN'))
+            writer.write(b'not json\n' + line(local_barcode='0000000000000', heart_rate=70, severity='GREEN'))
+            await writer.drain()
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'secret\n')
+            writer.write(line(local_barcode=admission.local_barcode, oxygen_saturation=91,
+                              recorded_at=measured_at.isoformat()))
+            writer.write(line(local_barcode=admission.local_barcode, oxygen_saturation=92, recorded_at='yesterday'))
+            writer.write(line(local_barcode=admission.local_barcode, oxygen_saturation=93,
+                              recorded_at=(tz.now() + timedelta(hours=1)).isoformat()))
+            await writer.drain()
+
+            while service.stats['received'] < 8:
+                await asyncio.sleep(0.01)
+            await service.stop()
+
+        measured_at = tz.now() - timedelta(hours=2)
+        received_at = tz.now()
+        asyncio.run(stream())
+        self.assertEqual(service.stats['recorded'], 4)
+        self.assertEqual(service.stats['rejected'], 4)
+        self.assertEqual(service.pending, 0)
+
+        snapshots = HealthSnapshot.objects.filter(admission=admission)
+        self.assertEqual(snapshots.count(), 5)
+        self.assertCountEqual(snapshots.filter(heart_rate__isnull=False).values_list('heart_rate', 'severity'),
+                              [(70, 'GREEN'), (72, 'GREEN'), (74, 'GREEN')])
+        # Created when measured, or when received without a measurement time
+        late = snapshots.get(oxygen_saturation=91)
+        self.assertEqual(late.created, measured_at)
+        self.assertIn(late.severity, ['YELLOW', 'GREEN'])
+        self.assertTrue(all(created >= received_at for created in
+                            snapshots.filter(heart_rate__isnull=False).values_list('created', flat=True)))
+        # The reading measured earlier does not replace the latest vitals
+        self.assertEqual(LatestVital.objects.get(admission=admission, name='heart_rate').value, 74)
+        self.assertEqual(LatestVital.objects.get(admission=admission, name='oxygen_saturation').snapshot, late)
+
+    def test_monitor_connections_need_the_token(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        service = MonitorIngestion(self.test_user, 'secret', flush_interval=0.05)
+        reading = json.dumps({'local_barcode': admission.local_barcode, 'heart_rate': 70}).encode() + b'\n'
+
+        async def stream():
+            server = await service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'wrong\n' + reading)
+            closed = await reader.read()
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'\n' + reading)
+            closed += await reader.read()
+            await service.stop()
+            return closed
+
+        self.assertEqual(asyncio.run(stream()), b'')
+        self.assertEqual((service.stats['refused'], service.stats['received']), (2, 0))
+        self.assertFalse(HealthSnapshot.objects.filter(admission=admission).exists())
+
+    def test_monitor_readings_are_retried(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        service = MonitorIngestion(self.test_user, 'secret', batch_size=2, flush_interval=0.05, retry_delay=0.01)
+        record = service.record
+
+        failed_at = []
+
+        def flaky_record(buffers):
+            if not service.stats['failures']:
+                failed_at.append(tz.now())
+                raise OperationalError('The database is unavailable')
+            return record(buffers)
+
+        async def stream():
+            await service.start('127.0.0.1', 0)
+            for heart_rate in [70, 72, 74]:
+                await service.receive(json.dumps({'local_barcode': admission.local_barcode,
+                                                  'heart_rate': heart_rate, 'severity': 'GREEN'}).encode())
+            while service.stats['recorded'] < 3:
+                await asyncio.sleep(0.01)
+            await service.stop()
+
+        with patch.object(service, 'record', flaky_record):
+            asyncio.run(stream())
+        self.assertEqual(service.stats['failures'], 1)
+        self.assertEqual(service.pending, 0)
+        self.assertEqual(sorted(HealthSnapshot.objects.filter(admission=admission)
+                                .values_list('heart_rate', flat=True)), [70, 72, 74])
+        # The readings retried keep the time they were received, before the failed flush
+        self.assertFalse(HealthSnapshot.objects.filter(admission=admission, created__gte=failed_at[0]).exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Row locking requires PostgreSQL')
+@override_settings(JOBS_THREADS=0)
+class ConcurrentAllocationTestCase(TransactionTestCase, TestUser):
+    nb_beds = 50
+    nb_admissions = 300
+    nb_threads = 16
+
+    def test_concurrent_assign_bed(self):
+        icu = BedType.objects.create(name='Intensive Care Unit', severity_match='RED', total=self.nb_beds,
+                                     current_user=self.test_user)
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission_ids = [
+            Admission.objects.create(patient=patient, current_user=self.test_user).pk
+            for _ in range(self.nb_admissions)
+        ]
+
+        def assign(admission_id):
+            try:
+                admission = Admission.objects.get(pk=admission_id)
+                admission.current_user = self.test_user
+                try:
+                    return admission.assign_bed(icu).pk
+                except NoBedAvailable:
+                    return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.nb_threads) as executor:
+            claimed = list(executor.map(assign, admission_ids))
+
+        claimed_beds = [bed_id for bed_id in claimed if bed_id]
+        self.assertEqual(len(claimed_beds), self.nb_beds)
+        self.assertEqual(len(set(claimed_beds)), self.nb_beds)
+
+        open_assignments = BedAssignment.objects.filter(unassigned_at__isnull=True)
+        self.assertEqual(open_assignments.count(), self.nb_beds)
+        self.assertFalse(open_assignments.values('bed').annotate(nb=Count('id')).filter(nb__gt=1).exists())
+        self.assertEqual(icu.number_available, 0)
+        self.assertEqual(icu.number_assigned, self.nb_beds)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Table partitioning requires PostgreSQL')
+class SnapshotPartitionTestCase(TestCase, TestUser):
+
+    def test_create_partitions(self):
+        patient = Patient.objects.create(current_user=self.test_user)
+        admission = Admission.objects.create(patient=patient, current_user=self.test_user)
+        snapshot = HealthSnapshot.objects.create(admission=admission, severity='GREEN', current_user=self.test_user)
+        month = partitions.month_start(tz.now().date(), 12)
+        HealthSnapshot.objects.filter(pk=snapshot.pk).update(
+            created=tz.datetime(month.year, month.month, 2, tzinfo=tz.utc))
+
+        def partition_of(pk):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT tableoid::regclass::text FROM {partitions.table_name()} WHERE id = %s', [pk])
+                return cursor.fetchone()[0]
+
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(partition_of(snapshot.pk), f'{partitions.table_name()}_default')
+
+        call_command('create_snapshot_partitions', months=12, stdout=StringIO())
+        self.assertEqual(partition_of(snapshot.pk), partitions.partition_name(month))
+        self.assertIn(partitions.partition_name(month), partitions.existing_partitions())
+        self.assertEqual(partitions.create_partitions(12), [])
+        self.assertEqual(HealthSnapshot.objects.filter(admission=admission).order_by('-created').first(), snapshot)
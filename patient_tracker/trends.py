@@ -0,0 +1,78 @@
+"""Vitals of an admission over time, downsampled for charts.
+
+The snapshots of the time window are read in order from the (admission, created) index, so the
+cost depends on the window, not on the length of the stay. Each vital is then reduced to at most
+the requested number of points with the Largest-Triangle-Three-Buckets algorithm, which keeps
+the peaks and troughs a chart must show.
+"""
+import numpy as np
+
+TREND_VITALS = [
+    'heart_rate',
+    'breathing_rate',
+    'oxygen_saturation',
+    'temperature',
+    'blood_pressure_systolic',
+    'blood_pressure_diastolic',
+]
+
+
+def lttb(x, y, threshold):
+    """Indexes of the points of (x, y) kept by Largest-Triangle-Three-Buckets, `threshold` at most.
+
+    The first and last points are always kept, and each bucket in between keeps the point forming
+    the largest triangle with the point kept in the previous bucket and the average of the next one.
+    """
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    every = (size - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = int(bucket * every) + 1, int((bucket + 1) * every) + 1
+        next_start, next_end = end, min(int((bucket + 2) * every) + 1, size)
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def vitals_trend(admission, vitals=None, start=None, end=None, points=400):
+    """Columnar time series of the vitals of an admission between `start` (inclusive) and `end`.
+
+    Returns:
+        dict -- for each vital, the `created` timestamps and `values` of at most `points` snapshots
+            that recorded it
+    """
+    from patient_tracker.models import HealthSnapshot
+
+    vitals = vitals or TREND_VITALS
+    snapshots = HealthSnapshot.objects.filter(admission=admission)
+    if start:
+        snapshots = snapshots.filter(created__gte=start)
+    if end:
+        snapshots = snapshots.filter(created__lt=end)
+    rows = list(snapshots.order_by('created').values_list('created', *vitals))
+
+    if not rows:
+        return {name: {'created': [], 'values': []} for name in vitals}
+
+    created = np.array([row[0] for row in rows], dtype=object)
+    seconds = np.array([row[0].timestamp() for row in rows])
+    values = np.array([row[1:] for row in rows], dtype=float)
+    trend = {}
+    for column, name in enumerate(vitals):
+        recorded = ~np.isnan(values[:, column])
+        x, y = seconds[recorded], values[recorded, column]
+        kept = lttb(x, y, points)
+        trend[name] = {
+            'created': created[recorded][kept].tolist(),
+            'values': y[kept].tolist(),
+        }
+    return trend
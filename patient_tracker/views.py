@@ -1,36 +1,158 @@
-from django.db.models import Q, Count
-from django.shortcuts import render
-
-from rest_framework import viewsets, permissions, mixins
+import uuid
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from rest_framework import viewsets, permissions, mixins, serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from common.pagination import KeysetByDefaultPagination, KeysetPagination
+from common.query_params import get_choice_param, get_date_param, get_datetime_param, get_uuid_param
 from patient_tracker.serializers import *
 from patient_tracker.models import *
+from patient_tracker import early_warning
+from patient_tracker.exports import CONTENT_TYPES, EXPORTS, stream_export
+from patient_tracker.trends import TREND_VITALS, vitals_trend
+from patient_tracker.labels import FORMATS, render_sheet
 
 
 patient_tracker_permissions = [permissions.DjangoModelPermissions]
 
 
 class AdmissionViewSet(ModelViewSet):
-    queryset = Admission.objects.all()
+    queryset = Admission.objects.with_current_state()
     serializer_class = AdmissionSerializer
+    pagination_class = KeysetPagination
 
     permission_classes = patient_tracker_permissions
 
     def get_queryset(self):
         queryset = self.queryset
-        patient_id = self.request.query_params.get('patient_id', None)
+        params = self.request.query_params
+        patient_id = params.get('patient_id', None)
 
         if patient_id is not None:
             queryset = queryset.filter(patient=patient_id)
 
+        # Current state filters, answered from the admission columns
+        severity = get_choice_param(self.request, 'severity', HealthSnapshot.SeverityChoices)
+        if severity:
+            queryset = queryset.filter(current_severity=severity)
+        bed_type_id = get_uuid_param(self.request, 'bed_type_id')
+        if bed_type_id:
+            queryset = queryset.filter(current_bed_type=bed_type_id)
+        bed_id = get_uuid_param(self.request, 'bed_id')
+        if bed_id:
+            queryset = queryset.filter(current_bed=bed_id)
+        if params.get('discharged') in ('true', 'false'):
+            queryset = queryset.filter(discharged_at__isnull=params['discharged'] == 'false')
+
         return queryset
 
+    @action(detail=True, methods=['get'])
+    def barcode(self, request, pk=None):
+        """The barcode image of the admission, as PNG"""
+        admission = self.get_object()
+        etag = f'"{admission.barcode_image_key.rsplit("/", 1)[-1]}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return HttpResponseNotModified()
+
+        response = HttpResponse(admission.get_barcode_image(), content_type='image/png')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def deteriorating(self, request):
+        """Active admissions ranked by early warning score, the highest first, at most `limit` (default 50).
+
+        `change` is the difference with the previous score of the admission, null without one.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Expected a number'})
+
+        admissions = Admission.objects.deteriorating().values(
+            'id', 'local_barcode', 'display_name', 'current_severity', 'current_bed',
+            'current_early_warning_score', 'previous_early_warning_score')[:limit]
+        return Response([{
+            'id': admission['id'],
+            'local_barcode': admission['local_barcode'],
+            'patient_display': admission['display_name'] or '-',
+            'current_severity': admission['current_severity'],
+            'current_bed': admission['current_bed'],
+            'early_warning_score': admission['current_early_warning_score'],
+            'risk': early_warning.risk(admission['current_early_warning_score']),
+            'change': None if admission['previous_early_warning_score'] is None
+            else admission['current_early_warning_score'] - admission['previous_early_warning_score'],
+        } for admission in admissions])
+
+    @action(detail=True, methods=['get'])
+    def vitals(self, request, pk=None):
+        """Vitals of the admission recorded between `from` and `to` (ISO 8601, `to` excluded), as one
+        series of `created` and `values` arrays per vital, downsampled to `points` each (default 400).
+
+        `vitals` restricts the series to a comma separated list of vitals.
+        """
+        admission = self.get_object()
+        names = [name for name in request.query_params.get('vitals', '').split(',') if name] or TREND_VITALS
+        unknown = set(names) - set(TREND_VITALS)
+        if unknown:
+            raise serializers.ValidationError({'vitals': f'Unknown vitals: {", ".join(sorted(unknown))}'})
+        try:
+            points = min(max(int(request.query_params.get('points', 400)), 3), settings.VITALS_TREND_MAX_POINTS)
+        except ValueError:
+            raise serializers.ValidationError({'points': 'Expected a number'})
+
+        return Response(vitals_trend(admission, names, get_datetime_param(request, 'from'),
+                                     get_datetime_param(request, 'to'), points))
+
+    @action(detail=False, methods=['get'])
+    def labels(self, request):
+        """Sheet of labels to print, for the admissions listed in `ids` (comma separated) or admitted
+        between `from` and `to` (dates, inclusive), as `output` png (default) or pdf. A png sheet is a
+        single image, and holds fewer labels than a pdf one.
+        """
+        output = request.query_params.get('output', 'png')
+        if output not in FORMATS:
+            raise serializers.ValidationError({'output': f'Expected one of {", ".join(FORMATS)}'})
+
+        queryset = self.get_queryset()
+        ids = [value for value in request.query_params.get('ids', '').split(',') if value]
+        start, end = get_date_param(request, 'from'), get_date_param(request, 'to')
+        if not ids and not (start or end):
+            raise serializers.ValidationError('Provide the admission ids, or a date range')
+        if ids:
+            try:
+                queryset = queryset.filter(pk__in=[uuid.UUID(value) for value in ids])
+            except ValueError:
+                raise serializers.ValidationError({'ids': 'Expected comma separated admission ids'})
+        if start:
+            queryset = queryset.filter(admitted_at__gte=start_of_day(start))
+        if end:
+            queryset = queryset.filter(admitted_at__lt=start_of_day(end + timedelta(days=1)))
+
+        queryset = queryset.filter(local_barcode__isnull=False).select_related('patient__personal_data')
+        max_labels = settings.LABEL_SHEET_MAX_PNG_LABELS if output == 'png' else settings.LABEL_SHEET_MAX_LABELS
+        admissions = list(queryset.order_by('admitted_at', 'created')[:max_labels + 1])
+        if len(admissions) > max_labels:
+            raise serializers.ValidationError(f'At most {max_labels} labels per {output} sheet')
+
+        sheet = render_sheet([(admission.local_barcode, admission.patient_display) for admission in admissions],
+                             output, processes=settings.LABEL_RENDER_PROCESSES)
+        return FileResponse(BytesIO(sheet), content_type=FORMATS[output], filename=f'labels.{output}')
+
 
 class HealthSnapshotViewSet(ModelViewSet):
     queryset = HealthSnapshot.objects.all()
     serializer_class = HealthSnapshotSerializer
+    pagination_class = KeysetByDefaultPagination
 
     permission_classes = patient_tracker_permissions
 
@@ -43,6 +165,26 @@ class HealthSnapshotViewSet(ModelViewSet):
 
         return queryset
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Record a list of snapshots, of any admissions, at once.
+
+        Valid snapshots are recorded even if others are not: the response lists the `id` of each
+        recorded snapshot and the `errors` of the others, with their `index` in the list.
+        """
+        if not isinstance(request.data, list):
+            raise serializers.ValidationError('Expected a list of health snapshots')
+        if len(request.data) > settings.HEALTH_SNAPSHOT_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f'Expected at most {settings.HEALTH_SNAPSHOT_BULK_MAX_ITEMS} health snapshots')
+
+        snapshots, indexes, errors = validate_snapshots(request.data)
+        HealthSnapshot.objects.bulk_record(snapshots, request.user)
+        return Response({
+            'created': [{'index': index, 'id': snapshot.pk} for index, snapshot in zip(indexes, snapshots)],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED if snapshots else status.HTTP_400_BAD_REQUEST)
+
 
 class DischargeViewSet(ModelViewSet):
 
@@ -92,3 +234,31 @@ class RelatedConditionsViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin,
     permission_classes = patient_tracker_permissions
 
 
+class ExportView(APIView):
+    """Stream every record of an export: `health-snapshots`, `admissions`, `discharges` or `bed-assignments`,
+    as `output` ndjson (default) or csv.
+
+    `from` and `to` (ISO 8601, `to` excluded) restrict the records to a range of creation times, and
+    `admission_id` to a comma separated list of admissions.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, name):
+        if name not in EXPORTS:
+            raise NotFound(f'Unknown export {name}')
+        output = request.query_params.get('output', 'ndjson')
+        if output not in CONTENT_TYPES:
+            raise serializers.ValidationError({'output': f'Expected one of {", ".join(CONTENT_TYPES)}'})
+
+        admission_ids = None
+        if request.query_params.get('admission_id'):
+            try:
+                admission_ids = [uuid.UUID(value) for value in request.query_params['admission_id'].split(',')]
+            except ValueError:
+                raise serializers.ValidationError({'admission_id': 'Expected comma separated admission ids'})
+
+        lines = stream_export(name, output, start=get_datetime_param(request, 'from'),
+                              end=get_datetime_param(request, 'to'), admission_ids=admission_ids)
+        response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="{name}.{output}"'
+        return response
@@ -75,6 +75,7 @@ INSTALLED_APPS = [
     'dashboard',
     'dummy',
     'equipment',
+    'jobs',
     'patient',
     'patient_tracker',
     'simple_history',
@@ -129,6 +130,55 @@ DATABASES = {
     'default': env.db('DATABASE_URL', default=DEFAULT_DB_STRING)
 }
 
+# Cache
+# Local memory by default, set CACHE_URL (e.g. redis://...) to share the cache between workers. Writes made by
+# other processes (gunicorn workers, `run_jobs`, `ingest_monitor_vitals`) cannot invalidate a local memory
+# cache, so its entries are only kept for a few seconds to a minute by default.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+LOCAL_CACHE = CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'
+
+DASHBOARD_CACHE_TIMEOUT = env.int('DASHBOARD_CACHE_TIMEOUT', default=10 if LOCAL_CACHE else 60 * 60)
+DASHBOARD_CACHE_LOCK_TIMEOUT = env.int('DASHBOARD_CACHE_LOCK_TIMEOUT', default=10)
+
+# Background jobs: whether to run them in the thread enqueueing them once its transaction commits, by default
+# on SQLite, which takes a single writer at a time; otherwise threads running them in each web process
+# (0 to leave them to `run_jobs` workers), seconds before a running job is considered abandoned, attempts
+# and first retry delay in seconds
+
+SQLITE = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+JOBS_INLINE = env.bool('JOBS_INLINE', default=SQLITE)
+JOBS_THREADS = env.int('JOBS_THREADS', default=0 if SQLITE else 2)
+JOBS_VISIBILITY_TIMEOUT = env.int('JOBS_VISIBILITY_TIMEOUT', default=5 * 60)
+JOBS_MAX_ATTEMPTS = env.int('JOBS_MAX_ATTEMPTS', default=5)
+JOBS_RETRY_DELAY = env.int('JOBS_RETRY_DELAY', default=10)
+
+BARCODE_IMAGE_CACHE_TIMEOUT = env.int('BARCODE_IMAGE_CACHE_TIMEOUT', default=24 * 60 * 60)
+BED_TYPE_CATALOG_CACHE_TIMEOUT = env.int('BED_TYPE_CATALOG_CACHE_TIMEOUT', default=60 if LOCAL_CACHE else 24 * 60 * 60)
+
+# Health snapshots recorded by a single bulk request at most
+HEALTH_SNAPSHOT_BULK_MAX_ITEMS = env.int('HEALTH_SNAPSHOT_BULK_MAX_ITEMS', default=10000)
+# Points of each vital in a trend at most
+VITALS_TREND_MAX_POINTS = env.int('VITALS_TREND_MAX_POINTS', default=2000)
+# Rows fetched at once by the database cursor of an export
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
+
+# Label sheets: processes rendering the labels (number of CPUs if 0), labels per sheet at most, and per PNG
+# sheet, a single image that takes about 8 MB per page of 33 labels while it is composed
+LABEL_RENDER_PROCESSES = env.int('LABEL_RENDER_PROCESSES', default=0)
+LABEL_SHEET_MAX_LABELS = env.int('LABEL_SHEET_MAX_LABELS', default=1000)
+LABEL_SHEET_MAX_PNG_LABELS = env.int('LABEL_SHEET_MAX_PNG_LABELS', default=100)
+
+# Admission barcodes: EAN13 numbers starting with the site prefix, unique to each hospital.
+# The 20-29 prefixes are reserved by GS1 for restricted circulation.
+BARCODE_SITE_PREFIX = env.str('BARCODE_SITE_PREFIX', default='20')
+BARCODE_BLOCK_SIZE = env.int('BARCODE_BLOCK_SIZE', default=100)
+
+# Shared secret the bedside monitors send to `ingest_monitor_vitals`
+MONITOR_INGESTION_TOKEN = env.str('MONITOR_INGESTION_TOKEN', default='')
+
 # Error tracking
 
 SENTRY_SKIP = env.bool('SENTRY_SKIP', default=DEV)
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0003_auto_20200519_1946'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workflow',
+            index=models.Index(fields=['created', 'id'], name='workflow_created_id'),
+        ),
+    ]
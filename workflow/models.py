@@ -21,6 +21,11 @@ class Workflow(ImmutableBaseModel):
     rel_id = models.UUIDField(null=True)
     related_item = GenericForeignKey('rel_type', 'rel_id')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created', 'id'], name='workflow_created_id'),
+        ]
+
     @property
     def related_data(self):
         return self.related_item
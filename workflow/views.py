@@ -1,6 +1,8 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, mixins
 
+from common.pagination import KeysetByDefaultPagination
+
 from workflow.models import Workflow
 from workflow.serializers import WorkflowSerializer
 
@@ -10,6 +12,7 @@ workflow_permissions = [permissions.DjangoModelPermissions]
 class WorkflowViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
     queryset = Workflow.objects.all()
     serializer_class = WorkflowSerializer
+    pagination_class = KeysetByDefaultPagination
 
     permission_classes = workflow_permissions
 